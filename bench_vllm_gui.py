@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for VLLM GUI application.
+
+Usage:
+    python bench_vllm_gui.py            # run all benchmarks
+    python bench_vllm_gui.py logger     # run a single benchmark
+
+Benchmarks:
+- logger: per-line open/append/emit vs. batched background Logger
+- tail: /api/logs tail (readlines vs. reverse seek) on synthetic 16 MB .. 1 GB logs
+- classify: per-line level classification of the repository logs.txt (substring scans vs. LineClassifier)
+- reader: child stdout reading, text-mode line iteration vs. raw chunks + OutputSplitter
+- analyze: offline `analyze` on a 512 MB log, single process vs. byte-range workers
+- conda: conda path lookup, full probe vs. cached CondaDiscovery
+- wsl: WSL-style probes, one process per check vs. one persistent WSLShell batch (plain bash stands in for wsl)
+- search: scheme search over thousands of schemes, linear scan vs. SchemeRepository index
+- launch: /api/run (VLLMSupervisor.run) to the first vllm output line, the page posting a bash -c command vs.
+  posting its config (exec with the cached activation); a fake conda whose activate spawns one python process,
+  as `conda shell.posix activate` does
+- fanout: ten dashboards (one live, nine backgrounded and not reading) during a noisy model load,
+  per-client unbounded broadcast queues vs. EventHub; memory held for the clients as the load goes on
+- serving: the real server under --async-mode threading vs. eventlet, with a chatty fake vllm running,
+  many websocket dashboards and concurrent HTTP pollers; request latency, events delivered, server OS threads
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime
+
+# Add the current directory to Python path to import vllm_server
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import vllm_server
+from vllm_server import (ASYNC_MODES, OUTPUT_READ_CHUNK, CondaActivationCache, EventHub, LineClassifier, Logger,
+                         OutputSplitter, SchemeRepository, StartupHistory, VLLMController, VLLMSupervisor, WSLShell,
+                         _tail_log, analyze_logs, build_launch_spec, render_launch_command)
+
+SAMPLE_LINE = ('\x1b[0;36m(APIServer pid=53343)\x1b[0;0m INFO:     127.0.0.1:56244 - '
+               '"POST /v1/chat/completions HTTP/1.1" 200 OK')
+
+
+def _report(name: str, count: int, elapsed: float) -> None:
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(f"  {name:<32} {count:>9} in {elapsed:8.3f}s  {rate:>14,.0f}/s")
+
+
+class _LegacyLogger:
+    """Baseline: the original open/append/close + emit per line."""
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        self._lock = threading.Lock()
+
+    def log(self, level: str, message: str) -> None:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        formatted = f"[{timestamp}] [{level.upper()}] {message}"
+        with self._lock:
+            with open(self.file_path, "a", encoding="utf-8") as f:
+                f.write(formatted + "\n")
+        vllm_server.socketio.emit("log", {"level": level, "message": formatted, "timestamp": timestamp})
+
+
+def bench_logger(lines: int = 50000) -> None:
+    print(f"logger: {lines} access-log lines")
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = _LegacyLogger(os.path.join(tmp, "legacy.txt"))
+        start = time.perf_counter()
+        for _ in range(lines):
+            legacy.log("info", SAMPLE_LINE)
+        _report("per-line open/append (before)", lines, time.perf_counter() - start)
+
+        batched = Logger(os.path.join(tmp, "batched.txt"))
+        start = time.perf_counter()
+        for _ in range(lines):
+            batched.log("info", SAMPLE_LINE)
+        batched.flush(timeout=60)
+        _report("batched Logger (after)", lines, time.perf_counter() - start)
+
+
+def _write_synthetic_log(path: str, size_bytes: int) -> None:
+    line = f"[2026-01-17 17:02:15] [INFO] {SAMPLE_LINE}\n"
+    block = (line * (1024 * 1024 // len(line))).encode("utf-8")
+    with open(path, "wb") as f:
+        written = 0
+        while written < size_bytes:
+            f.write(block)
+            written += len(block)
+
+
+def bench_tail(sizes_mb=(16, 256, 1024), lines: int = 500) -> None:
+    print(f"tail: last {lines} lines of a synthetic log")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "logs.txt")
+        for size_mb in sizes_mb:
+            _write_synthetic_log(path, size_mb * 1024 * 1024)
+
+            start = time.perf_counter()
+            with open(path, "r", encoding="utf-8") as f:
+                all_lines = f.readlines()
+                last_lines = all_lines[-lines:]
+            elapsed_readlines = time.perf_counter() - start
+            del all_lines, last_lines
+
+            runs = 100
+            start = time.perf_counter()
+            for _ in range(runs):
+                _tail_log(path, lines)
+            elapsed_tail = (time.perf_counter() - start) / runs
+
+            print(f"  {size_mb:>5} MB  readlines (before) {elapsed_readlines * 1000:9.1f} ms"
+                  f"   reverse seek (after) {elapsed_tail * 1000:7.3f} ms")
+
+
+def _repo_log_lines() -> list:
+    repo_log = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs.txt")
+    with open(repo_log, "r", encoding="utf-8") as f:
+        # 去掉GUI自己加的 "[时间] [级别] " 前缀，还原为子进程原始输出
+        return [line[line.find("] ", 22) + 2:] if line.startswith("[") else line for line in f]
+
+
+def bench_classify(repeat: int = 20) -> None:
+    lines = _repo_log_lines() * repeat
+    print(f"classify: {len(lines)} raw output lines")
+
+    start = time.perf_counter()
+    for line in lines:
+        line = line.encode('utf-8').decode('utf-8', errors='replace')
+        if "WARNING" in line:
+            level = "warning"
+        elif "ERROR" in line or "Traceback" in line:
+            level = "error"
+        else:
+            level = "info"
+        line.strip()
+    _report("substring scans (before)", len(lines), time.perf_counter() - start)
+
+    classifier = LineClassifier()
+    start = time.perf_counter()
+    for line in lines:
+        classifier.feed(line)
+    classifier.flush()
+    _report("LineClassifier (after)", len(lines), time.perf_counter() - start)
+
+
+def bench_reader(size_mb: int = 64) -> None:
+    print(f"reader: {size_mb} MB of child output, 90% progress-bar redraws")
+    frames = "".join(f"\rLoading safetensors checkpoint shards: {i % 100:3d}% |{'#' * (i % 50):<50}|"
+                     for i in range(900))
+    block = (frames + "\n" + SAMPLE_LINE + "\n" * 1).encode("utf-8")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "output.bin")
+        with open(path, "wb") as f:
+            for _ in range(size_mb * 1024 * 1024 // len(block)):
+                f.write(block)
+        cat = [sys.executable, "-c", f"import shutil,sys; shutil.copyfileobj(open({path!r},'rb'), sys.stdout.buffer)"]
+
+        start = time.perf_counter()
+        proc = subprocess.Popen(cat, stdout=subprocess.PIPE, text=True, encoding="utf-8", errors="replace")
+        count = 0
+        for line in proc.stdout:
+            line.strip()
+            count += 1
+        proc.wait()
+        _report("text-mode lines (before)", count, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        proc = subprocess.Popen(cat, stdout=subprocess.PIPE)
+        splitter = OutputSplitter()
+        count = 0
+        while True:
+            data = proc.stdout.read1(OUTPUT_READ_CHUNK)
+            if not data:
+                break
+            count += len(splitter.feed(data))
+        count += len(splitter.flush())
+        proc.wait()
+        _report("raw chunks + splitter (after)", count, time.perf_counter() - start)
+
+
+def bench_analyze(size_mb: int = 512) -> None:
+    workers = os.cpu_count() or 1
+    print(f"analyze: {size_mb} MB log built from the repository logs.txt")
+    repo_log = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs.txt")
+    with open(repo_log, "rb") as f:
+        sample = f.read()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "logs.txt")
+        with open(path, "wb") as f:
+            for _ in range(max(1, size_mb * 1024 * 1024 // len(sample))):
+                f.write(sample)
+        for n in sorted({1, workers}):
+            start = time.perf_counter()
+            report = analyze_logs([path], workers=n, write_index=False)
+            _report(f"analyze workers={n}", report["lines"], time.perf_counter() - start)
+
+
+def bench_conda(lookups: int = 10000) -> None:
+    print("conda: conda path lookups")
+    start = time.perf_counter()
+    vllm_server._probe_conda_path()
+    _report("full probe (per request before)", 1, time.perf_counter() - start)
+
+    vllm_server.conda_discovery.get()
+    start = time.perf_counter()
+    for _ in range(lookups):
+        vllm_server._find_conda_path()
+    _report("cached discovery (after)", lookups, time.perf_counter() - start)
+
+
+def bench_wsl(probes: int = 16, rounds: int = 20) -> None:
+    print(f"wsl: {probes} test -f / echo probes per round, {rounds} rounds")
+    commands = [f"test -f /tmp/probe-{i}/bin/activate" if i % 2 else "echo $HOME" for i in range(probes)]
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for command in commands:
+            subprocess.run(["bash", "-c", command], capture_output=True, timeout=5)
+    _report("process per probe (before)", probes * rounds, time.perf_counter() - start)
+
+    shell = WSLShell(["bash", "--noprofile", "--norc"])
+    start = time.perf_counter()
+    for _ in range(rounds):
+        shell.run_batch(commands)
+    _report("persistent session batch (after)", probes * rounds, time.perf_counter() - start)
+    shell.close()
+
+
+def bench_search(copies: int = 100, queries: int = 1000) -> None:
+    repo_schemes = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vllm_schemes.json")
+    with open(repo_schemes, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    schemes = [dict(s, id=i * 1000 + n, name=f"{s['name']}-{i}") for i in range(copies) for n, s in enumerate(base)]
+    print(f"search: 'minimax fp8' with tp=2 over {len(schemes)} schemes")
+
+    start = time.perf_counter()
+    for _ in range(queries // 100):
+        for s in schemes:
+            text = json.dumps(s).lower()
+            "minimax" in text and "fp8" in text and str(s["config"].get("tensorParallel")) == "2"
+    _report("linear scan (before)", queries // 100, time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "schemes.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(schemes, f)
+        repo = SchemeRepository(path)
+        start = time.perf_counter()
+        repo.list()
+        _report("index build", len(schemes), time.perf_counter() - start)
+        start = time.perf_counter()
+        for _ in range(queries):
+            repo.search("minimax fp8", {"tp": "2"}, limit=20)
+        _report("inverted index (after)", queries, time.perf_counter() - start)
+
+
+class _FirstLineLogger(Logger):
+    """Logger that notes when the first fake vllm line arrives."""
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self.first = threading.Event()
+
+    def log(self, level: str, message: str) -> None:
+        if "vLLM API server version" in message:
+            self.first.set()
+        super().log(level, message)
+
+
+def _run_latency(tmp: str, command: str, config: dict) -> float:
+    """VLLMSupervisor.run (what /api/run calls) to the first vllm output line."""
+    log = _FirstLineLogger(os.path.join(tmp, "logs.txt"))
+    hub = EventHub(send=lambda sid, items, ack: None)
+    supervisor = VLLMSupervisor(hub, VLLMController(hub, log=log, manage_nvitop=False))
+    start = time.perf_counter()
+    supervisor.run(None, command, "linux", config)
+    log.first.wait(30)
+    elapsed = time.perf_counter() - start
+    supervisor.stop_all()
+    return elapsed
+
+
+def bench_launch(runs: int = 10) -> None:
+    print(f"launch: /api/run to the first fake vllm output line, best of {runs}")
+    fake = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_vllm_serve.py")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, "etc", "profile.d"))
+        os.makedirs(os.path.join(tmp, "envs", "vllm", "conda-meta"))
+        os.makedirs(os.path.join(tmp, "envs", "vllm", "bin"))
+        with open(os.path.join(tmp, "etc", "profile.d", "conda.sh"), "w") as f:
+            f.write(f'conda() {{ eval "$("{sys.executable}" -c "print(\'export CONDA_PREFIX={tmp}/envs/$2\')")"; '
+                    f'export PATH="$CONDA_PREFIX/bin:$PATH"; }}\n')
+        vllm = os.path.join(tmp, "envs", "vllm", "bin", "vllm")
+        with open(vllm, "w") as f:
+            f.write(f'#!/bin/sh\nshift\nexec "{sys.executable}" "{fake}" "$@"\n')
+        os.chmod(vllm, 0o755)
+        vllm_server.startup_history = StartupHistory(os.path.join(tmp, "startup_history.json"))
+        vllm_server.conda_activation = CondaActivationCache()
+        # 页面"运行"按钮发送的配置（含一条快捷 export）
+        config = {"envType": "linux", "modelPath": "/models/m", "condaPath": tmp, "condaEnv": "vllm",
+                  "cudaDevices": "", "port": 8000, "exportCommands": ["export NCCL_P2P_DISABLE=1"]}
+
+        command = render_launch_command(build_launch_spec(config))
+        best = min(_run_latency(tmp, command, config) for _ in range(runs))
+        print(f"  {'page posts bash -c command (before)':<40} {best * 1000:8.1f} ms")
+
+        first = _run_latency(tmp, "", config)
+        print(f"  {'page posts config, first run (capture)':<40} {first * 1000:8.1f} ms")
+        best = min(_run_latency(tmp, "", config) for _ in range(runs))
+        print(f"  {'page posts config, cached (after)':<40} {best * 1000:8.1f} ms")
+
+
+def _noisy_load(lines: int, batch: int = 100):
+    """A model load: log batches (as Logger pushes them), engine stats and status updates."""
+    for start in range(0, lines, batch):
+        yield "log_batch", {"logs": [{"level": "info", "message": f"{SAMPLE_LINE} {i}",
+                                      "timestamp": "2025-01-01 00:00:00"} for i in range(start, start + batch)],
+                            "offset": start * len(SAMPLE_LINE)}
+        yield "metrics", {"engine": "0", "timestamp": float(start), "prompt_throughput": 1.0}
+        yield "status", {"running": True}
+
+
+def bench_fanout(clients: int = 10, lines: int = 200000) -> None:
+    print(f"fanout: {clients} dashboards, 1 reading and {clients - 1} backgrounded, {lines} log lines")
+    checkpoints = {lines // 4 * k for k in (1, 2, 3, 4)}
+
+    def run(name, publish, flush=None):
+        tracemalloc.start()
+        start = time.perf_counter()
+        held = []
+        for n, (event, payload) in enumerate(_noisy_load(lines)):
+            publish(event, payload)
+            if flush and n % 30 == 0:
+                flush()
+            if event == "status" and (n // 3 + 1) * 100 in checkpoints:
+                held.append(tracemalloc.get_traced_memory()[0] / 1e6)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        growth = "  ".join(f"{mb:7.1f}" for mb in held)
+        print(f"  {name:<30} held MB at 25/50/75/100%: {growth}   peak {peak:7.1f} MB  {elapsed:6.2f}s")
+
+    # 之前：每个事件广播给所有页面，进入各自无上限的发送队列，不读取的页面一直积累
+    queues = [[] for _ in range(clients)]
+
+    def broadcast(event, payload):
+        queues[0].clear()  # 正在读取的页面及时取走
+        for q in queues:
+            q.append(json.dumps([event, payload]))  # python-socketio 为每个页面单独编码
+    run("broadcast queues (before)", broadcast)
+    queues = None
+
+    # 之后：每个页面一个有界的 ClientChannel，未确认的批次最多 SOCKET_MAX_IN_FLIGHT 个
+    in_flight = {}
+
+    def send(sid, items, ack):
+        packet = json.dumps(items)
+        if sid == "client-0":
+            ack()
+        else:
+            in_flight.setdefault(sid, []).append(packet)
+    hub = EventHub(send=send)
+    for i in range(clients):
+        hub.connect(f"client-{i}")
+    run("EventHub (after)", hub.emit, hub.flush)
+    pending = hub.stats()["client-1"]
+    print(f"  backgrounded client: {pending['pending']} pending events, {pending['logLines']} log lines, "
+          f"{len(in_flight['client-1'])} unacked batches, {pending['dropped']} events dropped")
+
+
+def _free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _http(url: str, data: dict = None, timeout: float = 10.0) -> dict:
+    body = json.dumps(data).encode() if data is not None else None
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def _dashboard(port: int, stop: threading.Event, received: list) -> None:
+    """最小的 Socket.IO websocket 客户端：应答 ping 和 batch ack，统计收到的事件数。"""
+    from simple_websocket import Client
+    ws = Client.connect(f"ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket")
+    try:
+        ws.receive(timeout=10)  # engine.io open
+        ws.send("40")
+        while not stop.is_set():
+            packet = ws.receive(timeout=0.5)
+            if packet is None:
+                continue
+            if packet == "2":
+                ws.send("3")
+            elif packet.startswith("42"):
+                body = packet[2:]
+                ack_id = body[:len(body) - len(body.lstrip("0123456789"))]
+                event = json.loads(body[len(ack_id):])
+                received.append(len(event[1]) if event[0] == "batch" else 1)
+                if ack_id:
+                    ws.send(f"43{ack_id}[]")
+    finally:
+        ws.close()
+
+
+def _poller(port: int, stop: threading.Event, latencies: list, errors: list) -> None:
+    paths = ("/api/gpu-status", "/api/logs?lines=200", "/api/instances", "/api/metrics/access")
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            _http(f"http://127.0.0.1:{port}{paths[i % len(paths)]}")
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors.append(1)
+        i += 1
+
+
+def _os_threads(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("Threads:"))
+    except (OSError, StopIteration):
+        return -1
+
+
+def bench_serving(dashboards: int = 50, pollers: int = 16, seconds: float = 10.0, chatty: int = 50) -> None:
+    print(f"serving: {dashboards} websocket dashboards + {pollers} HTTP pollers for {seconds:.0f}s, "
+          f"fake vllm printing {chatty} access lines per 0.1s")
+    here = os.path.dirname(os.path.abspath(__file__))
+    fake = os.path.join(here, "fake_vllm_serve.py")
+    for mode in ASYNC_MODES:
+        port, vllm_port = _free_port(), _free_port()
+        with tempfile.TemporaryDirectory() as tmp:
+            server = subprocess.Popen([sys.executable, "-W", "ignore", os.path.join(here, "vllm_server.py"),
+                                       "--port", str(port), "--async-mode", mode],
+                                      cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                deadline = time.monotonic() + 30
+                while True:
+                    try:
+                        _http(f"http://127.0.0.1:{port}/api/instances", timeout=1)
+                        break
+                    except OSError:
+                        if time.monotonic() > deadline or server.poll() is not None:
+                            raise RuntimeError(f"server did not start in {mode} mode")
+                        time.sleep(0.2)
+                _http(f"http://127.0.0.1:{port}/api/run", {
+                    "command": f"{sys.executable} {fake} m --port {vllm_port} --serve-health --chatty {chatty}",
+                    "envType": "linux", "config": {"port": str(vllm_port)}})
+
+                stop = threading.Event()
+                received, latencies, errors = [], [], []
+                workers = [threading.Thread(target=_dashboard, args=(port, stop, received), daemon=True)
+                           for _ in range(dashboards)]
+                workers += [threading.Thread(target=_poller, args=(port, stop, latencies, errors), daemon=True)
+                            for _ in range(pollers)]
+                for worker in workers:
+                    worker.start()
+                time.sleep(seconds)
+                threads = _os_threads(server.pid)
+                stop.set()
+                for worker in workers:
+                    worker.join(timeout=5)
+                _http(f"http://127.0.0.1:{port}/api/stop", {})
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else float("nan")
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float("nan")
+        print(f"  {mode:<10} {len(latencies) / seconds:8.0f} req/s  p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  "
+              f"{sum(received) / seconds:9.0f} events/s  {len(errors)} errors  {threads} OS threads")
+
+
+BENCHMARKS = {
+    "logger": bench_logger,
+    "tail": bench_tail,
+    "classify": bench_classify,
+    "reader": bench_reader,
+    "analyze": bench_analyze,
+    "conda": bench_conda,
+    "wsl": bench_wsl,
+    "search": bench_search,
+    "launch": bench_launch,
+    "fanout": bench_fanout,
+    "serving": bench_serving,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VLLM GUI benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    args = parser.parse_args()
+    unknown = [n for n in args.names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Stand-in for `vllm serve` used by tests and benchmarks.
+
+Prints vLLM-style startup, engine stats and access-log lines without needing a GPU.
+The startup phase markers are spread over --startup seconds; with --serve-health the
+port answers GET /health with 200 once "Application startup complete" is printed
+(and 503 after --hang-after seconds, while the process keeps running).
+
+Usage:
+    python fake_vllm_serve.py MODEL [--port 8000] [--interval 0.1] [--chatty N] [--exit-after S]
+                              [--exit-code N] [--startup S] [--serve-health] [--hang-after S]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+STARTUP_LINES = (
+    "(EngineCore_DP0 pid={pid}) INFO {stamp} [core.py:97] Initializing a V1 LLM engine (v0.0.0-fake) with config: "
+    "model='{model}'",
+    "(Worker_TP0 pid={pid}) INFO {stamp} [gpu_model_runner.py:3789] Starting to load model {model}...",
+    "(Worker_TP0 pid={pid}) INFO {stamp} [gpu_model_runner.py:3886] Model loading took 1.00 GiB memory and 0.1 seconds",
+    "(Worker_TP0 pid={pid}) INFO {stamp} [monitor.py:34] torch.compile takes 0.1 s in total",
+    "(EngineCore_DP0 pid={pid}) INFO {stamp} [kv_cache_utils.py:1305] GPU KV cache size: 100,000 tokens",
+    "(Worker_TP0 pid={pid}) INFO {stamp} [gpu_model_runner.py:4837] Graph capturing finished in 1 secs, took 0.1 GiB",
+    "(APIServer pid={pid}) INFO {stamp} [api_server.py:1352] Starting vLLM API server 0 on http://0.0.0.0:{port}",
+    "(APIServer pid={pid}) INFO:     Started server process [{pid}]",
+    "(APIServer pid={pid}) INFO:     Application startup complete.",
+)
+
+
+class _HealthHandler(BaseHTTPRequestHandler):
+    hang_at = 0.0  # monotonic time after which every request answers 503
+
+    def do_GET(self):
+        body = b""
+        if self.hang_at and time.monotonic() >= self.hang_at:
+            status = 503
+        elif self.path == "/health":
+            status = 200
+        elif self.path == "/v1/models":
+            status, body = 200, b'{"object": "list", "data": []}'
+        else:
+            status = 404
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _stamp() -> str:
+    return datetime.now().strftime("%m-%d %H:%M:%S")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="fake vllm serve")
+    parser.add_argument("model")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds between engine stats lines")
+    parser.add_argument("--chatty", type=int, default=0, help="extra access-log lines per interval")
+    parser.add_argument("--exit-after", type=float, default=0.0, help="exit after S seconds")
+    parser.add_argument("--exit-code", type=int, default=0, help="status to exit with after --exit-after")
+    parser.add_argument("--startup", type=float, default=0.0, help="seconds spent printing startup phase markers")
+    parser.add_argument("--serve-health", action="store_true", help="answer GET /health on --port once started")
+    parser.add_argument("--hang-after", type=float, default=0.0, help="answer 503 S seconds after startup")
+    args, _ = parser.parse_known_args()
+
+    pid = os.getpid()
+    out = sys.stdout
+    devices = os.environ.get("CUDA_VISIBLE_DEVICES", "")
+    out.write(f"(APIServer pid={pid}) INFO {_stamp()} [api_server.py:1] vLLM API server version 0.0.0-fake\n")
+    out.write(f"(APIServer pid={pid}) INFO {_stamp()} [api_server.py:2] model={args.model} "
+              f"port={args.port} CUDA_VISIBLE_DEVICES={devices}\n")
+    out.flush()
+    for line in STARTUP_LINES:
+        time.sleep(args.startup / len(STARTUP_LINES))
+        out.write(line.format(pid=pid, stamp=_stamp(), model=args.model, port=args.port) + "\n")
+        out.flush()
+    if args.serve_health:
+        if args.hang_after:
+            _HealthHandler.hang_at = time.monotonic() + args.hang_after
+        server = HTTPServer(("127.0.0.1", args.port), _HealthHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    start = time.monotonic()
+    tick = 0
+    while not args.exit_after or time.monotonic() - start < args.exit_after:
+        tick += 1
+        for _ in range(args.chatty):
+            out.write(f'(APIServer pid={pid}) INFO:     127.0.0.1:50000 - "POST /v1/completions HTTP/1.1" 200 OK\n')
+        out.write(f"(APIServer pid={pid}) INFO {_stamp()} [loggers.py:257] Engine 000: "
+                  f"Avg prompt throughput: {tick % 100}.0 tokens/s, Avg generation throughput: 1.0 tokens/s, "
+                  f"Running: 1 reqs, Waiting: 0 reqs, GPU KV cache usage: 10.0%, Prefix cache hit rate: 50.0%\n")
+        out.flush()
+        time.sleep(args.interval)
+    return args.exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,27 +9,82 @@ Tests cover:
 - VLLMController methods with mocked subprocess calls
 """
 
+import gzip
+import json
 import os
+import shlex
 import sys
 import subprocess
 import tempfile
+import threading
+import time
+import types
+from datetime import datetime
 from unittest.mock import MagicMock, patch
 import pytest
 
 # Add the current directory to Python path to import vllm_server
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+import vllm_server
 from vllm_server import (
     _normalize_wsl_path,
+    _tail_log,
+    parse_engine_metrics,
+    EngineMetrics,
+    MetricsRing,
+    AccessStats,
+    analyze_logs,
+    LineClassifier,
+    OutputSplitter,
     validate_config,
     VLLMController,
+    VLLMSupervisor,
+    GPUAllocator,
+    CondaDiscovery,
+    WSLShell,
+    MountResolver,
+    SchemeRepository,
+    CondaActivationCache,
+    StartupProfiler,
+    StartupHistory,
+    GPUTelemetry,
+    GPUHistory,
+    GPUProcessMonitor,
+    parse_gpu_processes,
+    EventHub,
+    FakeGPUBackend,
+    SmiStreamGPUBackend,
     Logger
 )
 
 
+@pytest.fixture(autouse=True)
+def _startup_history(tmp_path, mocker):
+    # 每次启动都会记录阶段耗时，写到临时目录而不是仓库
+    mocker.patch.object(vllm_server, 'startup_history', StartupHistory(str(tmp_path / "startup_history.json")))
+
+
+@pytest.fixture(autouse=True)
+def _logs(tmp_path, mocker):
+    # 全局 logger、默认实例和新建实例的日志都写到临时目录，不改动仓库里的 logs.txt 也不触发它的轮转
+    log_file = str(tmp_path / "logs.txt")
+    log = Logger(log_file)
+    mocker.patch.object(vllm_server, 'LOGS_FILE', log_file)
+    mocker.patch.object(vllm_server, 'logger', log)
+    mocker.patch.object(vllm_server.vllm_controller, 'logger', log)
+    yield log
+    log.close()
+
+
 class TestNormalizeWslPath:
     """Test _normalize_wsl_path function."""
     
+    @pytest.fixture(autouse=True)
+    def _empty_mount_table(self, mocker):
+        # 这些用例覆盖挂载表无法判断时的逐个探测逻辑，不受本机挂载情况影响
+        mocker.patch.object(vllm_server, 'mount_resolver', MountResolver(lambda: ""))
+    
     def test_non_mnt_path_returns_unchanged(self):
         """Paths not starting with /mnt/ should be returned unchanged."""
         assert _normalize_wsl_path("/home/user/model") == "/home/user/model"
@@ -350,6 +405,74 @@ class TestGenerateCommand:
         assert command != ""
         assert "wsl bash -c" in command
         assert "vllm serve" in command
+    
+    def test_paths_with_spaces_stay_one_argument(self):
+        """Paths are quoted when rendered and stay single argv entries."""
+        config = {
+            "envType": "linux",
+            "modelPath": "/models/my model",
+            "condaPath": "/opt/conda",
+            "customParams": [{"name": "--kv-cache-dtype fp8", "isFlag": True}],
+        }
+        launch = self.controller.build_launch(config)
+        assert launch.argv[:3] == ("vllm", "serve", "/models/my model")
+        assert launch.argv[-2:] == ("--kv-cache-dtype", "fp8")
+        assert "vllm serve '/models/my model'" in self.controller.generate_command(config)
+
+    def test_rendered_command_survives_outer_shell(self):
+        """$, backticks, quotes and backslashes reach the inner bash -c exactly as in the argv."""
+        config = {
+            "envType": "linux",
+            "modelPath": "/models/$HOME/`id`/a\"b\\c",
+            "condaPath": "/opt/conda",
+            "servedModelName": "price-$5",
+        }
+        launch = self.controller.build_launch(config)
+        command = self.controller.generate_command(config)
+        outer = "/bin/bash -c "
+        assert command.startswith(outer)
+        # 外层shell解析后得到的单个参数就是内层脚本，最后一步即 vllm serve 的 argv
+        script = subprocess.run(["bash", "-c", "printf '%s' " + command[len(outer):]],
+                                capture_output=True, text=True, check=True).stdout
+        assert shlex.split(script.rsplit(" && ", 1)[1]) == list(launch.argv)
+
+    def test_launch_is_memoized(self, mocker):
+        """The same config is compiled once; any change compiles again."""
+        normalize = mocker.patch('vllm_server._normalize_wsl_path', side_effect=lambda p: p)
+        config = {"envType": "linux", "modelPath": "/models/a", "condaPath": "/opt/conda", "port": 8000}
+        first = self.controller.build_launch(config)
+        assert self.controller.build_launch(dict(config)) is first
+        assert normalize.call_count == 1
+        assert self.controller.build_launch({**config, "port": 8001}) is not first
+    
+    def test_exports_become_environment(self):
+        """Plain exports go to the environment; shell syntax forces a shell launch."""
+        config = {"envType": "linux", "modelPath": "/m", "condaPath": "/opt/conda", "condaEnv": "vllm",
+                  "cudaDevices": "0,1", "exportCommands": ["export NCCL_DEBUG=INFO"]}
+        launch = self.controller.build_launch(config)
+        assert not launch.needs_shell
+        argv, env = vllm_server.launch_process_args(launch, use_wsl=False)
+        assert argv[:2] == ["vllm", "serve"]
+        assert env["CUDA_VISIBLE_DEVICES"] == "0,1" and env["NCCL_DEBUG"] == "INFO"
+        assert env["PATH"].startswith("/opt/conda/envs/vllm/bin")
+        argv, _ = vllm_server.launch_process_args(launch, use_wsl=True)
+        assert argv[:3] == ["wsl", "-e", "env"] and "CUDA_VISIBLE_DEVICES=0,1" in argv
+        shell_config = {**config, "exportCommands": ["export PATH=$PATH:/x"]}
+        assert self.controller.build_launch(shell_config).needs_shell
+
+    def test_shipped_quick_params_keep_their_values(self):
+        """Every quick param of vllm_schemes.json keeps its value, including ones ending in a line continuation."""
+        lines = {param["name"] if param.get("isFlag") or not param.get("value") else f"{param['name']} {param['value']}"
+                 for scheme in json.load(open(REPO_SCHEMES, encoding="utf-8"))
+                 for param in scheme["config"].get("quickParams", [])}
+        assert "export VLLM_SLEEP_WHEN_IDLE=1 \\" in lines
+        for line in lines:
+            name, value = vllm_server._parse_export(line)
+            if name is None:
+                assert not value.endswith("\\") and vllm_server._parse_export(value) == (None, value)
+            else:
+                assert value and value == line.split("=", 1)[1].rstrip(" \\")
+        assert vllm_server._parse_export('export A="unterminated') == (None, 'export A="unterminated')
 
 
 class TestVLLMControllerRunCommand:
@@ -473,5 +596,1815 @@ class TestVLLMControllerStop:
         self.mock_socketio.emit.assert_not_called()
 
 
+class TestLogger:
+    """Test the batched background Logger."""
+    
+    def test_lines_written_in_original_format(self, tmp_path, mocker):
+        """Batched writes should keep the one-line-per-entry on-disk format."""
+        mocker.patch('vllm_server.event_hub')
+        log_file = tmp_path / "logs.txt"
+        test_logger = Logger(str(log_file))
+        test_logger.log("info", "first")
+        test_logger.log("warning", "second")
+        test_logger.flush()
+        
+        lines = log_file.read_text(encoding="utf-8").splitlines()
+        assert len(lines) == 2
+        assert lines[0].endswith("[INFO] first")
+        assert lines[1].endswith("[WARNING] second")
+        assert lines[0].startswith("[20")
+    
+    def test_emits_single_batch_event(self, tmp_path, mocker):
+        """Lines logged within one interval should be pushed as one log_batch event."""
+        mock_hub = mocker.patch('vllm_server.event_hub')
+        test_logger = Logger(str(tmp_path / "logs.txt"), flush_interval=10.0)
+        for i in range(50):
+            test_logger.log("info", f"line {i}")
+        test_logger.flush()
+        
+        assert mock_hub.emit.call_count == 1
+        event, payload = mock_hub.emit.call_args[0]
+        assert event == "log_batch"
+        assert len(payload["logs"]) == 50
+        assert payload["logs"][0]["level"] == "info"
+        assert payload["logs"][-1]["message"].endswith("line 49")
+
+    def test_offset_matches_file_size(self, tmp_path, mocker):
+        """The log_batch offset is a byte position in the file; newlines are never translated."""
+        mock_hub = mocker.patch('vllm_server.event_hub')
+        log_file = tmp_path / "logs.txt"
+        opened = mocker.patch('builtins.open', side_effect=open)
+        test_logger = Logger(str(log_file))
+        test_logger.log("info", "第一行")
+        test_logger.log("info", "second")
+        test_logger.flush()
+
+        assert all(call.kwargs.get("newline") == "\n" for call in opened.call_args_list if call.args[1] == "a")
+        data = log_file.read_bytes()
+        assert b"\r\n" not in data
+        assert mock_hub.emit.call_args[0][1]["offset"] == len(data)
+
+    def test_flushes_by_size(self, tmp_path, mocker):
+        """Reaching flush_lines should write without waiting for the interval."""
+        mocker.patch('vllm_server.event_hub')
+        log_file = tmp_path / "logs.txt"
+        test_logger = Logger(str(log_file), flush_interval=60.0, flush_lines=10)
+        for i in range(10):
+            test_logger.log("info", f"line {i}")
+        
+        deadline = time.time() + 2
+        while time.time() < deadline:
+            if log_file.exists() and len(log_file.read_text(encoding="utf-8").splitlines()) == 10:
+                break
+            time.sleep(0.01)
+        assert len(log_file.read_text(encoding="utf-8").splitlines()) == 10
+    
+    def test_clear_truncates_file(self, tmp_path, mocker):
+        """clear() should drain pending lines and leave an empty file that keeps accepting writes."""
+        mocker.patch('vllm_server.event_hub')
+        log_file = tmp_path / "logs.txt"
+        test_logger = Logger(str(log_file))
+        test_logger.log("info", "old")
+        test_logger.clear()
+        assert log_file.read_text(encoding="utf-8") == ""
+        
+        test_logger.log("info", "new")
+        test_logger.flush()
+        assert log_file.read_text(encoding="utf-8").strip().endswith("[INFO] new")
+    
+    def test_close_releases_writer_and_file(self, tmp_path, mocker):
+        """close() writes pending lines, then stops the writer thread and closes the file."""
+        mocker.patch('vllm_server.event_hub')
+        log_file = tmp_path / "logs.txt"
+        test_logger = Logger(str(log_file), flush_interval=60.0)
+        test_logger.log("info", "last")
+        writer = test_logger._thread
+        test_logger.close()
+        assert not writer.is_alive() and test_logger._file is None
+        assert log_file.read_text(encoding="utf-8").strip().endswith("[INFO] last")
+
+
+class TestLoggerRotation:
+    """Test size/day based rotation of the active log segment."""
+    
+    def test_rotates_by_size_and_compresses(self, tmp_path, mocker):
+        """Exceeding max_bytes should start a new segment and gzip the old one."""
+        mocker.patch('vllm_server.event_hub')
+        log_file = tmp_path / "logs.txt"
+        test_logger = Logger(str(log_file), max_bytes=200, max_total_bytes=0)
+        for i in range(3):
+            test_logger.log("info", "x" * 80 + str(i))
+            test_logger.flush()
+        test_logger._archive_queue.join()
+        
+        archives = test_logger.archives()
+        assert archives and all(a.endswith(".gz") for a in archives)
+        with gzip.open(archives[0], "rt", encoding="utf-8") as f:
+            assert "[INFO] " + "x" * 80 + "0" in f.read()
+        assert log_file.stat().st_size <= 200
+        assert "x" * 80 + "2" in log_file.read_text(encoding="utf-8")
+    
+    def test_retention_caps_archive_size(self, tmp_path, mocker):
+        """Oldest archives should be removed once the total retained size is exceeded."""
+        mocker.patch('vllm_server.event_hub')
+        log_file = tmp_path / "logs.txt"
+        test_logger = Logger(str(log_file), max_bytes=100, max_total_bytes=500)
+        for i in range(20):
+            test_logger.log("info", os.urandom(40).hex())
+            test_logger.flush()
+        test_logger._archive_queue.join()
+        
+        archives = test_logger.archives()
+        assert 0 < len(archives) < 19
+        assert sum(os.path.getsize(a) for a in archives) <= 500 - 100
+    
+    def test_rotates_on_day_change(self, tmp_path, mocker):
+        """A segment last written on a previous day is rotated before new writes."""
+        mocker.patch('vllm_server.event_hub')
+        log_file = tmp_path / "logs.txt"
+        log_file.write_text("[2020-01-01 00:00:00] [INFO] old\n", encoding="utf-8")
+        old = time.time() - 3 * 86400
+        os.utime(log_file, (old, old))
+        
+        test_logger = Logger(str(log_file))
+        test_logger.log("info", "today")
+        test_logger.flush()
+        test_logger._archive_queue.join()
+        
+        assert "old" not in log_file.read_text(encoding="utf-8")
+        assert len(test_logger.archives()) == 1
+
+
+class TestTailLog:
+    """Test _tail_log reverse-seek reader and the /api/logs endpoint."""
+    
+    def _write_log(self, path, count):
+        with open(path, "w", encoding="utf-8") as f:
+            for i in range(count):
+                level = "ERROR" if i % 10 == 0 else "INFO"
+                f.write(f"[2026-01-17 17:02:15] [{level}] line {i}\n")
+    
+    def test_returns_last_lines(self, tmp_path, mocker):
+        """Only the last N lines are returned, in file order, across block boundaries."""
+        mocker.patch('vllm_server.LOG_TAIL_BLOCK', 64)
+        log_file = tmp_path / "logs.txt"
+        self._write_log(log_file, 100)
+        
+        lines, offset = _tail_log(str(log_file), 5)
+        assert [l.split()[-1] for l in lines] == ["95", "96", "97", "98", "99"]
+        assert offset == log_file.stat().st_size
+    
+    def test_short_file_returns_everything(self, tmp_path):
+        """Asking for more lines than exist returns the whole file."""
+        log_file = tmp_path / "logs.txt"
+        self._write_log(log_file, 3)
+        lines, _ = _tail_log(str(log_file), 500)
+        assert len(lines) == 3
+        assert lines[0].endswith("line 0")
+    
+    def test_since_offset_returns_only_new_lines(self, tmp_path):
+        """since_offset should skip everything the client already has."""
+        log_file = tmp_path / "logs.txt"
+        self._write_log(log_file, 10)
+        _, offset = _tail_log(str(log_file), 500)
+        with open(log_file, "a", encoding="utf-8") as f:
+            f.write("[2026-01-17 17:02:16] [INFO] new line\n")
+        
+        lines, new_offset = _tail_log(str(log_file), 500, since_offset=offset)
+        assert lines == ["[2026-01-17 17:02:16] [INFO] new line"]
+        assert _tail_log(str(log_file), 500, since_offset=new_offset)[0] == []
+    
+    def test_since_offset_past_end_restarts(self, tmp_path):
+        """An offset beyond EOF (log cleared or rotated) falls back to a normal tail."""
+        log_file = tmp_path / "logs.txt"
+        self._write_log(log_file, 10)
+        lines, _ = _tail_log(str(log_file), 2, since_offset=10 ** 9)
+        assert len(lines) == 2
+    
+    def test_level_filter(self, tmp_path, mocker):
+        """Level filtering matches the level token, not message text."""
+        mocker.patch('vllm_server.LOG_TAIL_BLOCK', 128)
+        log_file = tmp_path / "logs.txt"
+        self._write_log(log_file, 100)
+        with open(log_file, "a", encoding="utf-8") as f:
+            f.write("[2026-01-17 17:02:16] [INFO] message mentioning [ERROR]\n")
+        
+        lines, _ = _tail_log(str(log_file), 3, levels=["error"])
+        assert [l.split()[-1] for l in lines] == ["70", "80", "90"]
+    
+    def test_api_logs_query_parameters(self, tmp_path, mocker):
+        """The endpoint passes lines/since_offset/level through and returns the offset."""
+        log_file = tmp_path / "logs.txt"
+        self._write_log(log_file, 50)
+        mocker.patch.object(vllm_server.logger, 'file_path', str(log_file))
+        
+        client = vllm_server.app.test_client()
+        data = client.get("/api/logs?lines=2&level=error").get_json()
+        assert data["logs"].splitlines()[-1].endswith("line 40")
+        assert len(data["logs"].splitlines()) == 2
+        assert data["offset"] == log_file.stat().st_size
+        
+        data = client.get(f"/api/logs?since_offset={data['offset']}").get_json()
+        assert data["logs"] == ""
+
+
+ENGINE_LINE = (
+    "\x1b[0;36m(APIServer pid=53343)\x1b[0;0m INFO 01-17 17:02:29 [loggers.py:257] Engine 000: "
+    "Avg prompt throughput: 15968.9 tokens/s, Avg generation throughput: 43.4 tokens/s, "
+    "Running: 1 reqs, Waiting: 2 reqs, GPU KV cache usage: 14.4%, Prefix cache hit rate: 95.9%"
+)
+
+
+class TestEngineMetrics:
+    """Test vLLM engine stats parsing and the ring-buffer time series."""
+    
+    def test_parse_engine_line(self):
+        """Engine stats lines are parsed into typed samples."""
+        sample = parse_engine_metrics(ENGINE_LINE, timestamp=100.0)
+        assert sample.engine == "0"
+        assert sample.timestamp == 100.0
+        assert sample.prompt_throughput == 15968.9
+        assert sample.generation_throughput == 43.4
+        assert sample.running == 1
+        assert sample.waiting == 2
+        assert sample.kv_cache_usage == 14.4
+        assert sample.prefix_cache_hit_rate == 95.9
+    
+    def test_parse_without_prefix_cache(self):
+        """Older vLLM versions omit the prefix cache hit rate."""
+        line = ENGINE_LINE.split(", Prefix cache")[0]
+        sample = parse_engine_metrics(line, timestamp=1.0)
+        assert sample.kv_cache_usage == 14.4
+        assert sample.prefix_cache_hit_rate == -1.0
+    
+    def test_non_metric_lines_ignored(self):
+        """Access log and other lines produce no sample."""
+        assert parse_engine_metrics('INFO:     127.0.0.1:56244 - "POST /v1/chat/completions HTTP/1.1" 200 OK') is None
+        assert parse_engine_metrics("Avg prompt throughput: garbage") is None
+    
+    def test_ring_wraps_and_windows(self):
+        """The ring keeps only the newest capacity samples and filters by time."""
+        ring = MetricsRing(("timestamp", "value"), capacity=4)
+        for i in range(6):
+            ring.append((float(i), float(i * 10)))
+        assert len(ring) == 4
+        assert ring.window()["timestamp"] == [2.0, 3.0, 4.0, 5.0]
+        assert ring.window(since=4.0) == {"timestamp": [4.0, 5.0], "value": [40.0, 50.0]}
+    
+    def test_per_engine_series(self):
+        """Samples are kept separately per engine."""
+        metrics = EngineMetrics(capacity=8)
+        metrics.record(parse_engine_metrics(ENGINE_LINE, timestamp=time.time()))
+        metrics.record(parse_engine_metrics(ENGINE_LINE.replace("Engine 000", "Engine 001"), timestamp=time.time()))
+        data = metrics.window(60)
+        assert set(data) == {"0", "1"}
+        assert data["0"]["waiting"] == [2.0]
+        assert set(metrics.window(60, engine="1")) == {"1"}
+    
+    def test_api_engine_metrics(self, mocker):
+        """The endpoint returns the recorded window."""
+        metrics = EngineMetrics(capacity=8)
+        metrics.record(parse_engine_metrics(ENGINE_LINE, timestamp=time.time() - 1000))
+        metrics.record(parse_engine_metrics(ENGINE_LINE, timestamp=time.time()))
+        mocker.patch.object(vllm_server.vllm_controller, 'engine_metrics', metrics)
+        
+        client = vllm_server.app.test_client()
+        data = client.get("/api/metrics/engine?window=60").get_json()
+        assert len(data["engines"]["0"]["timestamp"]) == 1
+        data = client.get("/api/metrics/engine").get_json()
+        assert len(data["engines"]["0"]["timestamp"]) == 2
+
+
+ACCESS_LINE = ('\x1b[0;36m(APIServer pid=53343)\x1b[0;0m INFO:     127.0.0.1:56244 - '
+               '"POST /v1/chat/completions HTTP/1.1" 200 OK')
+
+
+class TestAccessStats:
+    """Test the uvicorn access log sliding-window aggregator."""
+    
+    def test_counts_by_endpoint_status_and_client(self):
+        """Requests are grouped by endpoint, status code and client address."""
+        stats = AccessStats(window=10)
+        for _ in range(4):
+            assert stats.record(ACCESS_LINE, now=100.0)
+        assert stats.record('10.0.0.2:4000 - "GET /v1/models?x=1 HTTP/1.1" 500 Internal Server Error', now=101.0)
+        
+        rates = stats.rates(10, now=101.0)
+        assert rates["rps"] == 0.5
+        assert rates["endpoints"] == {"POST /v1/chat/completions": 0.4, "GET /v1/models": 0.1}
+        assert rates["status"] == {"200": 0.4, "500": 0.1}
+        assert rates["clients"] == {"127.0.0.1": 0.4, "10.0.0.2": 0.1}
+        assert rates["error_rate"] == 0.2
+    
+    def test_non_access_lines_ignored(self):
+        """Ordinary log lines are not counted."""
+        stats = AccessStats(window=10)
+        assert not stats.record("INFO 01-17 17:02:19 [loggers.py:257] Engine 000: Avg prompt throughput: 1.0")
+        assert not stats.record("HTTP/1.1 mentioned in passing")
+        assert stats.rates(now=0)["rps"] == 0
+    
+    def test_window_slides(self):
+        """Old buckets fall out of the window and reused buckets are reset."""
+        stats = AccessStats(window=10)
+        stats.record(ACCESS_LINE, now=100.0)
+        stats.record(ACCESS_LINE, now=105.0)
+        assert stats.rates(10, now=105.0)["rps"] == 0.2
+        assert stats.rates(10, now=112.0)["rps"] == 0.1
+        stats.record(ACCESS_LINE, now=110.0)  # same bucket as t=100
+        assert stats.rates(10, now=110.0)["rps"] == 0.2
+        assert stats.rates(1, now=110.0)["rps"] == 1.0
+        assert stats.totals["endpoints"]["POST /v1/chat/completions"] == 3
+    
+    def test_totals_stay_bounded(self, mocker):
+        """Per-id paths share one template and unseen keys beyond the cap fold into <other>."""
+        stats = AccessStats(window=10)
+        for rid in ("resp_3f2a9c", "resp_77b01e", "42", "0b6c1e2a-9d4f-4c1e-8a55-1f0e2d3c4b5a"):
+            stats.record(f'127.0.0.1:1 - "GET /v1/responses/{rid} HTTP/1.1" 200 OK', now=100.0)
+        assert stats.totals["endpoints"] == {"GET /v1/responses/<id>": 4}
+        assert stats.rates(10, now=100.0)["endpoints"] == {"GET /v1/responses/<id>": 0.4}
+        
+        mocker.patch('vllm_server.ACCESS_TOTALS_MAX_KEYS', 3)
+        for name in ("a", "b", "c", "d", "a"):
+            stats.record(f'127.0.0.1:1 - "GET /{name} HTTP/1.1" 200 OK', now=101.0)
+        assert stats.totals["endpoints"] == {"GET /v1/responses/<id>": 4, "GET /a": 2, "GET /b": 1, "<other>": 2}
+    
+    def test_api_access_metrics(self, mocker):
+        """The endpoint exposes the current rates."""
+        stats = AccessStats()
+        stats.record(ACCESS_LINE)
+        mocker.patch.object(vllm_server.vllm_controller, 'access_stats', stats)
+        data = vllm_server.app.test_client().get("/api/metrics/access?window=60").get_json()
+        assert data["window"] == 60
+        assert data["totals"]["status"] == {"200": 1}
+
+
+class TestAnalyzeLogs:
+    """Test the offline log analysis used by `vllm_server.py analyze`."""
+    
+    def _write_log(self, path):
+        lines = []
+        for i in range(30):
+            ts = f"2026-01-17 17:{i:02d}:00"
+            kv = 95.0 if 10 <= i < 13 else 10.0
+            lines.append(f"[{ts}] [INFO] " + ENGINE_LINE.replace("14.4%", f"{kv}%"))
+            lines.append(f"[{ts}] [INFO] {ACCESS_LINE}")
+        for j in range(6):
+            lines.append(f"[2026-01-17 17:20:{j:02d}] [ERROR] Traceback (most recent call last):")
+        lines.append('  File "x.py", line 1, in <module>')
+        lines.sort()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    
+    def test_report(self, tmp_path):
+        """Throughput percentiles, KV pressure, prefix trend and error bursts are reported."""
+        log_file = tmp_path / "logs.txt"
+        self._write_log(log_file)
+        report = analyze_logs([str(log_file)], write_index=False)
+        
+        assert report["lines"] == 66
+        assert report["levels"] == {"INFO": 60, "ERROR": 6}
+        assert report["engine_samples"] == 30
+        assert report["prompt_throughput"]["p50"] == 15968.9
+        assert len(report["kv_pressure_periods"]) == 1
+        period = report["kv_pressure_periods"][0]
+        assert (period["start"], period["end"], period["duration_s"]) == ("2026-01-17 17:10:00", "2026-01-17 17:12:00", 120)
+        assert report["prefix_cache_trend"] == [{"hour": "2026-01-17 17:00", "mean": pytest.approx(95.9), "samples": 30}]
+        assert report["error_bursts"] == [{"start": "2026-01-17 17:20", "end": "2026-01-17 17:20", "errors": 6}]
+    
+    def test_byte_range_split_matches_single_pass(self, tmp_path, mocker):
+        """Splitting a file into byte ranges across processes gives the same result."""
+        log_file = tmp_path / "logs.txt"
+        self._write_log(log_file)
+        single = analyze_logs([str(log_file)], write_index=False)
+        
+        mocker.patch('vllm_server.ANALYZE_MIN_CHUNK', 1000)
+        assert len(vllm_server._plan_analyze_tasks([str(log_file)], 4)) > 1
+        split = analyze_logs([str(log_file)], workers=4, write_index=False)
+        assert split == single
+    
+    def test_gzip_and_index(self, tmp_path):
+        """Gzipped archives are read and an index keyed by minute and level is written."""
+        log_file = tmp_path / "logs.txt"
+        self._write_log(log_file)
+        gz_file = tmp_path / "logs.txt.20260117.gz"
+        with open(log_file, "rb") as src, gzip.open(gz_file, "wb") as dst:
+            dst.write(src.read())
+        
+        report = analyze_logs([str(gz_file)])
+        assert report["lines"] == 66
+        with open(report["indexes"][0], encoding="utf-8") as f:
+            index = json.load(f)
+        assert index["compressed"] is True
+        minute, offset, counts = index["minutes"][20]
+        assert minute == "2026-01-17 17:20"
+        assert counts == {"ERROR": 6, "INFO": 2}
+        with gzip.open(gz_file, "rb") as f:
+            f.seek(offset)
+            assert f.readline().startswith(b"[2026-01-17 17:20:00] [ERROR]")
+
+
+class TestLineClassifier:
+    """Test level classification and traceback grouping of vLLM output."""
+    
+    def test_level_token_after_ansi_prefix(self):
+        """The level token after the colour/process prefix decides the level."""
+        classifier = LineClassifier()
+        prefix = "\x1b[0;36m(APIServer pid=53343)\x1b[0;0m "
+        assert classifier.feed(prefix + "WARNING 01-17 17:02:19 [x.py:1] slow\n") == [
+            ("warning", prefix + "WARNING 01-17 17:02:19 [x.py:1] slow")]
+        assert classifier.feed(prefix + "ERROR 01-17 17:02:19 [x.py:1] boom\n")[0][0] == "error"
+        assert classifier.feed(prefix + "CRITICAL 01-17 17:02:19 [x.py:1] dead\n")[0][0] == "error"
+        assert classifier.feed("INFO:     127.0.0.1:1 - \"GET /health HTTP/1.1\" 200 OK\n")[0][0] == "info"
+    
+    def test_level_words_in_message_do_not_change_level(self):
+        """ERROR/WARNING inside an INFO message no longer misclassifies the line."""
+        classifier = LineClassifier()
+        line = "(APIServer pid=1) INFO 01-17 17:02:19 [x.py:1] retrying after ERROR in WARNING handler"
+        assert classifier.feed(line) == [("info", line)]
+    
+    def test_python_warning(self):
+        """warnings.warn output is classified as a warning."""
+        classifier = LineClassifier()
+        line = "/x/resource_tracker.py:147: UserWarning: resource_tracker: process died unexpectedly"
+        assert classifier.feed(line) == [("warning", line)]
+    
+    def test_traceback_grouped_into_one_record(self):
+        """A bare traceback and its continuation lines become a single error record."""
+        classifier = LineClassifier()
+        assert classifier.feed("Traceback (most recent call last):\n") == []
+        assert classifier.feed('  File "/x/resource_tracker.py", line 264, in main\n') == []
+        assert classifier.feed("    cache[rtype].remove(name)\n") == []
+        records = classifier.feed("KeyError: '/psm_24685522'\n")
+        assert records == [("error", "Traceback (most recent call last):\n"
+                                     '  File "/x/resource_tracker.py", line 264, in main\n'
+                                     "    cache[rtype].remove(name)\n"
+                                     "KeyError: '/psm_24685522'")]
+        assert classifier.feed("plain line\n") == [("info", "plain line")]
+    
+    def test_traceback_interrupted_by_prefixed_line(self):
+        """Output from another process ends the pending traceback."""
+        classifier = LineClassifier()
+        classifier.feed("Traceback (most recent call last):")
+        classifier.feed('  File "x.py", line 1, in <module>')
+        records = classifier.feed("(Worker pid=2) INFO 01-17 17:02:19 [x.py:1] hello")
+        assert [r[0] for r in records] == ["error", "info"]
+        assert records[0][1].count("\n") == 1
+    
+    def test_prefixed_traceback_from_repository_log(self):
+        """A crash traceback with a process prefix on every line (logs.txt) becomes one error record."""
+        repo_log = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs.txt")
+        with open(repo_log, "r", encoding="utf-8") as f:
+            lines = [line.split("] ", 2)[2] for line in f if "(APIServer pid=23071)" in line]
+        start = next(i for i, line in enumerate(lines) if "Traceback" in line)
+        end = next(i for i, line in enumerate(lines) if "KeyError:" in line)
+        classifier = LineClassifier()
+        records = []
+        for line in lines[start - 1:end + 1]:
+            records += classifier.feed(line)
+        assert [r[0] for r in records] == ["info", "error"]
+        traceback = records[1][1].splitlines()
+        assert len(traceback) == end - start + 1
+        assert "Traceback" in traceback[0] and "KeyError:" in traceback[-1]
+
+    def test_traceback_grouped_by_prefix(self):
+        """Lines from another process do not join a prefixed traceback."""
+        classifier = LineClassifier()
+        api, worker = "\x1b[0;36m(APIServer pid=1)\x1b[0;0m ", "\x1b[0;36m(Worker pid=2)\x1b[0;0m "
+        assert classifier.feed(api + "Traceback (most recent call last):") == []
+        assert classifier.feed(api + '  File "x.py", line 1, in <module>') == []
+        records = classifier.feed(worker + "  loading shard 3")
+        assert records == [("error", api + "Traceback (most recent call last):\n"
+                                     + api + '  File "x.py", line 1, in <module>'),
+                           ("info", worker + "  loading shard 3")]
+
+    def test_flush_pending_traceback(self):
+        """flush() emits an unfinished traceback when the process exits."""
+        classifier = LineClassifier()
+        classifier.feed("Traceback (most recent call last):")
+        assert classifier.flush() == [("error", "Traceback (most recent call last):")]
+        assert classifier.flush() == []
+    
+    def test_tail_level_filter_keeps_continuation_lines(self, tmp_path):
+        """Filtering the log by level keeps the continuation lines of multi-line records."""
+        log_file = tmp_path / "logs.txt"
+        log_file.write_text(
+            "[2026-01-17 17:02:15] [INFO] before\n"
+            "[2026-01-17 17:02:15] [ERROR] Traceback (most recent call last):\n"
+            '  File "x.py", line 1, in <module>\n'
+            "KeyError: 'x'\n"
+            "[2026-01-17 17:02:16] [INFO] after\n",
+            encoding="utf-8",
+        )
+        lines, _ = _tail_log(str(log_file), 10, levels=["error"])
+        assert lines == [
+            "[2026-01-17 17:02:15] [ERROR] Traceback (most recent call last):",
+            '  File "x.py", line 1, in <module>',
+            "KeyError: 'x'",
+        ]
+
+
+class TestOutputSplitter:
+    """Test the raw-bytes line splitter used by the vLLM output reader."""
+    
+    def test_splits_lines_across_chunks(self):
+        """Lines and multi-byte characters split across chunks are reassembled."""
+        splitter = OutputSplitter()
+        data = "启动完成\nsecond".encode("utf-8")
+        assert splitter.feed(data[:2]) == []
+        assert splitter.feed(data[2:14]) == ["启动完成"]
+        assert splitter.feed(data[14:] + b" line\n") == ["second line"]
+    
+    def test_progress_redraws_collapse_to_latest(self):
+        """Carriage-return redraws keep only the final state of the line."""
+        splitter = OutputSplitter()
+        lines = splitter.feed(b"Loading  10%\rLoading  50%\rLoading 100%\nnext\r\n")
+        assert lines == ["Loading 100%", "next"]
+    
+    def test_unfinished_progress_keeps_only_latest_frame(self):
+        """An unterminated progress bar is held as a single frame, not a growing line."""
+        splitter = OutputSplitter()
+        for i in range(1000):
+            assert splitter.feed(f"\rshards {i}/1000".encode()) == []
+        assert len(splitter._partial) < 32
+        assert splitter.take_progress() == "shards 998/1000"
+        assert splitter.take_progress() == ""
+        assert splitter.feed(b"\n") == ["shards 999/1000"]
+        assert splitter.take_progress() == ""
+    
+    def test_overlong_line_is_split(self):
+        """A line without any newline is cut at max_line."""
+        splitter = OutputSplitter(max_line=10)
+        assert splitter.feed(b"x" * 25) == ["x" * 25]
+        assert splitter.feed(b"abc") == []
+    
+    def test_flush_returns_remaining_text(self):
+        """flush() emits the last unterminated line."""
+        splitter = OutputSplitter()
+        splitter.feed(b"tail without newline\rfinal")
+        assert splitter.flush() == ["final"]
+        assert splitter.flush() == []
+    
+    def test_reader_handles_binary_pipe(self, mocker):
+        """run_command reads the child's raw stdout and logs classified lines."""
+        mocker.patch('vllm_server._wsl_command_exists', return_value=True)
+        controller = VLLMController(MagicMock())
+        mocker.patch.object(controller, 'start_nvitop')
+        mocker.patch.object(controller, 'stop_nvitop')
+        handled = []
+        mocker.patch.object(controller, '_handle_output', side_effect=lambda lv, msg: handled.append((lv, msg)))
+        
+        command = "printf 'WARNING x\\n50%%\\r100%%\\nTraceback (most recent call last):\\n  File y\\nKeyError: 1\\n'"
+        controller.run_command(command, "linux")
+        # 子进程可能在读取线程清空 controller.process 之后才轮到这里，只等待运行状态
+        deadline = time.time() + 10
+        while controller.is_running and time.time() < deadline:
+            time.sleep(0.01)
+        
+        # 忽略测试环境中bash自身的locale警告
+        assert [h for h in handled if "setlocale" not in h[1]] == [
+            ("warning", "WARNING x"),
+            ("info", "100%"),
+            ("error", "Traceback (most recent call last):\n  File y\nKeyError: 1"),
+        ]
+
+    def test_unmanaged_instance_exit_keeps_nvitop(self, mocker):
+        """An instance with manage_nvitop=False leaves the global GPU monitor running on exit."""
+        mocker.patch('vllm_server._wsl_command_exists', return_value=True)
+        controller = VLLMController(MagicMock(), "b", manage_nvitop=False)
+        stop = mocker.patch.object(controller, 'stop_nvitop')
+        controller.run_command("true", "linux")
+        deadline = time.time() + 10
+        while controller.is_running and time.time() < deadline:
+            time.sleep(0.01)
+        assert controller.is_running is False
+        stop.assert_not_called()
+
+
+
+FAKE_VLLM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_vllm_serve.py")
+
+
+class TestSupervisor:
+    """Test VLLMSupervisor with several fake vllm serve instances."""
+    
+    def setup_method(self):
+        self.socketio = MagicMock()
+    
+    def _supervisor(self, tmp_path, mocker):
+        mocker.patch.object(vllm_server, 'LOGS_FILE', str(tmp_path / "logs.txt"))
+        default = VLLMController(self.socketio, log=Logger(str(tmp_path / "logs.txt")), manage_nvitop=False)
+        return VLLMSupervisor(self.socketio, default)
+    
+    @staticmethod
+    def _command(port, *extra):
+        return " ".join([f'"{sys.executable}"', f'"{FAKE_VLLM}"', "model", "--port", str(port), *extra])
+    
+    @staticmethod
+    def _wait(predicate, timeout=10):
+        deadline = time.time() + timeout
+        while not predicate() and time.time() < deadline:
+            time.sleep(0.02)
+        return predicate()
+    
+    def test_instances_run_isolated(self, tmp_path, mocker):
+        """Each instance gets its own process, log file and metrics."""
+        sup = self._supervisor(tmp_path, mocker)
+        assert sup.run(None, self._command(8001, "--chatty", "200"), "linux", {"port": "8001"}) is None
+        assert sup.run("b", self._command(8002), "linux", {"port": "8002", "cudaDevices": "1"}, "scheme-b") is None
+        a, b = sup.get(), sup.get("b")
+        try:
+            assert a.process.pid != b.process.pid
+            assert self._wait(lambda: a.engine_metrics.window() and b.engine_metrics.window())
+            # 输出很多的实例不会阻塞另一个实例的读取
+            assert self._wait(lambda: len(b.engine_metrics.window()["0"]["timestamp"]) >= 3)
+            info = {i["id"]: i for i in sup.instances()}
+            assert info["b"]["running"] is True
+            assert info["b"]["scheme"] == "scheme-b"
+            assert info["b"]["cudaDevices"] == "1"
+            assert info["b"]["logFile"] == str(tmp_path / "logs-b.txt")
+        finally:
+            sup.stop_all()
+        
+        default_log = (tmp_path / "logs.txt").read_text(encoding="utf-8")
+        b_log = (tmp_path / "logs-b.txt").read_text(encoding="utf-8")
+        assert "port=8001" in default_log and "port=8002" not in default_log
+        assert "port=8002" in b_log and "/v1/completions" not in b_log
+    
+    def test_config_launch_runs_without_shell(self, tmp_path, mocker):
+        """A launch from config execs the env's vllm directly with shell=False."""
+        bin_dir = tmp_path / "conda" / "envs" / "vllm" / "bin"
+        bin_dir.mkdir(parents=True)
+        vllm = bin_dir / "vllm"
+        vllm.write_text(f'#!/bin/sh\nshift\nexec "{sys.executable}" "{FAKE_VLLM}" "$@"\n')
+        vllm.chmod(0o755)
+        popen = mocker.spy(vllm_server.subprocess, 'Popen')
+        sup = self._supervisor(tmp_path, mocker)
+        config = {"modelPath": "/models/my model", "condaPath": str(tmp_path / "conda"), "condaEnv": "vllm",
+                  "port": "8003", "cudaDevices": "", "customParams": [{"name": "--interval 0.05", "isFlag": True}]}
+        assert sup.run("cfg", "", "linux", config) is None
+        controller = sup.get("cfg")
+        try:
+            assert popen.call_args.kwargs["shell"] is False
+            assert popen.call_args.args[0][:3] == ["vllm", "serve", "/models/my model"]
+            assert self._wait(lambda: controller.engine_metrics.window())
+        finally:
+            sup.stop_all()
+        log = (tmp_path / "logs-cfg.txt").read_text(encoding="utf-8")
+        assert "model=/models/my model port=8003" in log
+    
+    def test_named_instance_events_carry_id(self, tmp_path, mocker):
+        """Events of non-default instances are tagged; the default keeps the old payload."""
+        sup = self._supervisor(tmp_path, mocker)
+        sup.get_or_create("b")._emit("status", {"running": False})
+        sup.get()._emit("status", {"running": False})
+        self.socketio.emit.assert_any_call("status", {"running": False, "instance": "b"})
+        self.socketio.emit.assert_any_call("status", {"running": False})
+    
+    def test_rejects_busy_instance_and_port(self, tmp_path, mocker):
+        """A running instance cannot be started twice and ports cannot collide."""
+        sup = self._supervisor(tmp_path, mocker)
+        assert sup.run("a", self._command(8001), "linux", {"port": "8001"}) is None
+        try:
+            assert "已在运行" in sup.run("a", self._command(8001), "linux", {"port": "8001"})
+            assert "8001" in sup.run("b", self._command(8001), "linux", {"port": "8001"})
+            assert sup.remove("a") is False
+        finally:
+            sup.stop_all()
+        assert sup.remove("a") is True
+        assert sup.remove("default") is False
+        # 反复创建、移除同一实例不泄漏写入线程和文件句柄
+        writers = lambda: sum(t.name == "log-writer" and t.is_alive() for t in threading.enumerate())
+        before = writers()
+        for _ in range(3):
+            sup.get_or_create("a").logger.log("info", "x")
+            assert sup.remove("a") is True
+        assert writers() == before
+        with pytest.raises(ValueError):
+            sup.get_or_create("bad id!")
+    
+    def test_api_requires_known_instance(self):
+        """Instance-scoped endpoints return 404 for unknown ids."""
+        client = vllm_server.app.test_client()
+        assert client.post("/api/stop", json={"instance": "missing"}).status_code == 404
+        assert client.get("/api/metrics/engine?instance=missing").status_code == 404
+        assert client.post("/api/instances", json={"id": "bad id!"}).status_code == 400
+
+
+
+class TestGPUAllocator:
+    """Test GPUAllocator against a simulated device inventory."""
+    
+    def test_assigns_any_free_devices(self):
+        """Requests for N GPUs get the lowest free devices without overlap."""
+        alloc = GPUAllocator(devices=[0, 1, 2, 3])
+        assert alloc.request("a", None, count=2) == [0, 1]
+        assert alloc.request("b", None, devices=[3]) == [3]
+        assert alloc.request("c", None, count=1) == [2]
+        assert alloc.status()["free"] == []
+    
+    def test_queues_until_release(self):
+        """Launches without capacity wait in order and start on release."""
+        alloc = GPUAllocator(devices=[0, 1])
+        started = []
+        assert alloc.request("a", None, count=2) == [0, 1]
+        assert alloc.request("b", lambda d: started.append(("b", d)), count=1) is None
+        assert alloc.request("c", lambda d: started.append(("c", d)), devices=[1]) is None
+        assert alloc.status()["queued"] == ["b", "c"]
+        alloc.release("a")
+        assert started == [("b", [0]), ("c", [1])]
+        assert alloc.status()["held"] == {"b": [0], "c": [1]}
+    
+    def test_explicit_devices_cannot_overlap(self):
+        """A request for devices another instance holds is queued; cancel drops it."""
+        alloc = GPUAllocator(devices=[0, 1])
+        alloc.request("a", None, devices=[0, 1])
+        assert alloc.request("b", None, devices=[1]) is None
+        assert alloc.cancel("b") is True
+        assert alloc.status()["queued"] == []
+    
+    def test_check_rejects_impossible_requests(self):
+        """Requests larger than the inventory or for unknown devices fail fast."""
+        alloc = GPUAllocator(devices=[0, 1])
+        assert "2" in alloc.check(count=4)
+        assert "GPU 5" in alloc.check(devices=[5])
+        assert alloc.check(count=2) is None
+    
+    def test_inventory_from_environment(self, mocker):
+        """VLLM_GUI_GPUS simulates a device inventory."""
+        mocker.patch.dict(os.environ, {"VLLM_GUI_GPUS": "0,1,2"})
+        assert GPUAllocator().inventory() == [0, 1, 2]
+    
+    def test_generate_command_fills_auto_devices(self, mocker):
+        """cudaDevices "auto" exports the devices the allocator would assign."""
+        alloc = GPUAllocator(devices=[0, 1, 2, 3])
+        alloc.request("other", None, devices=[0])
+        mocker.patch.object(vllm_server, 'gpu_allocator', alloc)
+        controller = VLLMController(MagicMock())
+        command = controller.generate_command({
+            "modelPath": "/models/m", "envType": "linux", "condaPath": "/opt/conda",
+            "cudaDevices": "auto", "tensorParallel": "2",
+        })
+        assert "export CUDA_VISIBLE_DEVICES=1,2" in command
+
+    def test_generate_command_keeps_auto_without_free_devices(self, mocker):
+        """With too few free GPUs the preview keeps the auto placeholder instead of dropping the restriction."""
+        alloc = GPUAllocator(devices=[0, 1])
+        alloc.request("other", None, devices=[0])
+        mocker.patch.object(vllm_server, 'gpu_allocator', alloc)
+        controller = VLLMController(MagicMock())
+        config = {"modelPath": "/models/m", "envType": "linux", "condaPath": "/opt/conda", "cudaDevices": "auto"}
+        assert "export CUDA_VISIBLE_DEVICES=1" in controller.generate_command(config)
+        assert "export CUDA_VISIBLE_DEVICES=auto" in controller.generate_command({**config, "tensorParallel": "2"})
+        alloc.request("more", None, devices=[1])
+        assert "export CUDA_VISIBLE_DEVICES=auto" in controller.generate_command(config)
+    
+    def test_supervisor_starts_queued_instance(self, tmp_path, mocker):
+        """An instance waiting for GPUs starts once the holder exits."""
+        mocker.patch.object(vllm_server, 'LOGS_FILE', str(tmp_path / "logs.txt"))
+        fake = "CUDA_VISIBLE_DEVICES=auto " + TestSupervisor._command(8001)
+        default = VLLMController(MagicMock(), log=Logger(str(tmp_path / "logs.txt")), manage_nvitop=False)
+        sup = VLLMSupervisor(MagicMock(), default, GPUAllocator(devices=[0, 1]))
+        try:
+            assert sup.run("a", fake, "linux", {"cudaDevices": "auto", "tensorParallel": 2}) is None
+            assert sup.run("b", fake, "linux", {"cudaDevices": "auto", "port": 8002}) is None
+            assert sup.get("b").process is None
+            assert sup.allocator.status()["queued"] == ["b"]
+            assert "已在运行" in sup.run("b", fake, "linux", {"cudaDevices": "auto"})
+            
+            sup.stop("a")
+            assert TestSupervisor._wait(lambda: sup.get("b").is_running)
+            assert sup.allocator.status()["held"] == {"b": [0]}
+            assert sup.get("b").config["cudaDevices"] == "0"
+        finally:
+            sup.stop_all()
+        assert "CUDA_VISIBLE_DEVICES=0" in (tmp_path / "logs-b.txt").read_text(encoding="utf-8")
+        assert TestSupervisor._wait(lambda: sup.allocator.status()["held"] == {})
+
+    def test_exported_devices_go_through_allocator(self, tmp_path, mocker):
+        """A quick param export of CUDA_VISIBLE_DEVICES is allocated and never overrides assigned devices."""
+        mocker.patch.object(vllm_server, 'LOGS_FILE', str(tmp_path / "logs.txt"))
+        launched = []
+
+        def launch(controller, command, env_type, config):
+            controller.process = MagicMock()
+            launched.append(config)
+
+        mocker.patch.object(VLLMSupervisor, '_launch', side_effect=launch)
+        default = VLLMController(MagicMock(), log=Logger(str(tmp_path / "logs.txt")), manage_nvitop=False)
+        sup = VLLMSupervisor(MagicMock(), default, GPUAllocator(devices=[0, 1, 2, 3]))
+        exports = ["export NCCL_P2P_DISABLE=1", "export CUDA_VISIBLE_DEVICES=0,1"]
+        assert sup.run("a", "", "linux", {"cudaDevices": "", "exportCommands": exports}) is None
+        assert sup.run("b", "", "linux", {"cudaDevices": "auto", "tensorParallel": 2, "port": 8002,
+                                          "exportCommands": exports}) is None
+        assert sup.allocator.status()["held"] == {"a": [0, 1], "b": [2, 3]}
+        spec = vllm_server.build_launch_spec({**launched[1], "envType": "linux", "condaPath": "/opt/conda"})
+        _, env = vllm_server.launch_process_args(spec, use_wsl=False)
+        assert env["CUDA_VISIBLE_DEVICES"] == "2,3" and env["NCCL_P2P_DISABLE"] == "1"
+        assert vllm_server.render_launch_command(spec).count("CUDA_VISIBLE_DEVICES") == 1
+
+
+
+class TestGPUTelemetry:
+    """Test the shared GPU status sampler."""
+    
+    GPU = {"name": "Fake", "memory_used": "100", "memory_total": "24576", "utilization": "5",
+           "temperature": "40", "power": "30.00", "fan_speed": "0"}
+    
+    def test_requests_read_cached_snapshot(self, mocker):
+        """Many /api/gpu-status reads share one sample and do not spawn nvidia-smi."""
+        backend = FakeGPUBackend([self.GPU])
+        sample = mocker.spy(backend, 'sample')
+        telemetry = GPUTelemetry(backend_factory=lambda: backend, interval=60)
+        mocker.patch.object(vllm_server, 'gpu_telemetry', telemetry)
+        run = mocker.spy(vllm_server.subprocess, 'run')
+        client = vllm_server.app.test_client()
+        try:
+            for _ in range(20):
+                data = client.get("/api/gpu-status").get_json()
+        finally:
+            telemetry.stop()
+        assert data["status"] == "ok" and data["backend"] == "fake"
+        assert data["gpus"] == [self.GPU]
+        assert sample.call_count == 1
+        assert run.call_count == 0
+    
+    def test_pushes_only_changes(self):
+        """The gpu event is emitted when the sampled values change."""
+        socketio = MagicMock()
+        backend = FakeGPUBackend([dict(self.GPU)])
+        telemetry = GPUTelemetry(socketio, backend_factory=lambda: backend)
+        telemetry.sample()
+        telemetry.sample()
+        backend.gpus[0]["utilization"] = "90"
+        telemetry.sample()
+        pushed = [c.args[1]["gpus"][0]["utilization"] for c in socketio.emit.call_args_list if c.args[0] == "gpu"]
+        assert pushed == ["5", "90"]
+        assert GPUTelemetry(backend_factory=lambda: None).sample()["status"] == "error"
+    
+    def test_stays_pending_until_backend_has_data(self):
+        """A backend without a parsed row yet neither marks the snapshot ready nor records history."""
+        socketio = MagicMock()
+        backend = FakeGPUBackend([self.GPU])
+        rows = iter([None, [self.GPU]])
+        backend.sample = lambda: next(rows)
+        telemetry = GPUTelemetry(socketio, backend_factory=lambda: backend)
+        assert telemetry.sample()["status"] == "pending"
+        assert not telemetry._ready.is_set() and not socketio.emit.called
+        assert telemetry.history.query(0.0)["gpus"] == {}
+        assert telemetry.sample()["gpus"] == [self.GPU]
+        assert telemetry._ready.is_set() and len(telemetry.history.query(0.0)["gpus"]["0"]["timestamp"]) == 1
+    
+    def test_history_downsamples_into_tiers(self):
+        """Samples are folded into min/max/mean buckets per tier with bounded memory."""
+        history = GPUHistory(tiers=((1, 5), (10, 5)))
+        for t in range(100):
+            history.record(1000.0 + t, [{**self.GPU, "memory_used": str(t), "power": "[N/A]"}])
+        coarse = history.query(1050.0, 1070.0, resolution=10)["gpus"]["0"]
+        assert coarse["timestamp"] == [1050.0, 1060.0, 1070.0]
+        assert coarse["memory_used_min"] == [50.0, 60.0, 70.0]
+        assert coarse["memory_used_max"] == [59.0, 69.0, 79.0]
+        assert coarse["memory_used_mean"] == [54.5, 64.5, 74.5]
+        assert coarse["power_mean"] == [None, None, None]
+        # 1 秒层级只保留最近 5 个桶（加上当前桶），更早的范围自动使用 10 秒层级
+        fine = history.query(1095.0)
+        assert fine["resolution"] == 1 and fine["gpus"]["0"]["timestamp"] == [1095.0, 1096.0, 1097.0, 1098.0, 1099.0]
+        assert history.query(1000.0)["resolution"] == 10
+        assert len(history.query(0.0, resolution=10)["gpus"]["0"]["timestamp"]) == 6
+    
+    def test_history_api_lists_launches(self, mocker):
+        """/api/gpu-history returns the sampled series and launches in the range."""
+        telemetry = GPUTelemetry(backend_factory=lambda: FakeGPUBackend([self.GPU]))
+        mocker.patch.object(vllm_server, 'gpu_telemetry', telemetry)
+        telemetry.sample()
+        vllm_server.startup_history.record("big-batch", {"startedAt": datetime.now().isoformat()},
+                                           {"gpuMemoryUtilization": "0.95", "maxNumSeqs": "512"})
+        data = vllm_server.app.test_client().get("/api/gpu-history?window=60").get_json()
+        assert data["resolution"] == 1
+        assert data["gpus"]["0"]["memory_used_max"] == [100.0]
+        assert data["launches"][0]["scheme"] == "big-batch"
+        assert data["launches"][0]["config"]["maxNumSeqs"] == "512"
+    
+    def test_smi_stream_keeps_latest_per_device(self):
+        """A looping nvidia-smi stream is parsed into the latest row of each GPU."""
+        script = ("import time\n"
+                  "for u in range(3):\n"
+                  "    print(f'0, A, 1, 2, {u}, 40, 30.00, 0'); print(f'1, B, 1, 2, {u + 10}, 41, [N/A], [N/A]')\n"
+                  "time.sleep(5)\n")
+        backend = SmiStreamGPUBackend(command=[sys.executable, "-u", "-c", script])
+        try:
+            assert backend.sample() is None
+            assert TestSupervisor._wait(lambda: [g["utilization"] for g in backend.sample() or []] == ["2", "12"])
+            gpus = backend.sample()
+        finally:
+            backend.close()
+        assert gpus[1] == {"name": "B", "memory_used": "1", "memory_total": "2", "utilization": "12",
+                                       "temperature": "41", "power": "[N/A]", "fan_speed": "[N/A]"}
+        silent = SmiStreamGPUBackend(command=[sys.executable, "-c", "pass"])
+        silent.sample()
+        assert TestSupervisor._wait(lambda: silent._process.poll() is not None)
+        with pytest.raises(RuntimeError):
+            silent.sample()
+
+
+
+# nvitop -o 的输出（两张卡，vLLM 张量并行的两个 worker 和一个桌面进程）
+NVITOP_OUTPUT = """\
+Thu Oct 16 23:40:12 2025
+╒═════════════════════════════════════════════════════════════════════════════╕
+│ NVITOP 1.4.2      Driver Version: 550.54.14      CUDA Driver Version: 12.4  │
+├───────────────────────────────┬──────────────────────┬──────────────────────┤
+│ GPU  Name        Persistence-M│ Bus-Id        Disp.A │ Volatile Uncorr. ECC │
+│ Fan  Temp  Perf  Pwr:Usage/Cap│         Memory-Usage │ GPU-Util  Compute M. │
+╞═══════════════════════════════╪══════════════════════╪══════════════════════╡
+│   0  GeForce RTX 4090     Off │ 00000000:01:00.0 Off │                  N/A │
+│ 30%   52C   P2   180W / 450W  │  21.52GiB / 23.99GiB │     97%      Default │
+├───────────────────────────────┼──────────────────────┼──────────────────────┤
+│   1  GeForce RTX 4090     Off │ 00000000:02:00.0 Off │                  N/A │
+│ 30%   50C   P2   175W / 450W  │  21.40GiB / 23.99GiB │     95%      Default │
+╘═══════════════════════════════╧══════════════════════╧══════════════════════╛
+╒═════════════════════════════════════════════════════════════════════════════╕
+│ Processes:                                                     alice@server │
+│ GPU     PID      USER  GPU-MEM %SM  %CPU  %MEM      TIME  COMMAND           │
+╞═════════════════════════════════════════════════════════════════════════════╡
+│   0  104211 C   alice 21.02GiB  97 102.4   4.1   2:03:04  VLLM::Worker_TP0  │
+│   0    2215 G    root  320MiB    0   0.3   0.1  3-01:12:09  /usr/lib/xorg/Xo│
+│   1  104212 C   alice 21.00GiB  95  99.8   4.0   2:03:04  VLLM::Worker_TP1  │
+╘═════════════════════════════════════════════════════════════════════════════╛
+"""
+
+# nvidia-smi 在 WSL 上的进程表（WDDM 下每个进程的显存为 N/A）
+NVIDIA_SMI_OUTPUT = """\
++-----------------------------------------------------------------------------------------+
+| Processes:                                                                              |
+|  GPU   GI   CI        PID   Type   Process name                              GPU Memory |
+|        ID   ID                                                               Usage      |
+|=========================================================================================|
+|    0   N/A  N/A     104211      C   /python3.12                                 N/A      |
+|    0   N/A  N/A      20480      C   python3                                   7840MiB |
++-----------------------------------------------------------------------------------------+
+"""
+
+
+class TestGPUProcessMonitor:
+    """Test structured GPU process snapshots parsed from nvitop/nvidia-smi output."""
+    
+    def test_parses_nvitop_processes(self):
+        """Process rows are parsed; GPU table and header rows are ignored."""
+        processes = parse_gpu_processes(NVITOP_OUTPUT)
+        assert list(processes) == ["0:104211", "0:2215", "1:104212"]
+        assert processes["0:104211"] == {"gpu": 0, "pid": 104211, "type": "C", "user": "alice",
+                                         "memory": 21524.5, "command": "VLLM::Worker_TP0"}
+        assert processes["0:2215"]["memory"] == 320.0
+        assert processes["0:2215"]["command"] == "/usr/lib/xorg/Xo"
+    
+    def test_parses_nvidia_smi_processes(self):
+        """nvidia-smi rows with GI/CI columns and N/A memory are parsed."""
+        processes = parse_gpu_processes(NVIDIA_SMI_OUTPUT)
+        assert processes["0:104211"]["memory"] is None
+        assert processes["0:104211"]["command"] == "/python3.12"
+        assert processes["0:20480"]["memory"] == 7840.0
+        assert parse_gpu_processes("|    1      4242      C   python     512MiB |")["1:4242"]["memory"] == 512.0
+    
+    def test_pushes_bounded_diffs(self):
+        """Rounds are coalesced into one event per change with upserts and removals."""
+        socketio = MagicMock()
+        monitor = GPUProcessMonitor(socketio)
+        first = monitor.update(NVITOP_OUTPUT)
+        assert len(first["upsert"]) == 3 and first["removed"] == []
+        assert monitor.update(NVITOP_OUTPUT) is None
+        # 一个 worker 的显存增长，桌面进程退出
+        changed = "".join(line for line in NVITOP_OUTPUT.splitlines(keepends=True) if "2215" not in line)
+        diff = monitor.update(changed.replace("21.00GiB", "22.00GiB"))
+        assert [p["pid"] for p in diff["upsert"]] == [104212]
+        assert diff["removed"] == ["0:2215"]
+        assert socketio.emit.call_count == 2
+        assert [p["pid"] for p in monitor.snapshot()] == [104211, 104212]
+    
+    def test_thread_samples_at_fixed_rate(self):
+        """The sampler thread runs the command once per interval and only emits changes."""
+        socketio = MagicMock()
+        calls = []
+        monitor = GPUProcessMonitor(socketio, runner=lambda cmd: calls.append(cmd) or NVITOP_OUTPUT, interval=0.05)
+        assert monitor.start(["nvitop", "-o"]) is True
+        assert monitor.start(["nvitop", "-o"]) is False
+        try:
+            assert TestSupervisor._wait(lambda: len(calls) >= 4)
+        finally:
+            assert monitor.stop() is True
+        assert calls[0] == ["nvitop", "-o"]
+        assert socketio.emit.call_count == 1
+        client_data = vllm_server.app.test_client().get("/api/gpu-processes").get_json()
+        assert client_data["status"] == "ok"
+    
+    def test_native_process_table_replaces_nvitop(self):
+        """With a native (NVML) table no command is spawned; WSL and missing NVML fall back to the command."""
+        table = {"0:42": {"gpu": 0, "pid": 42, "type": "C", "user": "alice", "memory": 512.0, "command": "vllm"}}
+        for native, command, spawned in ((lambda: table, ["nvitop", "-o"], False),
+                                         (lambda: None, ["nvitop", "-o"], True),
+                                         (lambda: table, ["wsl", "nvitop", "-o"], True)):
+            calls = []
+            monitor = GPUProcessMonitor(MagicMock(), runner=lambda cmd: calls.append(cmd) or NVITOP_OUTPUT,
+                                        interval=0.01, native=native)
+            monitor.start(command)
+            try:
+                assert TestSupervisor._wait(lambda: monitor.snapshot())
+                time.sleep(0.05)
+            finally:
+                monitor.stop()
+            assert bool(calls) is spawned
+            assert [p["pid"] for p in monitor.snapshot()] == ([2215, 104211, 104212] if spawned else [42])
+    
+    def test_nvml_backend_lists_processes(self, mocker):
+        """NvmlGPUBackend reads compute and graphics processes and fills user/command from /proc."""
+        class NVMLError(Exception):
+            pass
+        me = os.getpid()
+        fake = types.SimpleNamespace(
+            NVMLError=NVMLError, nvmlInit=lambda: None, nvmlDeviceGetCount=lambda: 2,
+            nvmlDeviceGetHandleByIndex=lambda i: i,
+            nvmlDeviceGetComputeRunningProcesses=lambda h: [types.SimpleNamespace(pid=me, usedGpuMemory=2 ** 30)] if h == 0 else [],
+            nvmlDeviceGetGraphicsRunningProcesses=lambda h: [types.SimpleNamespace(pid=me, usedGpuMemory=None),
+                                                             types.SimpleNamespace(pid=999999999, usedGpuMemory=None)],
+            nvmlSystemGetProcessName=lambda pid: b"Xorg")
+        mocker.patch.dict(sys.modules, {"pynvml": fake})
+        processes = vllm_server.NvmlGPUBackend().processes()
+        assert sorted(processes) == ["0:%d" % me, "0:999999999", "1:%d" % me, "1:999999999"]
+        assert processes[f"0:{me}"]["type"] == "C+G" and processes[f"0:{me}"]["memory"] == 1024.0
+        assert "python" in processes[f"0:{me}"]["command"] and processes[f"0:{me}"]["user"]
+        assert processes["1:999999999"] == {"gpu": 1, "pid": 999999999, "type": "G", "user": None,
+                                           "memory": None, "command": "Xorg"}
+
+
+class TestEventHub:
+    """Test the per-client bounded Socket.IO fan-out."""
+    
+    @staticmethod
+    def _hub(acking=()):
+        sent = {}
+        
+        def send(sid, items, ack):
+            sent.setdefault(sid, []).append(items)
+            if sid in acking:
+                ack()
+        return EventHub(send=send), sent
+    
+    @staticmethod
+    def _log_batch(start, count=50, instance=None):
+        payload = {"logs": [{"level": "info", "message": f"line {i}"} for i in range(start, start + count)],
+                   "offset": start + count}
+        if instance:
+            payload["instance"] = instance
+        return payload
+    
+    def test_slow_client_stays_bounded(self, mocker):
+        """A client that never acks keeps bounded pending data while a fast one gets everything."""
+        hub, sent = self._hub(acking={"fast"})
+        hub.connect("fast")
+        hub.connect("slow")
+        for start in range(0, 100000, 50):
+            hub.emit("log_batch", self._log_batch(start))
+            hub.emit("metrics", {"engine": "0", "timestamp": start})
+            hub.emit("status", {"running": True})
+            if start % 1000 == 0:
+                hub.flush()
+        hub.flush()
+        
+        fast = [e for items in sent["fast"] for e in items]
+        assert sum(len(p["logs"]) for e, p in fast if e == "log_batch") == 100000
+        assert sum(e == "metrics" for e, p in fast) == 2000
+        stats = hub.stats()["slow"]
+        assert len(sent["slow"]) == vllm_server.SOCKET_MAX_IN_FLIGHT
+        assert stats["pending"] <= vllm_server.SOCKET_QUEUE_MAX
+        assert stats["logLines"] == vllm_server.SOCKET_LOG_BACKLOG
+        assert stats["dropped"] > 0
+        
+        # 确认超时后发送积累的批次：日志只剩最新的部分并标记 gap，状态只保留最新一条
+        mocker.patch.object(vllm_server, 'SOCKET_ACK_TIMEOUT', -1.0)
+        hub.flush()
+        last = sent["slow"][-1]
+        logs = [p for e, p in last if e == "log_batch"]
+        assert len(logs) == 1 and logs[0]["gap"] is True and logs[0]["offset"] == 100000
+        assert logs[0]["logs"][-1]["message"] == "line 99999"
+        assert sum(e == "status" for e, p in last) == 1
+
+    def test_overflow_never_evicts_log_batch(self):
+        """Queue overflow drops the oldest other events, never the merged log batch."""
+        channel = vllm_server.ClientChannel("slow")
+        channel.put("log_batch", self._log_batch(0, 5))
+        for i in range(vllm_server.SOCKET_QUEUE_MAX + 10):
+            channel.put("metrics", {"engine": "0", "timestamp": i})
+        items = channel.take(1, 0.0)
+        assert len(items) == vllm_server.SOCKET_QUEUE_MAX and channel.dropped == 11
+        assert items[0] == ["log_batch", self._log_batch(0, 5)]
+        assert items[1][1]["timestamp"] == 11
+
+    def test_rooms_and_instances(self):
+        """Clients only get rooms and instances they subscribed to; gpu events are global."""
+        hub, sent = self._hub()
+        hub.connect("a")
+        hub.connect("b")
+        hub.subscribe("b", instance="b")
+        hub.subscribe("a", rooms=["status", "gpu"])
+        hub.emit("log_batch", self._log_batch(0, 1))
+        hub.emit("log_batch", self._log_batch(0, 1, instance="b"))
+        hub.emit("status", {"running": True, "instance": "b"})
+        hub.emit("gpu", {"status": "ok", "gpus": []})
+        hub.emit("status", {"running": False}, to="a")
+        hub.flush()
+        assert [e for e, p in sent["a"][0]] == ["gpu", "status"]
+        assert [(e, p.get("instance")) for e, p in sent["b"][0]] == [("log_batch", "b"), ("status", "b"), ("gpu", None)]
+    
+    def test_merges_gpu_process_diffs(self):
+        """Pending gpu_processes diffs are merged so no change is lost."""
+        hub, sent = self._hub()
+        hub.connect("a")
+        proc = {"gpu": 0, "pid": 1, "memory": 10.0}
+        hub.emit("gpu_processes", {"upsert": [proc, {"gpu": 0, "pid": 2, "memory": 1.0}], "removed": []})
+        hub.emit("gpu_processes", {"upsert": [{**proc, "memory": 20.0}], "removed": ["0:2", "0:3"]})
+        hub.flush()
+        (event, diff), = sent["a"][0]
+        assert diff == {"upsert": [{**proc, "memory": 20.0}], "removed": ["0:2", "0:3"]}
+    
+    def test_socketio_clients_receive_batches(self):
+        """Connected Socket.IO clients get batched events and can subscribe."""
+        client = vllm_server.socketio.test_client(vllm_server.app)
+        try:
+            assert client.emit("subscribe", {"instance": "b"}, callback=True) == {"success": True}
+            assert client.emit("subscribe", {"instance": "../x"}, callback=True)["success"] is False
+            vllm_server.event_hub.flush()
+            received = client.get_received()
+            assert received[0]["name"] == "batch"
+            assert ["status", {"running": False}] in received[0]["args"][0]
+        finally:
+            client.disconnect()
+
+
+class TestCondaDiscovery:
+    """Test the cached conda path discovery."""
+    
+    def test_probes_once_and_serves_from_cache(self, tmp_path):
+        """Repeated get() calls reuse the first probe result."""
+        calls = []
+        discovery = CondaDiscovery(lambda: calls.append(1) or str(tmp_path), lambda p: [p])
+        discovery.start()
+        assert discovery.get(timeout=5) == str(tmp_path)
+        for _ in range(100):
+            assert discovery.get() == str(tmp_path)
+        assert len(calls) == 1
+    
+    def test_reprobes_when_watched_dir_changes(self, tmp_path, mocker):
+        """A changed mtime triggers a background re-probe; the old value is served meanwhile."""
+        mocker.patch.object(vllm_server, 'CONDA_CHECK_INTERVAL', 0)
+        results = iter(["/first", "/second"])
+        discovery = CondaDiscovery(lambda: next(results), lambda p: [str(tmp_path)])
+        assert discovery.get(timeout=5) == "/first"
+        (tmp_path / "envs").mkdir()
+        os.utime(tmp_path, ns=(0, 1))
+        assert discovery.get() == "/first"
+        deadline = time.time() + 5
+        while discovery.get() != "/second" and time.time() < deadline:
+            time.sleep(0.01)
+        assert discovery.get() == "/second"
+    
+    def test_watch_paths_skip_home_directory(self, tmp_path):
+        """Only the install, its envs/profile.d and the candidate install dirs are watched, never ~ itself."""
+        paths = vllm_server._conda_watch_paths(str(tmp_path))
+        assert paths[:3] == [str(tmp_path), str(tmp_path / "envs"), str(tmp_path / "etc" / "profile.d")]
+        assert os.path.expanduser("~/miniconda3") in paths and "/opt/conda" in paths
+        assert os.path.expanduser("~") not in paths and "/opt" not in paths and "/usr/local" not in paths
+    
+    def test_probe_error_is_raised_and_retried(self):
+        """A failed first probe raises; the next call probes again."""
+        attempts = []
+        
+        def probe():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise FileNotFoundError("wsl command not found")
+            return "/opt/conda"
+        
+        discovery = CondaDiscovery(probe)
+        with pytest.raises(FileNotFoundError):
+            discovery.get(timeout=5)
+        assert discovery.get(timeout=5) == "/opt/conda"
+    
+    def test_parallel_probes_keep_priority(self):
+        """The first method in order wins even if a later one finishes sooner."""
+        def slow():
+            time.sleep(0.2)
+            return "/slow", "first"
+        
+        start = time.monotonic()
+        path = vllm_server._run_probes([slow, lambda: None, lambda: ("/fast", "third")])
+        assert path == "/slow"
+        assert time.monotonic() - start < 1
+
+
+
+WSL_MOUNTS = (
+    "none /mnt/wsl tmpfs rw,relatime 0 0\n"
+    "C:\\134 /mnt/c 9p rw,noatime,aname=drvfs;path=C:\\;uid=1000 0 0\n"
+    "I:\\134 /mnt/AI-Acer4T 9p rw,noatime,aname=drvfs;path=I:\\;uid=1000 0 0\n"
+    "drvfs /mnt/my\\040disk 9p rw,noatime,aname=drvfs;path=E:\\;uid=1000 0 0\n"
+)
+
+
+class TestMountResolver:
+    """Test MountResolver built from a /proc/mounts snapshot."""
+    
+    def test_resolves_without_filesystem_access(self, mocker):
+        """Mounted drives and drive letters resolve from the table alone."""
+        mocker.patch('os.path.exists', side_effect=AssertionError("filesystem access"))
+        mocker.patch('os.listdir', side_effect=AssertionError("filesystem access"))
+        resolver = MountResolver(lambda: WSL_MOUNTS)
+        assert resolver.resolve("/mnt/c/models/llama") == "/mnt/c/models/llama"
+        assert resolver.resolve("/mnt/i/AI-Chat/models/llama") == "/mnt/AI-Acer4T/AI-Chat/models/llama"
+        assert resolver.resolve("/mnt/e/x") == "/mnt/my disk/x"
+        assert resolver.resolve("/mnt/z/x") is None
+    
+    def test_normalize_uses_resolver_first(self, mocker):
+        """_normalize_wsl_path needs no exists() calls when the table knows the drive."""
+        mocker.patch.object(vllm_server, 'mount_resolver', MountResolver(lambda: WSL_MOUNTS))
+        exists = mocker.patch('os.path.exists', return_value=False)
+        assert _normalize_wsl_path("/mnt/i/AI-Chat/models/llama") == "/mnt/AI-Acer4T/AI-Chat/models/llama"
+        assert not exists.called
+    
+    def test_invalidates_when_table_changes(self, mocker):
+        """A changed mount table clears cached prefixes."""
+        mocker.patch.object(vllm_server, 'MOUNT_CHECK_INTERVAL', 0)
+        table = {"value": ""}
+        resolver = MountResolver(lambda: table["value"])
+        assert resolver.resolve("/mnt/i/model") is None
+        table["value"] = WSL_MOUNTS
+        assert resolver.resolve("/mnt/i/model") == "/mnt/AI-Acer4T/model"
+    
+    def test_launch_cache_follows_mount_table(self, mocker):
+        """A cached launch is rebuilt when the mount table maps the drive elsewhere."""
+        mocker.patch.object(vllm_server, 'MOUNT_CHECK_INTERVAL', 0)
+        table = {"value": WSL_MOUNTS}
+        mocker.patch.object(vllm_server, 'mount_resolver', MountResolver(lambda: table["value"]))
+        controller = VLLMController(MagicMock())
+        config = {"envType": "linux", "modelPath": "/mnt/i/models/m", "condaPath": "/opt/conda"}
+        first = controller.build_launch(config)
+        assert first.argv[2] == "/mnt/AI-Acer4T/models/m"
+        assert controller.build_launch(config) is first
+        table["value"] = WSL_MOUNTS.replace("AI-Acer4T", "NewDisk")
+        assert controller.build_launch(config).argv[2] == "/mnt/NewDisk/models/m"
+    
+    def test_reads_table_at_most_once_per_interval(self):
+        """Repeated lookups reuse the table and the LRU."""
+        reads = []
+        resolver = MountResolver(lambda: reads.append(1) or WSL_MOUNTS, cache_size=2)
+        for _ in range(100):
+            resolver.resolve("/mnt/c/a")
+            resolver.resolve("/mnt/i/b")
+            resolver.resolve("/mnt/e/c")
+        assert len(reads) == 1
+        assert len(resolver._cache) == 2
+
+
+REPO_SCHEMES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vllm_schemes.json")
+
+
+class TestSchemeRepository:
+    """Test SchemeRepository indexes and atomic writes."""
+    
+    def test_loads_repository_file(self, tmp_path):
+        """The shipped vllm_schemes.json loads and is indexed by id and name."""
+        path = tmp_path / "schemes.json"
+        path.write_bytes(open(REPO_SCHEMES, "rb").read())
+        repo = SchemeRepository(str(path))
+        schemes = repo.list()
+        assert len(schemes) == len(json.load(open(REPO_SCHEMES, encoding="utf-8")))
+        first = schemes[0]
+        assert repo.get(first["id"]) is first
+        assert repo.get(str(first["id"])) is first
+        assert repo.find_by_name(first["name"]) is first
+    
+    def test_save_updates_in_place(self, tmp_path):
+        """Saving an existing name keeps its id and position."""
+        path = tmp_path / "schemes.json"
+        repo = SchemeRepository(str(path))
+        a = repo.save("a", {"port": "8000"}, "wsl")
+        repo.save("b", {}, "linux")
+        updated = repo.save("a", {"port": "9000"}, "wsl")
+        assert updated["id"] == a["id"]
+        on_disk = json.loads(path.read_text(encoding="utf-8"))
+        assert [s["name"] for s in on_disk] == ["a", "b"]
+        assert on_disk[0]["config"] == {"port": "9000"}
+        assert [p.name for p in tmp_path.iterdir()] == ["schemes.json"]
+    
+    def test_delete(self, tmp_path):
+        """Deleted schemes disappear from both indexes and the file."""
+        path = tmp_path / "schemes.json"
+        repo = SchemeRepository(str(path))
+        a = repo.save("a", {}, "wsl")
+        assert repo.delete(a["id"])["name"] == "a"
+        assert repo.delete(a["id"]) is None
+        assert repo.find_by_name("a") is None
+        assert json.loads(path.read_text(encoding="utf-8")) == []
+    
+    def test_reloads_external_edits(self, tmp_path):
+        """A hand-edited file is picked up on the next access."""
+        path = tmp_path / "schemes.json"
+        repo = SchemeRepository(str(path))
+        repo.save("a", {}, "wsl")
+        path.write_text(json.dumps([{"id": 1, "name": "edited", "config": {}, "envType": "wsl"}]),
+                        encoding="utf-8")
+        os.utime(path, ns=(0, 1))
+        assert [s["name"] for s in repo.list()] == ["edited"]
+        assert repo.find_by_name("a") is None
+    
+    def test_api_uses_repository(self, tmp_path, mocker):
+        """/api/schemes save, list and delete go through the repository."""
+        mocker.patch.object(vllm_server, 'scheme_repository', SchemeRepository(str(tmp_path / "s.json")))
+        client = vllm_server.app.test_client()
+        saved = client.post("/api/schemes", json={"scheme": {"name": "x", "config": {"port": "8000"}}}).get_json()
+        assert saved["success"] is True
+        assert [s["name"] for s in client.get("/api/schemes").get_json()["schemes"]] == ["x"]
+        assert client.delete(f"/api/schemes/{saved['scheme']['id']}").get_json()["success"] is True
+        assert client.get("/api/schemes").get_json()["schemes"] == []
+
+    def _client_with(self, tmp_path, mocker, count=5):
+        repo = SchemeRepository(str(tmp_path / "s.json"))
+        for i in range(count):
+            repo.save(f"s{i}", {"modelPath": f"/m/{i}", "customParams": [{"k": "v"}] * 10}, "wsl")
+        mocker.patch.object(vllm_server, 'scheme_repository', repo)
+        return vllm_server.app.test_client()
+    
+    def test_fields_projection(self, tmp_path, mocker):
+        """fields keeps top-level keys and nests config keys under config."""
+        client = self._client_with(tmp_path, mocker, count=2)
+        schemes = client.get("/api/schemes?fields=id,name,modelPath").get_json()["schemes"]
+        assert [set(s) for s in schemes] == [{"id", "name", "config"}] * 2
+        assert schemes[0]["config"] == {"modelPath": "/m/0"}
+    
+    def test_cursor_pagination(self, tmp_path, mocker):
+        """Following nextCursor visits every scheme exactly once."""
+        client = self._client_with(tmp_path, mocker)
+        names, cursor = [], ""
+        while True:
+            data = client.get(f"/api/schemes?fields=name&limit=2&cursor={cursor}").get_json()
+            names += [s["name"] for s in data["schemes"]]
+            cursor = data["nextCursor"]
+            if cursor is None:
+                break
+        assert names == [f"s{i}" for i in range(5)]
+        assert client.get("/api/schemes?limit=0").status_code == 400
+        assert client.get("/api/schemes?cursor=42").status_code == 400
+    
+    def test_etag_not_modified(self, tmp_path, mocker):
+        """An unchanged list answers 304; a save changes the ETag."""
+        client = self._client_with(tmp_path, mocker)
+        first = client.get("/api/schemes?fields=id,name")
+        etag = first.headers["ETag"]
+        assert not etag.startswith("W/")
+        again = client.get("/api/schemes?fields=id,name", headers={"If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.data == b""
+        assert client.get("/api/schemes", headers={"If-None-Match": etag}).status_code == 200
+        client.post("/api/schemes", json={"scheme": {"name": "new", "config": {}}})
+        assert client.get("/api/schemes?fields=id,name", headers={"If-None-Match": etag}).status_code == 200
+    
+    def test_get_single_scheme(self, tmp_path, mocker):
+        """The full config is available per scheme."""
+        client = self._client_with(tmp_path, mocker, count=1)
+        scheme_id = client.get("/api/schemes?fields=id").get_json()["schemes"][0]["id"]
+        data = client.get(f"/api/schemes/{scheme_id}").get_json()
+        assert len(data["scheme"]["config"]["customParams"]) == 10
+        assert client.get("/api/schemes/1").status_code == 404
+
+    def test_search_ranked_with_facets(self, tmp_path):
+        """Search combines text tokens (AND, prefix) with facet filters."""
+        path = tmp_path / "schemes.json"
+        path.write_bytes(open(REPO_SCHEMES, "rb").read())
+        repo = SchemeRepository(str(path))
+        hits, total = repo.search("minimax fp8", {"tp": "2"})
+        assert total == 4
+        assert hits[0][0]["name"] == "MiniMax-M2.1-FP8-INT4-AWQ-M-TP2"
+        assert all(score > 0 for _, score in hits)
+        assert [s["name"] for s, _ in repo.search("", {"quant": "NVFP4"})[0]] == [
+            "MiniMax-M2.1-NVFP4-TYW-TP2", "MiniMax-M2.1-NVFP4-TP2"]
+        assert repo.search("mini", {})[1] == 4
+        assert repo.search("minimax nosuchword", {}) == ([], 0)
+    
+    def test_search_index_follows_writes(self, tmp_path):
+        """Save and delete update the index incrementally."""
+        repo = SchemeRepository(str(tmp_path / "schemes.json"))
+        repo.save("alpha", {"modelPath": "/m/Llama-3", "tensorParallel": "2",
+                            "customParams": [{"name": "--kv-cache-dtype fp8", "value": ""}]}, "linux")
+        assert [s["name"] for s, _ in repo.search("llama", {"kv": "fp8", "env": "linux"})[0]] == ["alpha"]
+        assert repo.search("tp2", {})[1] == 1
+        repo.save("alpha", {"modelPath": "/m/Qwen3"}, "linux")
+        assert repo.search("llama", {})[1] == 0
+        assert repo.search("qwen3", {})[1] == 1
+        repo.delete(repo.find_by_name("alpha")["id"])
+        assert repo.search("qwen3", {})[1] == 0
+    
+    def test_search_api(self, tmp_path, mocker):
+        """/api/schemes/search returns scored, projected results."""
+        client = self._client_with(tmp_path, mocker)
+        data = client.get("/api/schemes/search?q=s3&fields=id,name&limit=3").get_json()
+        assert data["total"] == 1
+        assert set(data["results"][0]) == {"score", "scheme"}
+        assert data["results"][0]["scheme"]["name"] == "s3"
+        assert client.get("/api/schemes/search?q=s&limit=999").status_code == 400
+
+
+BASH = ["bash", "--noprofile", "--norc"]
+
+
+class TestWSLShell:
+    """Test the framed WSL probe session against plain bash."""
+    
+    def setup_method(self):
+        self.shell = WSLShell(BASH, timeout=5)
+    
+    def teardown_method(self):
+        self.shell.close()
+    
+    def test_batch_returns_codes_and_output(self, tmp_path):
+        """Several probes run in one round trip and keep their order."""
+        (tmp_path / "activate").write_text("")
+        results = self.shell.run_batch([
+            f"test -f {tmp_path}/activate",
+            f"test -f {tmp_path}/missing",
+            "echo 中文路径; echo second",
+            "printf 'no newline'",
+            "echo err >&2; exit 3",
+        ])
+        assert results == [(0, ""), (1, ""), (0, "中文路径\nsecond"), (0, "no newline"), (3, "")]
+    
+    def test_session_is_reused(self):
+        """Consecutive batches talk to the same process."""
+        first = self.shell.run("echo $$")
+        second = self.shell.run("echo $$")
+        assert first == second
+    
+    def test_probe_cannot_read_protocol_stream(self):
+        """Commands get /dev/null as stdin, so they cannot swallow later frames."""
+        assert self.shell.run_batch(["cat", "echo after"]) == [(0, ""), (0, "after")]
+    
+    def test_recovers_after_timeout(self):
+        """A hung probe raises and the next call starts a fresh session."""
+        self.shell.timeout = 0.3
+        with pytest.raises(TimeoutError):
+            self.shell.run("sleep 5")
+        self.shell.timeout = 5
+        assert self.shell.run("echo ok") == (0, "ok")
+    
+    def test_recovers_after_exit(self):
+        """The session restarts when the shell itself exits."""
+        with pytest.raises(RuntimeError):
+            self.shell.run_batch(["kill -9 $$", "echo never"])
+        assert self.shell.run("echo ok") == (0, "ok")
+    
+    def test_conda_probe_uses_shared_session(self, tmp_path, mocker):
+        """WSL conda discovery finds $HOME/miniconda3 through the session."""
+        (tmp_path / "miniconda3" / "bin").mkdir(parents=True)
+        (tmp_path / "miniconda3" / "bin" / "activate").write_text("")
+        shell = WSLShell(["env", f"HOME={tmp_path}", "USER=nobody-here", "PATH=/usr/bin:/bin", *BASH])
+        mocker.patch('vllm_server._wsl_command_exists', return_value=True)
+        mocker.patch('vllm_server.wsl_shell', return_value=shell)
+        try:
+            assert vllm_server._probe_conda_path_in_wsl() == str(tmp_path / "miniconda3")
+        finally:
+            shell.close()
+
+
+
+class TestStartupProfiler:
+    """Test launch-to-ready phase tracking."""
+    
+    def test_phases_from_repository_log(self):
+        """Milestones are found in a real vLLM startup from logs.txt."""
+        repo_log = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs.txt")
+        with open(repo_log, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        start = next(i for i, line in enumerate(lines) if "启动命令" in line)
+        profiler = StartupProfiler()
+        profiler.reset(0.0)
+        reached = []
+        for t, line in enumerate(lines[start + 1:]):
+            reached += profiler.feed(line, now=float(t))
+        assert reached == list(vllm_server.STARTUP_PHASES[:-1])
+        assert profiler.mark("health", now=10000.0)
+        report = profiler.report()
+        assert report["ready"] is True
+        assert abs(sum(report["phases"].values()) - report["total"]) < 1e-6
+        assert report["total"] == 10000.0
+    
+    def test_missing_milestone_folds_into_next_phase(self):
+        """Without torch.compile, its time is counted in the kv_cache phase."""
+        profiler = StartupProfiler()
+        profiler.reset(0.0)
+        profiler.feed("x", now=1.0)
+        profiler.feed("Model loading took 1 GiB", now=5.0)
+        profiler.feed("GPU KV cache size: 1 tokens", now=9.0)
+        report = profiler.report()
+        assert report["phases"] == {"activation": 1.0, "weight_loading": 4.0, "kv_cache": 4.0}
+        assert report["ready"] is False
+        assert profiler.feed("GPU KV cache size: 1 tokens", now=20.0) == []
+    
+    def test_history_tracks_config_changes(self, tmp_path):
+        """Each record lists the config keys changed since the previous start."""
+        path = str(tmp_path / "history.json")
+        history = StartupHistory(path, limit=2)
+        report = {"total": 1.0, "phases": {}}
+        history.record("s", report, {"maxModelLen": "4096", "tensorParallel": "1"})
+        history.record("s", report, {"maxModelLen": "8192", "tensorParallel": "1"})
+        history.record("s", report, {"maxModelLen": "8192", "tensorParallel": "2"})
+        records = StartupHistory(path).get("s")
+        assert len(records) == 2
+        assert [r["configChanges"] for r in records] == [["maxModelLen"], ["tensorParallel"]]
+    
+    def test_stub_server_reaches_health(self, tmp_path, mocker):
+        """A fake vllm serve with phase markers and /health is profiled end to end."""
+        import socket
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        mocker.patch.object(vllm_server, 'STARTUP_HEALTH_INTERVAL', 0.05)
+        mocker.patch.object(vllm_server, 'LOGS_FILE', str(tmp_path / "logs.txt"))
+        socketio = MagicMock()
+        default = VLLMController(socketio, log=Logger(str(tmp_path / "logs.txt")), manage_nvitop=False)
+        sup = VLLMSupervisor(socketio, default)
+        command = TestSupervisor._command(port, "--startup", "0.3", "--serve-health")
+        try:
+            assert sup.run(None, command, "linux", {"port": str(port)}, "stub") is None
+            assert TestSupervisor._wait(lambda: default.startup.done)
+        finally:
+            sup.stop_all()
+        report = default.startup.report()
+        assert report["ready"] is True
+        assert list(report["phases"]) == list(vllm_server.STARTUP_PHASES)
+        assert vllm_server.startup_history.get("stub")[-1]["ready"] is True
+        socketio.emit.assert_any_call("startup", {"phase": "health", "elapsed": report["elapsed"]["health"]})
+        client = vllm_server.app.test_client()
+        assert client.get("/api/startup/history?scheme=stub").get_json()["history"][0]["total"] == report["total"]
+
+
+class TestAutoRestart:
+    """Test health-checked auto-restart of supervised instances."""
+    
+    @pytest.fixture(autouse=True)
+    def _fast(self, mocker):
+        for name, value in (("STARTUP_HEALTH_INTERVAL", 0.05), ("HEALTH_PROBE_INTERVAL", 0.05),
+                            ("HEALTH_PROBE_TIMEOUT", 0.5), ("RESTART_BACKOFF_BASE", 0.05)):
+            mocker.patch.object(vllm_server, name, value)
+    
+    @staticmethod
+    def _port():
+        import socket
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+    
+    def _supervisor(self, tmp_path, mocker):
+        self.socketio = MagicMock()
+        mocker.patch.object(vllm_server, 'LOGS_FILE', str(tmp_path / "logs.txt"))
+        default = VLLMController(self.socketio, log=Logger(str(tmp_path / "logs.txt")), manage_nvitop=False)
+        return VLLMSupervisor(self.socketio, default)
+    
+    def test_crash_restarts_until_crash_loop(self, tmp_path, mocker):
+        """A crashed instance is restarted with backoff, recovery time is tracked, loops give up."""
+        mocker.patch.object(vllm_server, 'RESTART_MAX_CRASHES', 1)
+        sup = self._supervisor(tmp_path, mocker)
+        port = self._port()
+        command = TestSupervisor._command(port, "--serve-health", "--exit-after", "0.5", "--exit-code", "1")
+        try:
+            assert sup.run(None, command, "linux", {"port": str(port)}, auto_restart=True) is None
+            assert TestSupervisor._wait(lambda: sup.instances()[0]["crashLoop"])
+        finally:
+            sup.stop_all()
+        info = sup.instances()[0]
+        assert info["restarts"] == 1 and info["recoveries"] == 1
+        assert info["mttr"] > 0 and info["autoRestart"] is False
+        self.socketio.emit.assert_any_call("status", {"running": False, "restarting": True, "retryIn": 0.05})
+        self.socketio.emit.assert_any_call("status", {"running": False, "crashLoop": True})
+    
+    def test_hung_server_is_restarted(self, tmp_path, mocker):
+        """A live process whose /health stops answering 200 is killed and started again."""
+        mocker.patch.object(vllm_server, 'HEALTH_PROBE_FAILURES', 2)
+        sup = self._supervisor(tmp_path, mocker)
+        port = self._port()
+        command = TestSupervisor._command(port, "--serve-health", "--hang-after", "0.3")
+        controller = sup.get()
+        try:
+            assert sup.run(None, command, "linux", {"port": str(port)}, auto_restart=True) is None
+            first = controller.process.pid
+            assert TestSupervisor._wait(lambda: sup.instances()[0]["restarts"] == 1 and controller.startup.ready)
+            assert controller.process.pid != first
+        finally:
+            sup.stop_all()
+        assert "健康检查连续失败2次" in (tmp_path / "logs.txt").read_text(encoding="utf-8")
+    
+    def test_user_stop_does_not_restart(self, tmp_path, mocker):
+        """Stopping an instance turns auto-restart off instead of counting as a crash."""
+        sup = self._supervisor(tmp_path, mocker)
+        port = self._port()
+        controller = sup.get()
+        assert sup.run(None, TestSupervisor._command(port, "--serve-health"), "linux",
+                       {"port": str(port)}, auto_restart=True) is None
+        assert TestSupervisor._wait(lambda: controller.startup.ready)
+        assert sup.stop() is True
+        assert TestSupervisor._wait(lambda: controller.process is None)
+        time.sleep(0.2)
+        info = sup.instances()[0]
+        assert info["running"] is False and info["restarts"] == 0 and info["autoRestart"] is False
+
+    def test_remove_cancels_pending_restart(self, tmp_path, mocker):
+        """Removing an instance during its restart backoff drops the pending restart."""
+        mocker.patch.object(vllm_server, 'RESTART_BACKOFF_BASE', 0.5)
+        sup = self._supervisor(tmp_path, mocker)
+        port = self._port()
+        command = TestSupervisor._command(port, "--serve-health", "--exit-after", "0.3", "--exit-code", "1")
+        start = mocker.spy(sup, "_start")
+        assert sup.run("a", command, "linux", {"port": str(port)}, auto_restart=True) is None
+        state = sup._restart["a"]
+        assert TestSupervisor._wait(lambda: state.timer is not None and sup.get("a").process is None)
+        assert sup.remove("a") is True
+        assert "a" not in sup._restart and state.enabled is False and state.timer is None
+        time.sleep(0.8)
+        assert start.call_count == 1 and sup.get("a") is None
+
+    def test_startup_failure_is_not_restarted(self, tmp_path, mocker):
+        """An instance that exits before it ever became ready is left stopped."""
+        sup = self._supervisor(tmp_path, mocker)
+        port = self._port()
+        command = TestSupervisor._command(port, "--exit-after", "0.1", "--exit-code", "1")
+        start = mocker.spy(sup, "_start")
+        controller = sup.get()
+        assert sup.run(None, command, "linux", {"port": str(port)}, auto_restart=True) is None
+        assert TestSupervisor._wait(lambda: controller.process is None and not sup.instances()[0]["autoRestart"])
+        time.sleep(0.2)
+        info = sup.instances()[0]
+        assert start.call_count == 1 and info["restarts"] == 0 and info["crashLoop"] is False
+        controller.logger.flush()
+        assert "从未就绪" in (tmp_path / "logs.txt").read_text(encoding="utf-8")
+
+
+def _fake_conda(root):
+    """A conda layout whose conda.sh activation exports a hook variable and unsets another."""
+    (root / "etc" / "profile.d").mkdir(parents=True)
+    (root / "envs" / "vllm" / "conda-meta").mkdir(parents=True)
+    (root / "envs" / "vllm" / "bin").mkdir(parents=True)
+    (root / "etc" / "profile.d" / "conda.sh").write_text(
+        'conda() {\n'
+        '    [ "$1" = activate ] && [ -d "%s/envs/$2" ] || return 1\n'
+        '    export CONDA_PREFIX="%s/envs/$2" CONDA_DEFAULT_ENV="$2" MY_HOOK="a b"\n'
+        '    export PATH="$CONDA_PREFIX/bin:$PATH"\n'
+        '    unset UNSET_ME\n'
+        '}\n' % (root, root))
+    return root
+
+
+class TestCondaActivationCache:
+    """Test capturing conda activation once per env."""
+    
+    def test_captures_activation_changes(self, tmp_path, monkeypatch):
+        """Variables set, changed and removed by activation are recorded."""
+        monkeypatch.setenv("UNSET_ME", "1")
+        conda = _fake_conda(tmp_path / "conda")
+        changes = CondaActivationCache().get(str(conda), "vllm")
+        assert changes["MY_HOOK"] == "a b"
+        assert changes["CONDA_PREFIX"] == f"{conda}/envs/vllm"
+        assert changes["PATH"].startswith(f"{conda}/envs/vllm/bin:")
+        assert changes["UNSET_ME"] is None
+        assert "SHLVL" not in changes
+        assert CondaActivationCache().get(str(conda), "missing") is None
+    
+    def test_cached_until_conda_meta_changes(self, tmp_path, mocker):
+        """Installing into the env (conda-meta mtime) triggers a new capture."""
+        conda = _fake_conda(tmp_path / "conda")
+        cache = CondaActivationCache()
+        capture = mocker.spy(cache, '_capture')
+        first = cache.get(str(conda), "vllm")
+        assert cache.get(str(conda), "vllm") is first
+        assert capture.call_count == 1
+        os.utime(conda / "envs" / "vllm" / "conda-meta", ns=(0, 1))
+        cache.get(str(conda), "vllm")
+        assert capture.call_count == 2
+    
+    def test_wsl_capture_through_session(self, tmp_path):
+        """Under WSL the capture runs in the shared framed session."""
+        conda = _fake_conda(tmp_path / "conda")
+        shell = WSLShell(BASH)
+        try:
+            changes = CondaActivationCache(shell=lambda: shell).get(str(conda), "vllm", use_wsl=True)
+        finally:
+            shell.close()
+        assert changes["MY_HOOK"] == "a b"
+    
+    def test_launch_applies_captured_environment(self, tmp_path, mocker):
+        """A config launch execs vllm with the captured activation environment."""
+        conda = _fake_conda(tmp_path / "conda")
+        vllm = conda / "envs" / "vllm" / "bin" / "vllm"
+        vllm.write_text(f'#!/bin/sh\necho "hook=$MY_HOOK"\nshift\nexec "{sys.executable}" "{FAKE_VLLM}" "$@"\n')
+        vllm.chmod(0o755)
+        mocker.patch.object(vllm_server, 'conda_activation', CondaActivationCache())
+        mocker.patch.object(vllm_server, 'LOGS_FILE', str(tmp_path / "logs.txt"))
+        default = VLLMController(MagicMock(), log=Logger(str(tmp_path / "logs.txt")), manage_nvitop=False)
+        sup = VLLMSupervisor(MagicMock(), default)
+        config = {"modelPath": "/models/m", "condaPath": str(conda), "condaEnv": "vllm", "cudaDevices": ""}
+        try:
+            assert sup.run(None, "", "linux", config) is None
+            assert TestSupervisor._wait(lambda: default.engine_metrics.window())
+        finally:
+            sup.stop_all()
+        assert "hook=a b" in (tmp_path / "logs.txt").read_text(encoding="utf-8")
+    
+    def test_page_run_uses_structured_launch(self, tmp_path, mocker):
+        """The page's Run request (config only) execs vllm without a shell and with the cached activation."""
+        conda = _fake_conda(tmp_path / "conda")
+        vllm = conda / "envs" / "vllm" / "bin" / "vllm"
+        vllm.write_text(f'#!/bin/sh\necho "hook=$MY_HOOK p2p=$NCCL_P2P_DISABLE"\n'
+                        f'shift\nexec "{sys.executable}" "{FAKE_VLLM}" "$@"\n')
+        vllm.chmod(0o755)
+        cache = CondaActivationCache()
+        capture = mocker.spy(cache, '_capture')
+        mocker.patch.object(vllm_server, 'conda_activation', cache)
+        mocker.patch.object(vllm_server, 'LOGS_FILE', str(tmp_path / "logs.txt"))
+        default = VLLMController(MagicMock(), log=Logger(str(tmp_path / "logs.txt")), manage_nvitop=False)
+        mocker.patch.object(vllm_server, 'supervisor', VLLMSupervisor(MagicMock(), default))
+        quick = {"name": "export NCCL_P2P_DISABLE=1", "value": "", "isFlag": True}
+        # 与页面 getConfig() 的键名和类型一致
+        config = {"wslPath": "", "condaEnv": "vllm", "condaPath": str(conda), "envType": "linux",
+                  "cudaDevices": "", "tensorParallel": 1, "pipelineParallelSize": 1, "modelPath": "/models/m",
+                  "quantization": "", "dtype": "auto", "maxModelLen": "", "host": "0.0.0.0", "port": 8001,
+                  "gpuMemoryUtilization": 0.6, "maxNumSequences": 8, "maxNumBatchedTokens": 4096,
+                  "servedModelName": "", "chatTemplate": "", "toolCallParser": "", "reasoningParser": "",
+                  "trustRemoteCode": False, "enableExpertParallel": False, "enableAutoToolChoice": False,
+                  "asyncScheduling": False, "customParams": [], "quickParams": [quick],
+                  "exportCommands": [quick["name"]]}
+        client = vllm_server.app.test_client()
+        try:
+            response = client.post("/api/run", json={"instance": "default", "envType": "linux", "config": config})
+            assert response.get_json()["success"] is True
+            args = default.process.args
+            assert isinstance(args, list)
+            for flag, value in (("--gpu-memory-utilization", "0.6"), ("--max-num-seqs", "8"),
+                                ("--max-num-batched-tokens", "4096")):
+                assert args[args.index(flag) + 1] == value
+            assert TestSupervisor._wait(lambda: default.engine_metrics.window())
+        finally:
+            vllm_server.supervisor.stop_all()
+        assert "hook=a b p2p=1" in (tmp_path / "logs.txt").read_text(encoding="utf-8")
+        assert capture.call_count == 1
+
+
+EVENTLET_SMOKE = """
+import sys, time
+import vllm_server as v
+assert v.ASYNC_MODE == "eventlet" and v.socketio.async_mode == "eventlet"
+v.conda_discovery.start()
+v.conda_discovery.get()
+assert v.supervisor.run(None, sys.argv[1], "linux", {"port": "8001"}) is None
+deadline = time.time() + 10
+while not v.vllm_controller.engine_metrics.window() and time.time() < deadline:
+    time.sleep(0.05)
+v.supervisor.stop_all()
+start = time.time()
+v.logger.flush()
+print("flushed" if time.time() - start < 1 else "stalled", bool(v.vllm_controller.engine_metrics.window()))
+"""
+
+
+class TestAsyncMode:
+    """Test the threading / eventlet serving mode switch."""
+    
+    def test_mode_from_environment(self, monkeypatch):
+        """VLLM_GUI_ASYNC_MODE picks the mode; unknown values fall back to threading."""
+        monkeypatch.setenv("VLLM_GUI_ASYNC_MODE", "eventlet")
+        assert vllm_server._selected_async_mode() == "eventlet"
+        monkeypatch.setenv("VLLM_GUI_ASYNC_MODE", "gevent")
+        assert vllm_server._selected_async_mode() == "threading"
+        monkeypatch.delenv("VLLM_GUI_ASYNC_MODE")
+        assert vllm_server._selected_async_mode() == "threading"
+    
+    def test_command_line_overrides_environment(self, monkeypatch):
+        """--async-mode is read by the same parser the server's --help shows."""
+        monkeypatch.setattr(vllm_server, "__name__", "__main__")
+        monkeypatch.setenv("VLLM_GUI_ASYNC_MODE", "threading")
+        monkeypatch.setattr(sys, "argv", ["vllm_server.py", "--port", "5001", "--async-mode", "eventlet"])
+        assert vllm_server._selected_async_mode() == "eventlet"
+        monkeypatch.setattr(sys, "argv", ["vllm_server.py", "analyze", "logs.txt"])
+        assert vllm_server._selected_async_mode() == "threading"
+        monkeypatch.setattr(sys, "argv", ["vllm_server.py", "--async-mode", "gevent"])
+        with pytest.raises(SystemExit):
+            vllm_server._selected_async_mode()
+    
+    def test_eventlet_mode_runs_instance(self, tmp_path):
+        """Under eventlet the reader, metrics and log writer keep working alongside conda discovery."""
+        pytest.importorskip("eventlet")
+        command = TestSupervisor._command(8001, "--chatty", "20")
+        env = {**os.environ, "VLLM_GUI_ASYNC_MODE": "eventlet",
+               "PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+        result = subprocess.run([sys.executable, "-W", "ignore", "-c", EVENTLET_SMOKE, command], cwd=tmp_path,
+                                env=env, capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.split() == ["flushed", "True"]
+
+
 if __name__ == "__main__":
-    pytest.main([__file__, "-v"])
\ No newline at end of file
+    pytest.main([__file__, "-v"])
@@ -1,13 +1,56 @@
-import json
+import argparse
 import os
+import sys
+
+# 服务模式：threading（默认，每个读取线程、定时器都是系统线程）或 eventlet（协程，子进程管道
+# 以非阻塞方式读取）。eventlet 必须在导入其它模块之前打补丁，所以在这里就用 ASYNC_MODE_PARSER
+# 预先解析 --async-mode 参数（或读取 VLLM_GUI_ASYNC_MODE 环境变量）；主命令行解析器把它作为
+# parent 只为了 --help 和参数校验，模式一律以 ASYNC_MODE 为准。
+ASYNC_MODES = ("threading", "eventlet")
+ASYNC_MODE_ENV = "VLLM_GUI_ASYNC_MODE"
+ASYNC_MODE_PARSER = argparse.ArgumentParser(add_help=False)
+ASYNC_MODE_PARSER.add_argument("--async-mode", choices=ASYNC_MODES,
+                               help=f"serving mode (default: ${ASYNC_MODE_ENV} or threading)")
+
+
+def _selected_async_mode() -> str:
+    mode = os.environ.get(ASYNC_MODE_ENV, "threading")
+    if mode not in ASYNC_MODES:
+        mode = "threading"
+    if __name__ == "__main__":
+        mode = ASYNC_MODE_PARSER.parse_known_args()[0].async_mode or mode
+    return mode
+
+
+ASYNC_MODE = _selected_async_mode()
+if ASYNC_MODE == "eventlet":
+    import eventlet
+    eventlet.monkey_patch()
+
+import atexit
+import base64
+import bisect
+import codecs
+import gzip
+import hashlib
+import heapq
+import json
+import math
 import platform
+import queue
 import re
+import shlex
+import shutil
 import signal
 import subprocess
 import threading
+import time
+import urllib.request
+from array import array
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, TextIO
+from typing import Callable, Dict, List, NamedTuple, Optional, TextIO
 
 from flask import Flask, jsonify, request, send_file, send_from_directory
 from flask_socketio import SocketIO, emit
@@ -17,35 +60,853 @@ app.config["SECRET_KEY"] = "vllm_gui_secret"
 socketio = SocketIO(
     app,
     cors_allowed_origins="*",
-    async_mode="threading",
+    async_mode=ASYNC_MODE,
     ping_timeout=60,
     ping_interval=25,
 )
 
+
+def run_blocking(func: Callable, *args):
+    """执行会阻塞事件循环的 C 扩展调用（如 NVML）
+
+    eventlet 模式下放到真实的系统线程池（eventlet.tpool）中执行，期间其它请求和推送照常进行；
+    threading 模式下直接调用。func 在另一个系统线程中运行，不能记日志、推送事件或使用锁和队列。
+    """
+    if ASYNC_MODE == "eventlet":
+        from eventlet import tpool
+        return tpool.execute(func, *args)
+    return func(*args)
+
+
 IS_LINUX = platform.system() == "Linux"
 IS_WINDOWS = platform.system() == "Windows"
 
 LOGS_FILE = "logs.txt"
+LOG_MAX_BYTES = 64 * 1024 * 1024          # 单个日志段达到该大小时轮转
+LOG_MAX_TOTAL_BYTES = 1024 * 1024 * 1024  # 活动段 + 压缩归档的总大小上限
+LOG_TAIL_BLOCK = 64 * 1024                # 反向读取日志尾部时每次读取的块大小
+LOG_TAIL_MAX_SCAN = 64 * 1024 * 1024      # 按级别过滤时最多向前扫描的字节数
 SCHEMES_FILE = "vllm_schemes.json"
+SCHEME_PAGE_MAX = 500                     # /api/schemes 每页最多方案数
+STARTUP_HISTORY_FILE = "startup_history.json"
+STARTUP_HISTORY_LIMIT = 20                # 每个方案保留的启动记录数
+STARTUP_HEALTH_INTERVAL = 0.5             # 轮询 /health 的间隔（秒）
+STARTUP_TIMEOUT = 1800.0                  # 启动后超过该时间仍未就绪视为卡死
+HEALTH_PROBE_INTERVAL = 5.0               # 就绪后探测 /health、/v1/models 的间隔（秒）
+HEALTH_PROBE_TIMEOUT = 2.0                # 单次探测的超时（秒）
+HEALTH_PROBE_FAILURES = 3                 # 连续失败次数达到该值时重启
+RESTART_BACKOFF_BASE = 2.0                # 自动重启的首次等待（秒），之后每次加倍
+RESTART_BACKOFF_MAX = 60.0
+RESTART_MAX_CRASHES = 5                   # RESTART_CRASH_WINDOW 秒内超过该次数视为崩溃循环，停止重启
+RESTART_CRASH_WINDOW = 600.0
+DEFAULT_INSTANCE = "default"              # 单实例时代的唯一实例，使用 LOGS_FILE
+INSTANCE_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,32}$")
+SOCKET_QUEUE_MAX = 256                    # 每个页面待发送的消息数上限，超出时丢弃最旧的
+SOCKET_LOG_BACKLOG = 2000                 # 每个页面待发送的日志行上限，超出时丢弃最旧的行，由页面从日志文件补拉
+SOCKET_MAX_IN_FLIGHT = 2                  # 未确认的批次数上限，页面确认（ack）一批后才发送下一批
+SOCKET_ACK_TIMEOUT = 10.0                 # 超过该时间未确认的批次按丢失处理（秒）
+SOCKET_FLUSH_INTERVAL = 0.05              # 合并同一主题消息的时间窗口（秒）
 logs_lock = threading.Lock()
-schemes_lock = threading.Lock()
+
+
+# 事件所属的房间；带 instance 的事件还只发给订阅了 "instance:<id>" 的页面
+EVENT_ROOMS = {
+    "log_batch": "logs",
+    "metrics": "metrics", "access_stats": "metrics", "startup": "metrics",
+    "gpu": "gpu", "gpu_processes": "gpu",
+    "status": "status",
+}
+DEFAULT_ROOMS = frozenset(EVENT_ROOMS.values()) | {f"instance:{DEFAULT_INSTANCE}"}
+# 只需要最新值的事件，待发送时同一实例只保留最后一条
+LATEST_ONLY_EVENTS = frozenset({"status", "access_stats", "gpu"})
+
+
+def _merge_log_batch(pending: dict, payload: dict) -> dict:
+    logs = pending["logs"] + payload["logs"]
+    merged = {**payload, "logs": logs[-SOCKET_LOG_BACKLOG:]}
+    if pending.get("gap") or len(logs) > SOCKET_LOG_BACKLOG:
+        merged["gap"] = True  # 中间有日志被丢弃，页面按 offset 从日志文件补拉
+    return merged
+
+
+def _merge_gpu_processes(pending: dict, payload: dict) -> dict:
+    upsert = {f"{p['gpu']}:{p['pid']}": p for p in pending["upsert"]}
+    removed = [key for key in pending["removed"] if key not in {f"{p['gpu']}:{p['pid']}" for p in payload["upsert"]}]
+    for key in payload["removed"]:
+        upsert.pop(key, None)
+        if key not in removed:
+            removed.append(key)
+    upsert.update((f"{p['gpu']}:{p['pid']}", p) for p in payload["upsert"])
+    return {"upsert": list(upsert.values()), "removed": removed}
+
+
+MERGE_EVENTS = {"log_batch": _merge_log_batch, "gpu_processes": _merge_gpu_processes}
+
+
+class ClientChannel:
+    """一个页面的待发送消息：有界、按主题合并，等待上一批确认后再发送"""
+
+    def __init__(self, sid: str) -> None:
+        self.sid = sid
+        self.rooms = set(DEFAULT_ROOMS)
+        self.pending: "OrderedDict[object, list]" = OrderedDict()
+        self.in_flight: Dict[int, float] = {}   # 批次编号 -> 发送时刻
+        self.dropped = 0
+        self._seq = 0
+
+    def wants(self, event: str, payload: dict) -> bool:
+        room = EVENT_ROOMS.get(event)
+        if room is not None and room not in self.rooms:
+            return False
+        instance = payload.get("instance") if isinstance(payload, dict) else None
+        return room in (None, "gpu") or f"instance:{instance or DEFAULT_INSTANCE}" in self.rooms
+
+    def put(self, event: str, payload) -> None:
+        instance = payload.get("instance") if isinstance(payload, dict) else None
+        if event in LATEST_ONLY_EVENTS or event in MERGE_EVENTS:
+            key = (event, instance)
+            entry = self.pending.pop(key, None)
+            if entry is not None and event in MERGE_EVENTS:
+                payload = MERGE_EVENTS[event](entry[1], payload)
+        else:
+            self._seq += 1
+            key = self._seq
+        self.pending[key] = [event, payload]
+        while len(self.pending) > SOCKET_QUEUE_MAX:
+            # 合并类消息（log_batch、gpu_processes）每个实例只有一条且自身有界，丢弃会无声地丢数据，
+            # 只丢弃其它消息中最旧的
+            oldest = next((k for k, (e, _) in self.pending.items() if e not in MERGE_EVENTS), None)
+            if oldest is None:
+                break
+            del self.pending[oldest]
+            self.dropped += 1
+
+    def ready(self, now: float) -> bool:
+        for batch, sent in list(self.in_flight.items()):
+            if now - sent > SOCKET_ACK_TIMEOUT:
+                del self.in_flight[batch]
+        return bool(self.pending) and len(self.in_flight) < SOCKET_MAX_IN_FLIGHT
+
+    def take(self, batch: int, now: float) -> List[list]:
+        items = list(self.pending.values())
+        self.pending.clear()
+        self.in_flight[batch] = now
+        return items
+
+
+class EventHub:
+    """Socket.IO 推送的发布/订阅层
+
+    读取线程、采样线程调用 emit() 只把消息放入各页面的 ClientChannel，由一个发送线程每
+    SOCKET_FLUSH_INTERVAL 把每个页面积累的消息合并为一个 batch 事件 [[事件, 数据], ...] 发出。
+    页面确认一批后才发送下一批，处理慢或在后台的页面只会积累有界的待发送消息（日志丢弃最旧的行、
+    状态类只保留最新值），服务端内存不随其落后程度增长。页面通过 subscribe 事件选择房间
+    （logs、metrics、gpu、status 和 instance:<id>）。
+    """
+
+    def __init__(self, socketio_instance: Optional[SocketIO] = None,
+                 send: Optional[Callable[[str, list, Callable], None]] = None) -> None:
+        self._socketio = socketio_instance
+        self._send = send or self._emit_batch
+        self._channels: Dict[str, ClientChannel] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._batch = 0
+
+    def _emit_batch(self, sid: str, items: list, callback: Callable) -> None:
+        self._socketio.emit("batch", items, to=sid, callback=callback)
+
+    def connect(self, sid: str) -> None:
+        with self._cond:
+            self._channels[sid] = ClientChannel(sid)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-hub", daemon=True)
+                self._thread.start()
+
+    def disconnect(self, sid: str) -> None:
+        with self._cond:
+            self._channels.pop(sid, None)
+
+    def subscribe(self, sid: str, rooms: Optional[List[str]] = None, instance: Optional[str] = None) -> None:
+        """rooms 替换订阅的主题房间；instance 替换订阅的实例"""
+        with self._cond:
+            channel = self._channels.get(sid)
+            if channel is None:
+                return
+            if rooms is not None:
+                channel.rooms = {r for r in channel.rooms if r.startswith("instance:")} | \
+                                {r for r in rooms if r in EVENT_ROOMS.values()}
+            if instance is not None:
+                channel.rooms = {r for r in channel.rooms if not r.startswith("instance:")} | {f"instance:{instance}"}
+
+    def emit(self, event: str, payload=None, to: Optional[str] = None) -> None:
+        with self._cond:
+            if to is not None:
+                channels = [self._channels[to]] if to in self._channels else []
+            else:
+                channels = [c for c in self._channels.values() if c.wants(event, payload)]
+            for channel in channels:
+                channel.put(event, payload)
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, dict]:
+        with self._cond:
+            return {sid: {"pending": len(c.pending), "inFlight": len(c.in_flight), "dropped": c.dropped,
+                          "logLines": sum(len(p["logs"]) for e, p in c.pending.values() if e == "log_batch"),
+                          "rooms": sorted(c.rooms)}
+                    for sid, c in self._channels.items()}
+
+    def _ack(self, sid: str, batch: int) -> None:
+        with self._cond:
+            channel = self._channels.get(sid)
+            if channel is not None:
+                channel.in_flight.pop(batch, None)
+            self._cond.notify()
+
+    def flush(self) -> None:
+        """发送所有可以发送的批次"""
+        with self._cond:
+            now = time.monotonic()
+            ready = []
+            for channel in self._channels.values():
+                if channel.ready(now):
+                    self._batch += 1
+                    ready.append((channel.sid, self._batch, channel.take(self._batch, now)))
+        for sid, batch, items in ready:
+            try:
+                self._send(sid, items, lambda *args, sid=sid, batch=batch: self._ack(sid, batch))
+            except Exception:
+                self._ack(sid, batch)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait(SOCKET_FLUSH_INTERVAL)
+            # 等待一个窗口，让同一主题的消息合并
+            time.sleep(SOCKET_FLUSH_INTERVAL)
+            self.flush()
+
+
+event_hub = EventHub(socketio)
 
 
 class Logger:
-    def __init__(self, file_path: str) -> None:
+    """后台批量日志写入器
+
+    log() 只负责格式化并入队；后台线程持有长期打开的文件句柄，按行数或时间批量写盘，
+    并将同一批次的日志合并为一个 log_batch 事件推送给前端。磁盘格式与逐行写入时一致。
+
+    file_path 始终是活动段。超过 max_bytes 或跨天时活动段被重命名为
+    "<file_path>.<YYYYmmdd-HHMMSS-ffffff>"，由归档线程 gzip 压缩，并按 max_total_bytes
+    从最旧的归档开始删除。
+
+    instance 非空时 log_batch 事件带上实例id，供前端区分多个vLLM实例的日志流。
+    """
+
+    _STOP = object()  # 写入线程、归档线程的退出标记
+
+    def __init__(self, file_path: str, flush_interval: float = 0.1, flush_lines: int = 512,
+                 max_bytes: int = LOG_MAX_BYTES, max_total_bytes: int = LOG_MAX_TOTAL_BYTES,
+                 rotate_daily: bool = True, instance: Optional[str] = None) -> None:
         self.file_path = file_path
+        self.instance = instance
+        self.flush_interval = flush_interval
+        self.flush_lines = flush_lines
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.rotate_daily = rotate_daily
         self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._file: Optional[TextIO] = None
+        self._thread: Optional[threading.Thread] = None
+        self._size = 0
+        self._opened_day = None
+        self._archive_queue: "queue.Queue" = queue.Queue()
+        self._archiver: Optional[threading.Thread] = None
+
+    @property
+    def active_path(self) -> str:
+        """当前正在写入的日志段"""
+        return self.file_path
+
+    def archives(self) -> List[str]:
+        """已轮转的日志段（含尚未压缩的），按时间从旧到新排列"""
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        prefix = os.path.basename(self.file_path) + "."
+        try:
+            names = [n for n in os.listdir(directory) if n.startswith(prefix)]
+        except OSError:
+            return []
+        return [os.path.join(directory, n) for n in sorted(names)]
 
     def log(self, level: str, message: str) -> None:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         formatted = f"[{timestamp}] [{level.upper()}] {message}"
+        self._queue.put((level, formatted, timestamp))
+        if self._thread is None:
+            self._start_writer()
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """阻塞直到当前已入队的日志全部写盘并推送"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """写完已入队的日志后停止写入线程和归档线程并关闭文件（移除实例时调用）"""
+        writer = self._thread
+        if writer is not None and writer.is_alive():
+            self._queue.put(self._STOP)
+            writer.join(timeout)
+        archiver = self._archiver
+        if archiver is not None and archiver.is_alive():
+            self._archive_queue.put(self._STOP)
+            archiver.join(timeout)
+        with self._lock:
+            self._thread = self._archiver = None
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def clear(self) -> None:
+        """清空日志文件（先写完队列中的日志，再截断）"""
+        self.flush()
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            with open(self.file_path, "w", encoding="utf-8") as f:
+                f.write("")
+            self._size = 0
+
+    def _start_writer(self) -> None:
         with self._lock:
-            with open(self.file_path, "a", encoding="utf-8") as f:
-                f.write(formatted + "\n")
-        socketio.emit("log", {"level": level, "message": formatted, "timestamp": timestamp})
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def _write(self, lines: List[str]) -> int:
+        """写入一批日志，返回写入后活动段的字节偏移"""
+        data = "\n".join(lines) + "\n"
+        size = len(data.encode("utf-8"))
+        with self._lock:
+            if self._file is None:
+                self._open()
+            elif self._should_rotate(size):
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._size += size
+            return self._size
+
+    def _open(self) -> None:
+        self._file = open(self.file_path, "a", encoding="utf-8", newline="\n")
+        try:
+            stat = os.stat(self.file_path)
+            self._size = stat.st_size
+            self._opened_day = datetime.fromtimestamp(stat.st_mtime).date() if stat.st_size else datetime.now().date()
+        except OSError:
+            self._size = 0
+            self._opened_day = datetime.now().date()
+        # 服务重启时，已存在的旧段也按同样规则轮转
+        if self._size and self._should_rotate(0):
+            self._rotate()
+
+    def _should_rotate(self, incoming: int) -> bool:
+        if self._size and self.max_bytes and self._size + incoming > self.max_bytes:
+            return True
+        return self.rotate_daily and self._size > 0 and datetime.now().date() != self._opened_day
+
+    def _rotate(self) -> None:
+        """关闭活动段并重命名，压缩与清理交给归档线程（调用方持有 self._lock）"""
+        if self._file:
+            self._file.close()
+            self._file = None
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        target = f"{self.file_path}.{stamp}"
+        n = 1
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            target = f"{self.file_path}.{stamp}-{n}"
+            n += 1
+        try:
+            os.replace(self.file_path, target)
+        except OSError:
+            target = None
+        self._file = open(self.file_path, "a", encoding="utf-8", newline="\n")
+        self._size = 0
+        self._opened_day = datetime.now().date()
+        if target:
+            self._archive_queue.put(target)
+            if self._archiver is None:
+                self._archiver = threading.Thread(target=self._run_archiver, name="log-archiver", daemon=True)
+                self._archiver.start()
+
+    def _run_archiver(self) -> None:
+        while True:
+            path = self._archive_queue.get()
+            if path is self._STOP:
+                self._archive_queue.task_done()
+                return
+            try:
+                self._compress(path)
+                self._enforce_retention()
+            except Exception:
+                pass
+            finally:
+                self._archive_queue.task_done()
+
+    def _compress(self, path: str) -> None:
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.remove(path)
+
+    def _enforce_retention(self) -> None:
+        if not self.max_total_bytes:
+            return
+        budget = self.max_total_bytes - self.max_bytes
+        archives = [p for p in self.archives() if p.endswith(".gz")]
+        sizes = {}
+        for path in archives:
+            try:
+                sizes[path] = os.path.getsize(path)
+            except OSError:
+                sizes[path] = 0
+        total = sum(sizes.values())
+        for path in archives:
+            if total <= budget:
+                break
+            try:
+                os.remove(path)
+                total -= sizes[path]
+            except OSError:
+                pass
+
+    def _run(self) -> None:
+        lines: List[str] = []
+        entries: List[dict] = []
+        waiters: List[threading.Event] = []
+        deadline = None
+        stopping = False
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is self._STOP:
+                stopping = True
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not None:
+                level, formatted, timestamp = item
+                lines.append(formatted)
+                entries.append({"level": level, "message": formatted, "timestamp": timestamp})
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if not (waiters or stopping or len(lines) >= self.flush_lines
+                    or (deadline is not None and time.monotonic() >= deadline)):
+                continue
+
+            if lines:
+                offset = None
+                try:
+                    offset = self._write(lines)
+                except Exception:
+                    pass
+                payload = {"logs": entries, "offset": offset}
+                if self.instance:
+                    payload["instance"] = self.instance
+                try:
+                    event_hub.emit("log_batch", payload)
+                except Exception:
+                    pass
+            lines, entries, deadline = [], [], None
+            for waiter in waiters:
+                waiter.set()
+            waiters = []
+            if stopping:
+                return
 
 
 logger = Logger(LOGS_FILE)
+atexit.register(logger.flush)
+
+
+def _tail_log(path: str, lines: int = 500, since_offset: int = 0,
+              levels: Optional[List[str]] = None) -> tuple[List[str], int]:
+    """从文件末尾按块反向读取最后 lines 行，返回 (行列表, 文件末尾偏移)
+
+    只读取所需的尾部数据，耗时与文件大小无关。since_offset 为上次返回的偏移时只返回
+    其后新增的行；偏移超出文件大小（日志已轮转或清空）时按首次读取处理。
+    levels 按日志级别过滤（如 ["warning", "error"]），最多向前扫描 LOG_TAIL_MAX_SCAN 字节；
+    多行记录（如合并后的堆栈）的续行跟随其首行一起保留。
+    """
+    # 日志行格式: "[YYYY-mm-dd HH:MM:SS] [LEVEL] message"，级别标记固定从第21个字节开始
+    tags = tuple(f" [{lv.upper()}] ".encode("utf-8") for lv in levels) if levels else None
+    collected: List[bytes] = []
+    pending: List[bytes] = []
+
+    def take(raw: bytes) -> None:
+        nonlocal pending
+        if tags is None:
+            collected.append(raw)
+        elif raw[20:23] != b"] [":
+            # 续行，等看到所属记录的首行后再决定是否保留
+            pending.append(raw)
+        elif raw.startswith(tags, 21):
+            collected.extend(pending)
+            collected.append(raw)
+            pending = []
+        else:
+            pending = []
+
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        start_limit = since_offset if 0 < since_offset <= end else 0
+        if tags:
+            start_limit = max(start_limit, end - LOG_TAIL_MAX_SCAN)
+        pos = end
+        carry = b""
+        while len(collected) < lines:
+            if pos <= start_limit:
+                # 到达读取起点，carry 是范围内的第一行
+                if carry:
+                    take(carry)
+                break
+            step = min(LOG_TAIL_BLOCK, pos - start_limit)
+            pos -= step
+            f.seek(pos)
+            parts = (f.read(step) + carry).split(b"\n")
+            carry = parts[0]
+            for raw in reversed(parts[1:]):
+                if raw:
+                    take(raw)
+                    if len(collected) >= lines:
+                        break
+    collected.reverse()
+    return [raw.decode("utf-8", errors="replace").rstrip("\r") for raw in collected], end
+
+
+# 方案全文索引中各字段的权重（config 中的键；name 为方案名）
+SCHEME_TEXT_FIELDS = {
+    "name": 3.0,
+    "modelPath": 2.0,
+    "quantization": 2.0,
+    "servedModelName": 1.0,
+    "toolCallParser": 1.0,
+    "reasoningParser": 1.0,
+    "dtype": 1.0,
+    "condaEnv": 0.5,
+}
+SCHEME_PARAM_WEIGHT = 1.0        # customParams 的名称和值
+SCHEME_QUICK_PARAM_WEIGHT = 0.5  # quickParams（多为 export 语句）
+SCHEME_PREFIX_FACTOR = 0.5       # 前缀命中相对完整词命中的得分比例
+# /api/schemes/search 的分面过滤参数 -> 取值函数
+SCHEME_FACETS: Dict[str, Callable[[dict], object]] = {
+    "tp": lambda s: (s.get("config") or {}).get("tensorParallel"),
+    "pp": lambda s: (s.get("config") or {}).get("pipelineParallelSize"),
+    "quant": lambda s: (s.get("config") or {}).get("quantization"),
+    "dtype": lambda s: (s.get("config") or {}).get("dtype"),
+    "env": lambda s: s.get("envType") or (s.get("config") or {}).get("envType"),
+    "kv": lambda s: _scheme_kv_cache_dtype(s),
+}
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _scheme_kv_cache_dtype(scheme: dict) -> Optional[str]:
+    """从自定义参数中取 --kv-cache-dtype 的值"""
+    for param in (scheme.get("config") or {}).get("customParams") or []:
+        parts = f"{param.get('name', '')} {param.get('value', '')}".replace("=", " ").split()
+        if parts and parts[0] == "--kv-cache-dtype" and len(parts) > 1:
+            return parts[1]
+    return None
+
+
+def _tokenize(text) -> List[str]:
+    return _TOKEN_RE.findall(str(text).lower()) if text is not None else []
+
+
+def _write_json_atomic(file_path: str, data) -> None:
+    """先写同目录的临时文件再 os.replace，进程中途退出也不会留下半个文件"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    tmp_path = os.path.join(directory, f".{os.path.basename(file_path)}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+class SchemeIndex:
+    """已保存方案的倒排索引和分面索引，随方案保存/删除增量更新
+
+    文本词项来自方案名、模型路径、量化方式、解析器和自定义参数（权重见
+    SCHEME_TEXT_FIELDS），另加 tp<N>/pp<N> 词项；分面见 SCHEME_FACETS。
+    查询中的每个词都必须命中（完整词或前缀），得分为命中字段权重乘以 idf 之和。
+    """
+
+    def __init__(self) -> None:
+        self._postings: Dict[str, Dict[str, float]] = {}   # 词项 -> {方案key: 权重}
+        self._doc_terms: Dict[str, Dict[str, float]] = {}  # 方案key -> {词项: 权重}
+        self._vocab: List[str] = []                        # 已排序的词项，用于前缀查找
+        self._facets: Dict[str, Dict[str, set]] = {name: {} for name in SCHEME_FACETS}
+        self._doc_facets: Dict[str, Dict[str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    @staticmethod
+    def _terms(scheme: dict) -> Dict[str, float]:
+        config = scheme.get("config") or {}
+        weighted = [(scheme.get("name"), SCHEME_TEXT_FIELDS["name"])]
+        weighted += [(config.get(key), weight) for key, weight in SCHEME_TEXT_FIELDS.items() if key != "name"]
+        for param in config.get("customParams") or []:
+            weighted.append((f"{param.get('name', '')} {param.get('value', '')}", SCHEME_PARAM_WEIGHT))
+        for param in config.get("quickParams") or []:
+            weighted.append((f"{param.get('name', '')} {param.get('value', '')}", SCHEME_QUICK_PARAM_WEIGHT))
+        for prefix, key in (("tp", "tensorParallel"), ("pp", "pipelineParallelSize")):
+            if config.get(key) not in (None, ""):
+                weighted.append((f"{prefix}{config[key]}", 1.0))
+        terms: Dict[str, float] = {}
+        for text, weight in weighted:
+            for token in _tokenize(text):
+                terms[token] = max(terms.get(token, 0.0), weight)
+        return terms
+
+    def add(self, key: str, scheme: dict) -> None:
+        self.remove(key)
+        terms = self._terms(scheme)
+        self._doc_terms[key] = terms
+        for term, weight in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._vocab, term)
+            postings[key] = weight
+        facets = {}
+        for name, getter in SCHEME_FACETS.items():
+            value = getter(scheme)
+            if value in (None, ""):
+                continue
+            value = str(value).lower()
+            facets[name] = value
+            self._facets[name].setdefault(value, set()).add(key)
+        self._doc_facets[key] = facets
+
+    def remove(self, key: str) -> None:
+        for term in self._doc_terms.pop(key, {}):
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+                del self._vocab[bisect.bisect_left(self._vocab, term)]
+        for name, value in self._doc_facets.pop(key, {}).items():
+            keys = self._facets[name][value]
+            keys.discard(key)
+            if not keys:
+                del self._facets[name][value]
+
+    def _token_scores(self, token: str, within=None) -> Dict[str, float]:
+        """一个查询词在各方案上的得分（完整词优先，否则取最好的前缀命中）
+
+        within 不为 None 时只计算其中的方案，候选集比倒排表小时遍历候选集。
+        """
+        total = len(self._doc_terms)
+        scores: Dict[str, float] = {}
+        i = bisect.bisect_left(self._vocab, token)
+        while i < len(self._vocab) and self._vocab[i].startswith(token):
+            term = self._vocab[i]
+            postings = self._postings[term]
+            factor = math.log(1 + total / len(postings)) * (1.0 if term == token else SCHEME_PREFIX_FACTOR)
+            if within is not None and len(within) < len(postings):
+                matches = ((key, postings[key]) for key in within if key in postings)
+            else:
+                matches = postings.items() if within is None else (
+                    (key, weight) for key, weight in postings.items() if key in within)
+            for key, weight in matches:
+                score = weight * factor
+                if score > scores.get(key, 0.0):
+                    scores[key] = score
+            i += 1
+        return scores
+
+    def search(self, query: str, facets: Optional[Dict[str, str]] = None) -> List[tuple]:
+        """返回命中的 [(方案key, 得分)]（未排序）；没有查询词时只按分面过滤，得分为 0"""
+        candidates = None
+        for name, value in (facets or {}).items():
+            keys = self._facets.get(name, {}).get(str(value).lower(), set())
+            candidates = keys if candidates is None else candidates & keys
+            if not candidates:
+                return []
+        tokens = _tokenize(query)
+        if not tokens:
+            keys = self._doc_terms.keys() if candidates is None else candidates
+            return [(key, 0.0) for key in keys]
+        totals: Optional[Dict[str, float]] = None
+        for token in dict.fromkeys(tokens):
+            # 后面的词只在前面已命中的方案中计算
+            scores = self._token_scores(token, candidates if totals is None else totals)
+            totals = scores if totals is None else {key: totals[key] + score for key, score in scores.items()}
+            if not totals:
+                return []
+        return list(totals.items())
+
+
+class SchemeRepository:
+    """已保存方案的存储：内存中按 id 和名称建立索引，写入时原子替换文件
+
+    文件格式与原来相同（JSON 数组，indent=2），仍可手工编辑：每次访问前比较文件的
+    mtime 和大小，被外部修改时重新加载。写入先写同目录的临时文件再 os.replace，
+    进程中途退出也不会留下半个文件。
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        self._lock = threading.RLock()
+        self._schemes: Dict[str, dict] = {}   # str(id) -> 方案，保持文件中的顺序
+        self._by_name: Dict[str, str] = {}    # 名称 -> str(id)
+        self._stamp: Optional[tuple] = None
+        self._loaded = False
+        self._list: Optional[List[dict]] = None
+        self._positions: Dict[str, int] = {}  # str(id) -> 在 _list 中的下标，用于游标分页
+        self._index = SchemeIndex()
+
+    def _file_stamp(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _sync(self) -> None:
+        stamp = self._file_stamp()
+        if self._loaded and stamp == self._stamp:
+            return
+        schemes = []
+        if stamp is not None:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                schemes = json.load(f)
+        self._schemes = {str(s.get("id")): s for s in schemes}
+        self._by_name = {s.get("name"): key for key, s in self._schemes.items()}
+        self._index = SchemeIndex()
+        for key, scheme in self._schemes.items():
+            self._index.add(key, scheme)
+        self._stamp = stamp
+        self._loaded = True
+        self._list = None
+
+    def _write(self) -> None:
+        _write_json_atomic(self.file_path, list(self._schemes.values()))
+        self._stamp = self._file_stamp()
+        self._list = None
+
+    def list(self) -> List[dict]:
+        """全部方案（返回的列表在下次写入前保持不变，请勿修改）"""
+        with self._lock:
+            self._sync()
+            if self._list is None:
+                self._list = list(self._schemes.values())
+                self._positions = {key: i for i, key in enumerate(self._schemes)}
+            return self._list
+
+    def page(self, cursor=None, limit: Optional[int] = None) -> tuple[List[dict], Optional[str], str]:
+        """取 cursor（上一页最后一个方案的id）之后的 limit 个方案
+
+        返回 (方案列表, 下一页游标, 版本)。版本随文件内容变化，用于生成 ETag；
+        游标对应的方案已不存在时抛出 KeyError。
+        """
+        with self._lock:
+            schemes = self.list()
+            start = 0 if cursor is None else self._positions[str(cursor)] + 1
+            end = len(schemes) if limit is None else min(len(schemes), start + limit)
+            next_cursor = str(schemes[end - 1].get("id")) if end < len(schemes) else None
+            return schemes[start:end], next_cursor, self.version()
+
+    def search(self, query: str, facets: Optional[Dict[str, str]] = None,
+               limit: Optional[int] = None) -> tuple[List[tuple], int]:
+        """全文+分面检索，返回 ([(方案, 得分)], 命中总数)，得分相同时按文件中的顺序"""
+        with self._lock:
+            self.list()
+            hits = self._index.search(query, facets)
+            order = lambda hit: (-hit[1], self._positions[hit[0]])
+            top = sorted(hits, key=order) if limit is None else heapq.nsmallest(limit, hits, key=order)
+            return [(self._schemes[key], score) for key, score in top], len(hits)
+
+    def version(self) -> str:
+        """当前内容的版本标识，文件每次变化都会改变"""
+        with self._lock:
+            self._sync()
+            return "-".join(map(str, self._stamp)) if self._stamp else "empty"
+
+    def get(self, scheme_id) -> Optional[dict]:
+        with self._lock:
+            self._sync()
+            return self._schemes.get(str(scheme_id))
+
+    def find_by_name(self, name: str) -> Optional[dict]:
+        with self._lock:
+            self._sync()
+            key = self._by_name.get(name)
+            return self._schemes.get(key) if key is not None else None
+
+    def save(self, name: str, config: dict, env_type: str) -> dict:
+        """按名称新建或覆盖方案，覆盖时保留原id"""
+        with self._lock:
+            self._sync()
+            existing = self.find_by_name(name)
+            scheme_id = existing["id"] if existing else int(datetime.now().timestamp() * 1000)
+            while existing is None and str(scheme_id) in self._schemes:
+                scheme_id += 1
+            entry = {
+                "id": scheme_id,
+                "name": name,
+                "config": config,
+                "envType": env_type,
+                "createdAt": datetime.now().isoformat()
+            }
+            self._schemes[str(scheme_id)] = entry
+            self._by_name[name] = str(scheme_id)
+            self._index.add(str(scheme_id), entry)
+            self._write()
+            return entry
+
+    def delete(self, scheme_id) -> Optional[dict]:
+        """删除方案，返回被删除的方案；不存在时返回 None"""
+        with self._lock:
+            self._sync()
+            entry = self._schemes.pop(str(scheme_id), None)
+            if entry is None:
+                return None
+            if self._by_name.get(entry.get("name")) == str(scheme_id):
+                del self._by_name[entry.get("name")]
+            self._index.remove(str(scheme_id))
+            self._write()
+            return entry
+
+
+def _project_scheme(scheme: dict, fields: List[str]) -> dict:
+    """按 fields 裁剪方案：顶层字段（id、name、envType 等）原样保留，
+    其余字段视为 config 中的键，放回 config 下，保持与完整方案相同的结构"""
+    projected = {}
+    config = scheme.get("config") or {}
+    sub_config = None
+    for field in fields:
+        if field in scheme:
+            projected[field] = scheme[field]
+        else:
+            if sub_config is None:
+                sub_config = {}
+            if field in config:
+                sub_config[field] = config[field]
+    if sub_config is not None and "config" not in projected:
+        projected["config"] = sub_config
+    return projected
 
 
 def validate_config(config: dict) -> tuple[bool, str]:
@@ -71,7 +932,7 @@ def validate_config(config: dict) -> tuple[bool, str]:
     
     # 验证CUDA设备
     cuda_devices = config.get("cudaDevices", "")
-    if cuda_devices and not re.match(r'^[0-9,]+$', cuda_devices):
+    if cuda_devices and cuda_devices != "auto" and not re.match(r'^[0-9,]+$', cuda_devices):
         return False, "CUDA设备必须为数字或用逗号分隔的数字列表"
     
     # 验证张量并行大小
@@ -80,7 +941,7 @@ def validate_config(config: dict) -> tuple[bool, str]:
         return False, "张量并行大小必须在1-8之间"
     
     # 验证GPU内存利用率
-    gpu_memory_util = config.get("gpuMemoryUtil", "0.9")
+    gpu_memory_util = config.get("gpuMemoryUtilization", config.get("gpuMemoryUtil", "0.9"))
     try:
         util = float(gpu_memory_util)
         if not (0.1 <= util <= 1.0):
@@ -103,170 +964,220 @@ def validate_config(config: dict) -> tuple[bool, str]:
     return True, ""
 
 
-def _find_conda_path_in_wsl() -> str:
-    """在WSL环境中自动检测conda安装路径（通过WSL命令）"""
+WSL_SHELL_ARGV = ["wsl", "bash", "--noprofile", "--norc"]
+WSL_SHELL_TIMEOUT = 10.0       # 一批探测命令的超时（秒）
+
+
+class WSLShell:
+    """常驻的 wsl bash 会话，批量执行探测命令
+
+    在Windows上每启动一次 wsl 进程要数百毫秒，这里只启动一次，之后通过 stdin/stdout
+    用简单的分帧协议通信：每条命令在子shell中执行（stdin 为 /dev/null，丢弃 stderr），
+    结果以 "\\x1e<退出码> <字节数>\\n<输出>" 一帧返回（输出去掉末尾换行）。
+    run_batch() 一次写入多条命令，一次往返读回全部结果。超时或会话退出时关闭会话，
+    下一次调用重新启动。argv 可指向普通的 bash，便于在Linux上测试。
+    """
+
+    def __init__(self, argv: Optional[List[str]] = None, timeout: float = WSL_SHELL_TIMEOUT) -> None:
+        self.argv = argv or WSL_SHELL_ARGV
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._proc: Optional[subprocess.Popen] = None
+        self._frames: "queue.Queue" = queue.Queue()
+
+    @staticmethod
+    def _frame(command: str) -> str:
+        # ${#__o} 在 LC_ALL=C 下是字节数
+        return (f"__o=$( {{ {command}\n}} </dev/null 2>/dev/null ); __r=$?; "
+                f"__n=$(LC_ALL=C; printf %s \"${{#__o}}\"); "
+                f"printf '\\036%s %s\\n%s' \"$__r\" \"$__n\" \"$__o\"\n")
+
+    def _ensure(self) -> subprocess.Popen:
+        if self._proc is not None and self._proc.poll() is None:
+            return self._proc
+        self.close()
+        self._frames = queue.Queue()
+        self._proc = subprocess.Popen(self.argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL)
+        threading.Thread(target=self._read_frames, args=(self._proc, self._frames),
+                         name="wsl-shell", daemon=True).start()
+        return self._proc
+
+    @staticmethod
+    def _read_frames(proc: subprocess.Popen, frames: "queue.Queue") -> None:
+        try:
+            while True:
+                header = proc.stdout.readline()
+                if not header:
+                    break
+                if not header.startswith(b"\x1e"):
+                    continue  # 登录提示等非协议输出
+                code, size = header[1:].split()
+                data = proc.stdout.read(int(size))
+                frames.put((int(code), data.decode("utf-8", errors="replace")))
+        except Exception:
+            pass
+        finally:
+            frames.put(None)
+
+    def run_batch(self, commands: List[str]) -> List[tuple]:
+        """执行一批命令，按顺序返回 [(退出码, 输出), ...]"""
+        if not commands:
+            return []
+        with self._lock:
+            proc = self._ensure()
+            frames = self._frames
+            try:
+                proc.stdin.write("".join(self._frame(c) for c in commands).encode("utf-8"))
+                proc.stdin.flush()
+            except OSError:
+                self.close()
+                raise RuntimeError("WSL会话已退出")
+            results = []
+            deadline = time.monotonic() + self.timeout
+            for _ in commands:
+                try:
+                    item = frames.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    # 帧流已无法对齐，丢弃整个会话
+                    self.close()
+                    raise TimeoutError("WSL会话响应超时")
+                if item is None:
+                    self.close()
+                    raise RuntimeError("WSL会话已退出")
+                results.append(item)
+            return results
+
+    def run(self, command: str) -> tuple:
+        return self.run_batch([command])[0]
+
+    def close(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.kill()
+            proc.wait(timeout=2)
+        except Exception:
+            pass
+
+
+_wsl_shell: Optional[WSLShell] = None
+
+
+def wsl_shell() -> WSLShell:
+    """进程内共享的WSL会话"""
+    global _wsl_shell
+    if _wsl_shell is None:
+        _wsl_shell = WSLShell()
+        atexit.register(_wsl_shell.close)
+    return _wsl_shell
+
+
+CONDA_PROBE_TIMEOUT = 10.0     # 并行探测conda路径的总超时（秒）
+CONDA_CHECK_INTERVAL = 1.0     # 两次检查缓存是否失效之间的最小间隔（秒）
+CONDA_WSL_TTL = 300.0          # WSL中的目录无法直接stat，探测结果按时间过期（秒）
+
+
+def _run_probes(probes: List[Callable[[], Optional[tuple]]]) -> Optional[str]:
+    """并行执行各探测方法，按列表顺序返回第一个找到的路径
+
+    各方法原先依次执行、每个都可能等待数秒超时；并行后总耗时约等于最慢的一个。
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait
+
+    pool = ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix="conda-probe")
+    futures = [pool.submit(probe) for probe in probes]
+    wait(futures, timeout=CONDA_PROBE_TIMEOUT)
+    pool.shutdown(wait=False)
+    for future in futures:
+        if not future.done() or future.exception():
+            continue
+        found = future.result()
+        if found:
+            path, method = found
+            logger.log("info", f"从{method}自动检测到conda路径: {path}")
+            return path
+    return None
+
+
+def _probe_conda_path_in_wsl() -> str:
+    """在WSL环境中探测conda安装路径（通过WSL会话，不使用缓存）
+
+    第一轮取得各方法所需的信息（用户名、HOME、conda info --base 等），第二轮检查所有
+    候选路径的 bin/activate，两次往返后按原有方法顺序选取第一个存在的路径。
+    """
     # 首先检查wsl命令是否存在
     if not _wsl_command_exists():
         raise FileNotFoundError("wsl command not found - this function requires WSL environment")
 
-    # 首先验证用户配置的路径是否有效，如果无效则自动检测
     user_configured_path = os.environ.get("CONDA_PATH_CONFIGURED", "").strip()
-    if user_configured_path:
-        # 验证用户配置的路径
-        check_result = subprocess.run(
-            ["wsl", "test", "-f", f"{user_configured_path}/bin/activate"],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        if check_result.returncode == 0:
-            logger.log("info", f"使用用户配置的conda路径: {user_configured_path}")
-            return user_configured_path
-        else:
-            logger.log("warning", f"用户配置的conda路径无效: {user_configured_path}，尝试自动检测...")
-    
-    # 方法1: 获取WSL用户名，构造用户专属路径
-    try:
-        result = subprocess.run(
-            ["wsl", "bash", "-c", "echo $USER"],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        if result.returncode == 0 and result.stdout.strip():
-            username = result.stdout.strip()
-            # 常见用户路径格式
-            user_paths = [
-                f"/home/{username}/miniconda3",
-                f"/home/{username}/anaconda3",
-                f"/home/{username}/conda",
-            ]
-            for path in user_paths:
-                check_result = subprocess.run(
-                    ["wsl", "test", "-f", f"{path}/bin/activate"],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                if check_result.returncode == 0:
-                    logger.log("info", f"从WSL用户路径自动检测到conda路径: {path}")
-                    return path
-    except Exception:
-        pass
-    
-    # 方法2: 获取WSL用户home目录
-    try:
-        result = subprocess.run(
-            ["wsl", "bash", "-c", "echo $HOME"],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        if result.returncode == 0 and result.stdout.strip():
-            home = result.stdout.strip()
-            home_paths = [
-                f"{home}/miniconda3",
-                f"{home}/anaconda3",
-                f"{home}/conda",
-            ]
-            for path in home_paths:
-                check_result = subprocess.run(
-                    ["wsl", "test", "-f", f"{path}/bin/activate"],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                if check_result.returncode == 0:
-                    logger.log("info", f"从WSL HOME目录自动检测到conda路径: {path}")
-                    return path
-    except Exception:
-        pass
-    
-    # 方法3: 使用conda info --base命令（最准确），通过WSL执行
-    try:
-        result = subprocess.run(
-            ["wsl", "conda", "info", "--base"],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        if result.returncode == 0:
-            base_path = result.stdout.strip()
-            # 验证路径是否存在
-            check_result = subprocess.run(
-                ["wsl", "test", "-f", f"{base_path}/bin/activate"],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if check_result.returncode == 0:
-                logger.log("info", f"从WSL conda info --base自动检测到conda路径: {base_path}")
-                return base_path
-    except Exception:
-        pass
-    
-    # 方法4: 尝试使用which命令在WSL中查找
-    try:
-        result = subprocess.run(
-            ["wsl", "which", "conda"],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        if result.returncode == 0:
-            conda_exe = result.stdout.strip()
-            if "/bin/conda" in conda_exe:
-                base_path = os.path.dirname(os.path.dirname(conda_exe))
-                # 验证路径是否存在
-                check_result = subprocess.run(
-                    ["wsl", "test", "-f", f"{base_path}/bin/activate"],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                if check_result.returncode == 0:
-                    logger.log("info", f"从WSL which conda自动检测到conda路径: {base_path}")
-                    return base_path
-    except Exception:
-        pass
-    
-    # 方法5: 检查WSL环境变量
     try:
-        result = subprocess.run(
-            ["wsl", "bash", "-c", "echo $CONDA_PREFIX"],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        if result.returncode == 0 and result.stdout.strip():
-            conda_prefix = result.stdout.strip()
-            base_path = os.path.dirname(os.path.dirname(conda_prefix))
-            check_result = subprocess.run(
-                ["wsl", "test", "-f", f"{base_path}/bin/activate"],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if check_result.returncode == 0:
-                logger.log("info", f"从WSL CONDA_PREFIX自动检测到conda路径: {base_path}")
-                return base_path
+        shell = wsl_shell()
+        first = shell.run_batch([
+            f"test -f {shlex.quote(user_configured_path + '/bin/activate')}" if user_configured_path else "false",
+            "echo $USER",
+            "echo $HOME",
+            "conda info --base",
+            "command -v conda",
+            "echo $CONDA_PREFIX",
+        ])
+        # 首先验证用户配置的路径是否有效，如果无效则自动检测
+        if user_configured_path:
+            if first[0][0] == 0:
+                logger.log("info", f"使用用户配置的conda路径: {user_configured_path}")
+                return user_configured_path
+            logger.log("warning", f"用户配置的conda路径无效: {user_configured_path}，尝试自动检测...")
+        (_, username), (_, home), (info_code, info_base), (which_code, conda_exe), (_, conda_prefix) = first[1:]
+
+        candidates = []
+        # 方法1: WSL用户名构造的用户专属路径
+        if username:
+            candidates += [(f"/home/{username}/{name}", "WSL用户路径") for name in ("miniconda3", "anaconda3", "conda")]
+        # 方法2: WSL用户home目录
+        if home:
+            candidates += [(f"{home}/{name}", "WSL HOME目录") for name in ("miniconda3", "anaconda3", "conda")]
+        # 方法3: conda info --base（最准确）
+        if info_code == 0 and info_base:
+            candidates.append((info_base, "WSL conda info --base"))
+        # 方法4: which conda
+        if which_code == 0 and "/bin/conda" in conda_exe:
+            candidates.append((os.path.dirname(os.path.dirname(conda_exe)), "WSL which conda"))
+        # 方法5: WSL环境变量 CONDA_PREFIX
+        if conda_prefix:
+            candidates.append((os.path.dirname(os.path.dirname(conda_prefix)), "WSL CONDA_PREFIX"))
+
+        checks = shell.run_batch([f"test -f {shlex.quote(path + '/bin/activate')}" for path, _ in candidates])
+        for (path, method), (code, _) in zip(candidates, checks):
+            if code == 0:
+                logger.log("info", f"从{method}自动检测到conda路径: {path}")
+                return path
     except Exception:
         pass
-    
+
     # 默认返回 /root/miniconda3（常见默认安装位置）
     logger.log("warning", f"未在WSL中找到conda安装，使用默认路径: /root/miniconda3")
     return "/root/miniconda3"
 
 
-def _find_conda_path() -> str:
-    """自动检测conda安装路径"""
-    # 如果在Windows上运行且需要使用WSL，通过WSL命令检测conda路径
-    if IS_WINDOWS:
-        return _find_conda_path_in_wsl()
-    
-    # Linux/WSL原生环境下的检测逻辑
+# 常见conda安装路径
+CONDA_COMMON_PATHS = [
+    "~/miniconda3",
+    "~/anaconda3",
+    "~/conda",
+    "/opt/conda",
+    "/usr/local/conda",
+    "/home/user/miniconda3",
+    "/home/user/anaconda3",
+]
+
+
+def _local_conda_probes() -> List[Callable[[], Optional[tuple]]]:
+    def has_init(base_path: str) -> bool:
+        return os.path.exists(os.path.join(base_path, "etc", "profile.d", "conda.sh"))
+
     # 方法1: 使用conda info --base命令（最准确）
-    try:
+    def by_conda_info():
         result = subprocess.run(
             ["conda", "info", "--base"],
             capture_output=True,
@@ -275,112 +1186,371 @@ def _find_conda_path() -> str:
         )
         if result.returncode == 0:
             base_path = result.stdout.strip()
-            conda_init = os.path.join(base_path, "etc", "profile.d", "conda.sh")
-            if os.path.exists(conda_init):
-                logger.log("info", f"从conda info --base自动检测到conda路径: {base_path}")
-                return base_path
-    except Exception:
-        pass
-    
+            if has_init(base_path):
+                return base_path, "conda info --base"
+        return None
+
     # 方法2: 检查环境变量
-    conda_path = os.environ.get("CONDA_PREFIX", "")
-    if conda_path:
-        # 从CONDA_PREFIX提取基础路径
-        base_path = os.path.dirname(os.path.dirname(conda_path))
-        conda_init = os.path.join(base_path, "etc", "profile.d", "conda.sh")
-        if os.path.exists(conda_init):
-            logger.log("info", f"从CONDA_PREFIX自动检测到conda路径: {base_path}")
-            return base_path
-    
+    def by_conda_prefix():
+        conda_path = os.environ.get("CONDA_PREFIX", "")
+        if conda_path:
+            # 从CONDA_PREFIX提取基础路径
+            base_path = os.path.dirname(os.path.dirname(conda_path))
+            if has_init(base_path):
+                return base_path, "CONDA_PREFIX"
+        return None
+
     # 方法3: 检查CONDA_EXE环境变量
-    conda_exe = os.environ.get("CONDA_EXE", "")
-    if conda_exe and os.path.exists(conda_exe):
-        # 从conda可执行文件推断路径
-        if "/bin/conda" in conda_exe:
+    def by_conda_exe():
+        conda_exe = os.environ.get("CONDA_EXE", "")
+        if conda_exe and os.path.exists(conda_exe) and "/bin/conda" in conda_exe:
+            # 从conda可执行文件推断路径
             base_path = os.path.dirname(os.path.dirname(conda_exe))
-            conda_init = os.path.join(base_path, "etc", "profile.d", "conda.sh")
-            if os.path.exists(conda_init):
-                logger.log("info", f"从CONDA_EXE自动检测到conda路径: {base_path}")
-                return base_path
-    
+            if has_init(base_path):
+                return base_path, "CONDA_EXE"
+        return None
+
     # 方法4: 常见conda路径列表
-    common_paths = [
-        os.path.expanduser("~/miniconda3"),
-        os.path.expanduser("~/anaconda3"),
-        os.path.expanduser("~/conda"),
-        "/opt/conda",
-        "/usr/local/conda",
-        "/home/user/miniconda3",
-        "/home/user/anaconda3",
-    ]
-    
-    # 添加Windows WSL路径
-    if IS_WINDOWS or os.environ.get("WSL_DISTRO_NAME"):
-        # Windows用户通常通过WSL安装conda在Linux子系统中
-        common_paths.extend([
-            "/mnt/c/Users/*/miniconda3",
-            "/mnt/c/Users/*/Anaconda3",
-            "/mnt/c/ProgramData/miniconda3",
-            "/mnt/c/ProgramData/Anaconda3",
-        ])
-    
-    # 检查常见路径
-    for path in common_paths:
-        # 处理通配符路径
-        if "*" in path:
-            import glob
-            expanded_paths = glob.glob(path)
-            for expanded_path in expanded_paths:
-                conda_init = os.path.join(expanded_path, "etc", "profile.d", "conda.sh")
-                if os.path.exists(conda_init):
-                    logger.log("info", f"从通配符路径自动检测到conda路径: {expanded_path}")
-                    return expanded_path
-        else:
-            conda_init = os.path.join(path, "etc", "profile.d", "conda.sh")
-            if os.path.exists(conda_init):
-                logger.log("info", f"从常见路径自动检测到conda路径: {path}")
-                return path
-    
+    def by_common_paths():
+        common_paths = [os.path.expanduser(p) for p in CONDA_COMMON_PATHS]
+        # 添加Windows WSL路径
+        if IS_WINDOWS or os.environ.get("WSL_DISTRO_NAME"):
+            # Windows用户通常通过WSL安装conda在Linux子系统中
+            common_paths.extend([
+                "/mnt/c/Users/*/miniconda3",
+                "/mnt/c/Users/*/Anaconda3",
+                "/mnt/c/ProgramData/miniconda3",
+                "/mnt/c/ProgramData/Anaconda3",
+            ])
+        for path in common_paths:
+            # 处理通配符路径
+            if "*" in path:
+                import glob
+                for expanded_path in glob.glob(path):
+                    if has_init(expanded_path):
+                        return expanded_path, "通配符路径"
+            elif has_init(path):
+                return path, "常见路径"
+        return None
+
     # 方法5: 尝试使用which命令查找
-    try:
-        result = subprocess.run(
-            ["which", "conda"],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        if result.returncode == 0:
-            conda_exe = result.stdout.strip()
-            # 从/bin/conda推断路径
-            if "/bin/conda" in conda_exe:
-                base_path = os.path.dirname(os.path.dirname(conda_exe))
-                conda_init = os.path.join(base_path, "etc", "profile.d", "conda.sh")
-                if os.path.exists(conda_init):
-                    logger.log("info", f"从which conda自动检测到conda路径: {base_path}")
-                    return base_path
-    except Exception:
-        pass
-    
+    def by_which():
+        conda_exe = shutil.which("conda") or ""
+        # 从/bin/conda推断路径
+        if "/bin/conda" in conda_exe:
+            base_path = os.path.dirname(os.path.dirname(conda_exe))
+            if has_init(base_path):
+                return base_path, "which conda"
+        return None
+
+    return [by_conda_info, by_conda_prefix, by_conda_exe, by_common_paths, by_which]
+
+
+def _probe_conda_path() -> str:
+    """探测本机conda安装路径（不使用缓存）"""
+    path = _run_probes(_local_conda_probes())
+    if path:
+        return path
+
     # 默认返回用户主目录下的miniconda3
     default_path = os.path.expanduser("~/miniconda3")
     logger.log("warning", f"未找到conda安装，使用默认路径: {default_path}")
     return default_path
 
 
-def _wsl_command_exists() -> bool:
-    """检查wsl命令是否存在"""
-    if IS_WINDOWS:
-        return True
-    try:
-        result = subprocess.run(
-            ["which", "wsl"],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        return result.returncode == 0
+def _conda_watch_paths(base_path: str) -> List[str]:
+    """conda安装或环境发生变化时mtime会改变的目录"""
+    paths = [base_path, os.path.join(base_path, "envs"),
+             os.path.join(base_path, "etc", "profile.d")]
+    # 常见安装位置本身（不存在时记为 None，新安装后出现）；不监视 ~ 等父目录，其mtime随时在变
+    for candidate in CONDA_COMMON_PATHS:
+        candidate = os.path.expanduser(candidate)
+        if candidate not in paths:
+            paths.append(candidate)
+    return paths
+
+
+class CondaDiscovery:
+    """conda路径探测结果的缓存
+
+    start() 在后台线程中执行一次探测；get() 直接返回缓存结果，首次探测尚未完成时等待其完成。
+    watch(path) 返回需要监视的目录，其中任一目录的mtime变化（每 CONDA_CHECK_INTERVAL 秒
+    最多检查一次）或超过 ttl 秒后，下一次 get() 在后台重新探测，期间继续返回旧结果。
+    """
+
+    def __init__(self, probe: Callable[[], str], watch: Optional[Callable[[str], List[str]]] = None,
+                 ttl: Optional[float] = None) -> None:
+        self._probe = probe
+        self._watch = watch
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._path: Optional[str] = None
+        self._error: Optional[BaseException] = None
+        self._signature: tuple = ()
+        self._probed_at = 0.0
+        self._checked_at = 0.0
+
+    def _signature_of(self, path: str) -> tuple:
+        if not self._watch:
+            return ()
+        signature = []
+        for watched in self._watch(path):
+            try:
+                signature.append(os.stat(watched).st_mtime_ns)
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _run(self) -> None:
+        try:
+            path = self._probe()
+            signature = self._signature_of(path)
+            with self._lock:
+                self._path, self._error = path, None
+                self._signature = signature
+        except Exception as e:
+            with self._lock:
+                self._error = e
+        finally:
+            with self._lock:
+                self._probed_at = self._checked_at = time.monotonic()
+                self._thread = None
+                self._done.set()
+
+    def start(self) -> None:
+        """在后台开始探测（已在探测中时忽略）"""
+        with self._lock:
+            self._start_locked()
+
+    def _start_locked(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="conda-discovery", daemon=True)
+        self._thread.start()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._signature = ("invalid",)
+            self._checked_at = 0.0
+
+    def _stale(self) -> bool:
+        now = time.monotonic()
+        if self._ttl is not None and now - self._probed_at >= self._ttl:
+            return True
+        if now - self._checked_at < CONDA_CHECK_INTERVAL:
+            return False
+        self._checked_at = now
+        return self._signature_of(self._path) != self._signature
+
+    def get(self, timeout: Optional[float] = None) -> str:
+        if self._path is None:
+            # 首次使用：等待探测完成，失败时抛出探测时的异常
+            with self._lock:
+                if not self._done.is_set():
+                    self._start_locked()
+            self._done.wait(timeout)
+            with self._lock:
+                if self._path is None:
+                    error = self._error
+                    if self._thread is None:
+                        # 探测失败，下次调用重新探测
+                        self._error = None
+                        self._done.clear()
+                    raise error or TimeoutError("conda discovery timed out")
+        elif self._stale():
+            self.start()
+        return self._path
+
+
+conda_discovery = CondaDiscovery(_probe_conda_path, _conda_watch_paths)
+wsl_conda_discovery = CondaDiscovery(_probe_conda_path_in_wsl, ttl=CONDA_WSL_TTL)
+
+
+def _find_conda_path_in_wsl() -> str:
+    """在WSL环境中自动检测conda安装路径（使用缓存）"""
+    return wsl_conda_discovery.get()
+
+
+def _find_conda_path() -> str:
+    """自动检测conda安装路径（使用缓存）"""
+    # 如果在Windows上运行且需要使用WSL，通过WSL命令检测conda路径
+    if IS_WINDOWS:
+        return _find_conda_path_in_wsl()
+    return conda_discovery.get()
+
+
+def _wsl_command_exists() -> bool:
+    """检查wsl命令是否存在"""
+    if IS_WINDOWS:
+        return True
+    return shutil.which("wsl") is not None
+
+
+# 常见Windows驱动器映射
+WSL_DRIVE_MAPPINGS = [
+    ('/mnt/i/', '/mnt/AI-Acer4T/'),      # I: 驱动器
+    ('/mnt/c/', '/mnt/c/'),              # C: 驱动器（通常不变）
+    ('/mnt/d/', '/mnt/d/'),              # D: 驱动器
+    ('/mnt/e/', '/mnt/e/'),              # E: 驱动器
+]
+
+
+MOUNT_CHECK_INTERVAL = 1.0     # 两次重新读取挂载表之间的最小间隔（秒）
+MOUNT_CACHE_SIZE = 256         # 已解析的 /mnt 前缀 LRU 大小
+MOUNT_DRIVE_RE = re.compile(r"(?:^|[;,]path=)([A-Za-z]):")
+
+
+class MountResolver:
+    """由挂载表（/proc/mounts）解析 /mnt/<盘符> 前缀，无需访问文件系统
+
+    /mnt/<x> 本身是挂载点时路径保持不变；否则按挂载源中的盘符（WSL 的 drvfs/9p 挂载源或
+    path= 选项形如 "I:\\"）或 WSL_DRIVE_MAPPINGS 找到实际挂载点。结果按 /mnt 下第一级目录
+    缓存在 LRU 中；挂载表每 MOUNT_CHECK_INTERVAL 秒最多重新读取一次，内容变化时清空缓存。
+    挂载表无法判断时 resolve() 返回 None，由调用方退回逐个探测路径。
+    """
+
+    def __init__(self, read_table: Callable[[], str], cache_size: int = MOUNT_CACHE_SIZE) -> None:
+        self._read_table = read_table
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._table: Optional[str] = None
+        self._mounts: set = set()
+        self._drives: Dict[str, str] = {}
+        self._checked_at = 0.0
+        self._version = 0
+
+    @staticmethod
+    def _unescape(field: str) -> str:
+        # /proc/mounts 中空格等字符以八进制转义，如 \040
+        return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+    def _load(self, table: str) -> None:
+        self._mounts, self._drives = set(), {}
+        for line in table.splitlines():
+            fields = line.split()
+            if len(fields) < 4:
+                continue
+            source, mount_point, options = self._unescape(fields[0]), self._unescape(fields[1]), fields[3]
+            if not mount_point.startswith("/mnt/"):
+                continue
+            self._mounts.add(mount_point.rstrip("/"))
+            match = MOUNT_DRIVE_RE.search(source) or MOUNT_DRIVE_RE.search(options)
+            if match:
+                self._drives.setdefault(match.group(1).lower(), mount_point.rstrip("/"))
+        self._cache.clear()
+        self._version += 1
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < MOUNT_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            table = self._read_table()
+        except Exception:
+            table = ""
+        if table != self._table:
+            self._table = table
+            self._load(table)
+
+    def _resolve_mount(self, mount_point: str) -> Optional[str]:
+        if mount_point in self._mounts:
+            return mount_point
+        drive = mount_point[len("/mnt/"):]
+        if len(drive) == 1 and drive.lower() in self._drives:
+            return self._drives[drive.lower()]
+        for old_prefix, new_prefix in WSL_DRIVE_MAPPINGS:
+            if old_prefix.rstrip("/") == mount_point and new_prefix.rstrip("/") in self._mounts:
+                return new_prefix.rstrip("/")
+        return None
+
+    def version(self) -> int:
+        """挂载表的版本号，每次读到不同的挂载表时加一"""
+        with self._lock:
+            self._refresh()
+            return self._version
+
+    def resolve(self, path: str) -> Optional[str]:
+        """返回标准化后的路径；挂载表中没有对应挂载点时返回 None"""
+        parts = path.split("/", 3)
+        if len(parts) < 3 or parts[1] != "mnt" or not parts[2]:
+            return None
+        mount_point = "/mnt/" + parts[2]
+        with self._lock:
+            self._refresh()
+            if mount_point in self._cache:
+                self._cache.move_to_end(mount_point)
+                resolved = self._cache[mount_point]
+            else:
+                resolved = self._resolve_mount(mount_point)
+                self._cache[mount_point] = resolved
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+                if resolved and resolved != mount_point:
+                    logger.log("info", f"挂载点映射: {mount_point} -> {resolved}")
+        if resolved is None:
+            return None
+        return resolved + path[len(mount_point):]
+
+
+def _read_local_mounts() -> str:
+    with open("/proc/mounts", "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+mount_resolver = MountResolver(_read_local_mounts)
+# Windows上挂载表通过常驻WSL会话读取
+wsl_mount_resolver = MountResolver(lambda: wsl_shell().run("cat /proc/mounts")[1])
+
+
+_nvitop_checked: Dict[str, bool] = {}
+
+
+def _nvitop_available(nvitop_cmd: List[str]) -> bool:
+    """检查nvitop是否已安装
+
+    WSL中的检查复用常驻WSL会话并在后台执行，结果出来之前按已安装处理（与原来直接启动一致），
+    之后的启动直接使用缓存的结果。
+    """
+    if nvitop_cmd[0] != "wsl":
+        return shutil.which(nvitop_cmd[0]) is not None
+    if "wsl" in _nvitop_checked:
+        return _nvitop_checked["wsl"]
+
+    def check() -> None:
+        try:
+            _nvitop_checked["wsl"] = wsl_shell().run("command -v nvitop")[0] == 0
+        except FileNotFoundError:
+            _nvitop_checked["wsl"] = False
+        except Exception:
+            pass
+
+    threading.Thread(target=check, name="nvitop-check", daemon=True).start()
+    return True
+
+
+def _normalize_wsl_path_in_wsl(path: str) -> str:
+    """Windows上无法直接访问WSL的 /mnt，通过WSL会话在两次往返内完成同样的检查"""
+    try:
+        shell = wsl_shell()
+        (exists, _), (_, mounts) = shell.run_batch([f"test -e {shlex.quote(path)}", "ls -1 /mnt"])
+        if exists == 0:
+            return path
+        candidates = [path.replace(old, new, 1) for old, new in WSL_DRIVE_MAPPINGS if path.startswith(old)]
+        parts = path.split('/')
+        if len(parts) >= 3:
+            candidates += ['/'.join(parts[:2] + [mount] + parts[3:]) for mount in mounts.split()]
+        checks = shell.run_batch([f"test -e {shlex.quote(c)}" for c in candidates])
+        for candidate, (code, _) in zip(candidates, checks):
+            if code == 0:
+                logger.log("info", f"路径映射: {path} -> {candidate}")
+                return candidate
     except Exception:
-        return False
+        pass
+    return path
 
 
 def _normalize_wsl_path(path: str) -> str:
@@ -391,21 +1561,22 @@ def _normalize_wsl_path(path: str) -> str:
     """
     if not path or not path.startswith('/mnt/'):
         return path
+
+    # 常见情况：由挂载表直接得到结果，不访问文件系统
+    resolved = (wsl_mount_resolver if IS_WINDOWS else mount_resolver).resolve(path)
+    if resolved is not None:
+        return resolved
+
+    if IS_WINDOWS:
+        return _normalize_wsl_path_in_wsl(path)
     
+    # 挂载表中没有对应挂载点时逐个探测
     # 如果路径已经存在，直接返回
     if os.path.exists(path):
         return path
     
-    # 常见Windows驱动器映射
-    drive_mappings = [
-        ('/mnt/i/', '/mnt/AI-Acer4T/'),      # I: 驱动器
-        ('/mnt/c/', '/mnt/c/'),              # C: 驱动器（通常不变）
-        ('/mnt/d/', '/mnt/d/'),              # D: 驱动器
-        ('/mnt/e/', '/mnt/e/'),              # E: 驱动器
-    ]
-    
     # 检查所有映射
-    for old_prefix, new_prefix in drive_mappings:
+    for old_prefix, new_prefix in WSL_DRIVE_MAPPINGS:
         if path.startswith(old_prefix):
             # 尝试替换前缀
             new_path = path.replace(old_prefix, new_prefix, 1)
@@ -436,281 +1607,1484 @@ def _normalize_wsl_path(path: str) -> str:
     return path
 
 
-class VLLMController:
-    def __init__(self, socketio_instance: SocketIO) -> None:
-        self.process: Optional[subprocess.Popen] = None
-        self.nvitop_process: Optional[subprocess.Popen] = None
-        self.is_running = False
-        self.command_queue: List[str] = []
+# vLLM 周期性打印的引擎统计行，例如:
+# Engine 000: Avg prompt throughput: 10486.5 tokens/s, Avg generation throughput: 50.8 tokens/s,
+# Running: 0 reqs, Waiting: 0 reqs, GPU KV cache usage: 0.0%, Prefix cache hit rate: 95.8%
+ENGINE_METRICS_RE = re.compile(
+    r"Engine (\d+): Avg prompt throughput: ([\d.]+) tokens/s, "
+    r"Avg generation throughput: ([\d.]+) tokens/s, "
+    r"Running: (\d+) reqs, Waiting: (\d+) reqs, "
+    r"GPU KV cache usage: ([\d.]+)%"
+    r"(?:, Prefix cache hit rate: ([\d.]+)%)?"
+)
+ENGINE_METRICS_CAPACITY = 8640  # 每个引擎保留的样本数（10秒一个样本约为24小时）
+
+
+class EngineSample(NamedTuple):
+    engine: str
+    timestamp: float
+    prompt_throughput: float
+    generation_throughput: float
+    running: int
+    waiting: int
+    kv_cache_usage: float
+    prefix_cache_hit_rate: float
+
+
+def parse_engine_metrics(line: str, timestamp: Optional[float] = None) -> Optional[EngineSample]:
+    """解析vLLM引擎统计行，非统计行返回None"""
+    # 先用子串判断快速排除绝大多数普通日志行
+    if "throughput:" not in line:
+        return None
+    match = ENGINE_METRICS_RE.search(line)
+    if not match:
+        return None
+    engine, prompt, generation, running, waiting, kv_cache, prefix_hit = match.groups()
+    return EngineSample(
+        engine=str(int(engine)),
+        timestamp=time.time() if timestamp is None else timestamp,
+        prompt_throughput=float(prompt),
+        generation_throughput=float(generation),
+        running=int(running),
+        waiting=int(waiting),
+        kv_cache_usage=float(kv_cache),
+        prefix_cache_hit_rate=float(prefix_hit) if prefix_hit is not None else -1.0,
+    )
+
+
+class MetricsRing:
+    """定长环形缓冲区，每个字段一列 array('d')，写入O(1)且内存固定"""
+
+    def __init__(self, fields: tuple, capacity: int = ENGINE_METRICS_CAPACITY) -> None:
+        self.fields = fields
+        self.capacity = capacity
+        self._columns = {name: array("d", bytes(8 * capacity)) for name in fields}
+        self._head = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, values: tuple) -> None:
+        for name, value in zip(self.fields, values):
+            self._columns[name][self._head] = value
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _indices(self) -> range:
+        start = (self._head - self._count) % self.capacity
+        return range(start, start + self._count)
+
+    def window(self, since: float = 0.0, time_field: str = "timestamp",
+               until: Optional[float] = None) -> Dict[str, list]:
+        """按列返回时间戳在 [since, until] 内的样本（按时间从旧到新）"""
+        times = self._columns[time_field]
+        cap = self.capacity
+        indices = [i % cap for i in self._indices()]
+        # 时间戳单调递增，从最新样本往前找到窗口起点
+        first = len(indices)
+        while first > 0 and times[indices[first - 1]] >= since:
+            first -= 1
+        last = len(indices)
+        if until is not None:
+            while last > first and times[indices[last - 1]] > until:
+                last -= 1
+        indices = indices[first:last]
+        return {name: [col[i] for i in indices] for name, col in self._columns.items()}
+
+    def oldest(self, time_field: str = "timestamp") -> Optional[float]:
+        if not self._count:
+            return None
+        return self._columns[time_field][(self._head - self._count) % self.capacity]
+
+
+class EngineMetrics:
+    """按引擎保存的vLLM统计时间序列"""
+
+    FIELDS = EngineSample._fields[1:]
+
+    def __init__(self, capacity: int = ENGINE_METRICS_CAPACITY) -> None:
+        self.capacity = capacity
+        self._rings: Dict[str, MetricsRing] = {}
         self._lock = threading.Lock()
-        self._socketio = socketio_instance
-        self.env_type = "wsl"
 
-    def generate_command(self, config: dict) -> str:
-        # 验证配置参数（仅记录警告，不阻止命令生成）
-        is_valid, error_msg = validate_config(config)
-        if not is_valid:
-            logger.log("warning", f"配置验证警告（仍将生成命令）: {error_msg}")
-        
-        model_path = config.get("modelPath", "").strip()
-        # 允许空模型路径 - 命令仍将生成但可能无法运行
-        # 这是根据优化项5的要求：即使参数错误也可以生成命令
-        # 标准化WSL路径
-        model_path = _normalize_wsl_path(model_path)
-
-        wsl_path = config.get("wslPath", "wsl")
-        conda_env = config.get("condaEnv", "vllm")
-        conda_path = config.get("condaPath", "")
-        env_type = config.get("envType", "wsl")
-        host = config.get("host", "0.0.0.0")
-        port = config.get("port", "8000")
-        gpu_memory_util = config.get("gpuMemoryUtil", "0.9")
-        tensor_parallel = config.get("tensorParallel", "1")
-        pipeline_parallel = str(config.get("pipelineParallelSize", "1"))
-        max_model_len = config.get("maxModelLen", "")
-        dtype = config.get("dtype", "auto")
-        quantization = config.get("quantization", "")
-        cuda_devices = config.get("cudaDevices", "0")
-        prefix_cache = config.get("prefixCache", "")
-        if prefix_cache:
-            prefix_cache = _normalize_wsl_path(prefix_cache)
-        enable_chunked = config.get("enableChunked", False)
-        custom_all_reduce = config.get("customAllReduce", "")
-        if custom_all_reduce:
-            custom_all_reduce = _normalize_wsl_path(custom_all_reduce)
-        enable_prefix_caching = config.get("enablePrefixCaching", False)
-        max_num_seqs = config.get("maxNumSeqs", "256")
-        max_num_batched_tokens = config.get("maxNumBatchedTokens", "8192")
-        custom_params = config.get("customParams", [])
-        served_model_name = config.get("servedModelName", "")
-        chat_template = config.get("chatTemplate", "")
-        if chat_template:
-            chat_template = _normalize_wsl_path(chat_template)
-        tool_call_parser = config.get("toolCallParser", "")
-        reasoning_parser = config.get("reasoningParser", "")
-        trust_remote_code = config.get("trustRemoteCode", False)
-        enable_expert_parallel = config.get("enableExpertParallel", False)
-        enable_auto_tool_choice = config.get("enableAutoToolChoice", False)
-        async_scheduling = config.get("asyncScheduling", False)
-
-
-
-        vllm_cmd = ["--model", model_path]
-        vllm_cmd.extend(["--host", host])
-        vllm_cmd.extend(["--port", port])
-        vllm_cmd.extend(["--gpu-memory-utilization", gpu_memory_util])
-        vllm_cmd.extend(["--tensor-parallel-size", tensor_parallel])
-        
-        if pipeline_parallel and pipeline_parallel != "1":
-            vllm_cmd.extend(["--pipeline-parallel-size", pipeline_parallel])
+    def record(self, sample: EngineSample) -> None:
+        with self._lock:
+            ring = self._rings.get(sample.engine)
+            if ring is None:
+                ring = self._rings[sample.engine] = MetricsRing(self.FIELDS, self.capacity)
+            ring.append(sample[1:])
 
-        if max_model_len:
-            vllm_cmd.extend(["--max-model-len", max_model_len])
+    def window(self, seconds: Optional[float] = None, engine: Optional[str] = None) -> Dict[str, Dict[str, list]]:
+        since = time.time() - seconds if seconds else 0.0
+        with self._lock:
+            return {
+                name: ring.window(since)
+                for name, ring in self._rings.items()
+                if engine is None or name == engine
+            }
 
-        if dtype and dtype != "auto":
-            vllm_cmd.extend(["--dtype", dtype])
+    def clear(self) -> None:
+        with self._lock:
+            self._rings.clear()
 
-        if quantization:
-            vllm_cmd.extend(["--quantization", quantization])
 
-        if enable_prefix_caching:
-            vllm_cmd.append("--enable-prefix-caching")
+# uvicorn 访问日志，例如: 127.0.0.1:56244 - "POST /v1/chat/completions HTTP/1.1" 200 OK
+ACCESS_LOG_RE = re.compile(r'(\S+):\d+ - "([A-Z]+) ([^ ?"]+)[^ "]* HTTP/[\d.]+" (\d{3})')
+ACCESS_STATS_WINDOW = 60  # 滑动窗口最长秒数（每秒一个桶）
+ACCESS_TOTALS_MAX_KEYS = 256  # 累计计数每组最多保留的键数，超出的归入 ACCESS_OTHER_KEY
+ACCESS_OTHER_KEY = "<other>"
+# 路径中的编号段（纯数字、UUID/十六进制、带数字的请求ID）归一为 <id>，避免每个ID各占一个键
+ACCESS_ID_SEGMENT_RE = re.compile(r"\d+|[0-9a-fA-F-]{16,}|[A-Za-z]+[-_][A-Za-z0-9]*\d[A-Za-z0-9_-]*")
 
-        if prefix_cache:
-            vllm_cmd.extend(["--prefix-cache-dir", prefix_cache])
 
-        if enable_chunked:
-            vllm_cmd.append("--enable-chunked-prefill")
+def _endpoint_template(path: str) -> str:
+    """把 /v1/responses/resp_3f2a... 这类路径归一成 /v1/responses/<id>"""
+    return "/".join("<id>" if ACCESS_ID_SEGMENT_RE.fullmatch(part) else part for part in path.split("/"))
 
-        if custom_all_reduce:
-            vllm_cmd.extend(["--custom-all-reduce", custom_all_reduce])
 
-        vllm_cmd.extend(["--max-num-seqs", max_num_seqs])
-        vllm_cmd.extend(["--max-num-batched-tokens", max_num_batched_tokens])
+class AccessStats:
+    """vLLM访问日志的滑动窗口统计：按接口、状态码和客户端地址计数
 
-        if served_model_name:
-            vllm_cmd.extend(["--served-model-name", served_model_name])
+    每秒一个桶，共 window 个桶循环复用；记录一行只需几次字典自增。
+    """
 
-        if chat_template:
-            vllm_cmd.extend(["--chat-template", chat_template])
+    def __init__(self, window: int = ACCESS_STATS_WINDOW) -> None:
+        self.window = window
+        self._bucket_second = [-1] * window
+        self._buckets: List[Dict[str, Dict[str, int]]] = [self._empty_bucket() for _ in range(window)]
+        self.totals: Dict[str, Dict[str, int]] = {"endpoints": {}, "status": {}}
+        self._lock = threading.Lock()
 
-        if tool_call_parser:
-            vllm_cmd.extend(["--tool-call-parser", tool_call_parser])
+    @staticmethod
+    def _empty_bucket() -> Dict[str, Dict[str, int]]:
+        return {"endpoints": {}, "status": {}, "clients": {}}
 
-        if reasoning_parser:
-            vllm_cmd.extend(["--reasoning-parser", reasoning_parser])
+    def record(self, line: str, now: Optional[float] = None) -> bool:
+        """解析一行访问日志并计数，不是访问日志时返回False"""
+        if "HTTP/" not in line:
+            return False
+        match = ACCESS_LOG_RE.search(line)
+        if not match:
+            return False
+        client, method, path, status = match.groups()
+        endpoint = f"{method} {_endpoint_template(path)}"
+        second = int(time.time() if now is None else now)
+        idx = second % self.window
+        with self._lock:
+            bucket = self._buckets[idx]
+            if self._bucket_second[idx] != second:
+                bucket = self._buckets[idx] = self._empty_bucket()
+                self._bucket_second[idx] = second
+            for group, key in (("endpoints", endpoint), ("status", status), ("clients", client)):
+                counts = bucket[group]
+                counts[key] = counts.get(key, 0) + 1
+            for group, key in (("endpoints", endpoint), ("status", status)):
+                counts = self.totals[group]
+                if key not in counts and len(counts) >= ACCESS_TOTALS_MAX_KEYS:
+                    key = ACCESS_OTHER_KEY
+                counts[key] = counts.get(key, 0) + 1
+        return True
 
-        if trust_remote_code:
-            vllm_cmd.append("--trust-remote-code")
+    def rates(self, window: Optional[int] = None, now: Optional[float] = None) -> dict:
+        """最近window秒内的每秒请求数（QPS），按接口/状态码/客户端分组"""
+        window = max(1, min(int(window or self.window), self.window))
+        current = int(time.time() if now is None else now)
+        merged = self._empty_bucket()
+        total = 0
+        errors = 0
+        with self._lock:
+            for idx, second in enumerate(self._bucket_second):
+                if second < 0 or current - second >= window or second > current:
+                    continue
+                for group, counts in self._buckets[idx].items():
+                    target = merged[group]
+                    for key, count in counts.items():
+                        target[key] = target.get(key, 0) + count
+            totals = {group: dict(counts) for group, counts in self.totals.items()}
+        for status, count in merged["status"].items():
+            total += count
+            if status >= "500":
+                errors += count
+        return {
+            "window": window,
+            "rps": total / window,
+            "error_rate": errors / total if total else 0.0,
+            "endpoints": {k: v / window for k, v in merged["endpoints"].items()},
+            "status": {k: v / window for k, v in merged["status"].items()},
+            "clients": {k: v / window for k, v in merged["clients"].items()},
+            "totals": totals,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._bucket_second = [-1] * self.window
+            self._buckets = [self._empty_bucket() for _ in range(self.window)]
+            self.totals = {"endpoints": {}, "status": {}}
+
+
+# vLLM启动过程中的里程碑及其在输出中的标志，按正常出现的顺序排列。每个阶段以结束它的
+# 里程碑命名；某个里程碑没有出现时（如 enforce_eager 不编译），其耗时计入下一个阶段。
+STARTUP_MILESTONES = (
+    ("import", "vLLM API server version"),
+    ("engine_init", "Initializing a V1 LLM engine"),
+    ("worker_init", "Starting to load model"),
+    ("weight_loading", "Model loading took"),
+    ("torch_compile", "torch.compile takes"),
+    ("kv_cache", "GPU KV cache size"),
+    ("cuda_graph", "Graph capturing finished"),
+    ("api_startup", "Application startup complete"),
+)
+# activation: 启动到第一行输出（shell、conda 激活和Python启动）；health: 到 /health 返回200
+STARTUP_PHASES = ("activation",) + tuple(name for name, _ in STARTUP_MILESTONES) + ("health",)
 
-        if enable_expert_parallel:
-            vllm_cmd.append("--enable-expert-parallel")
 
-        if enable_auto_tool_choice:
-            vllm_cmd.append("--enable-auto-tool-choice")
+class StartupProfiler:
+    """记录一次启动中各里程碑相对启动时刻的时间，得到各阶段耗时
 
-        if async_scheduling:
-            vllm_cmd.append("--async-scheduling")
+    feed() 由输出读取线程对每一行调用，启动完成后立即返回；health 里程碑由轮询线程 mark()。
+    """
 
-        if custom_params and isinstance(custom_params, list):
-            for param in custom_params:
-                if isinstance(param, dict):
-                    param_name = param.get("name", "").strip()
-                    param_value = param.get("value", "").strip()
-                    is_flag = param.get("isFlag", False)
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset(None)
 
-                    if param_name:
-                        if is_flag:
-                            vllm_cmd.append(param_name)
-                        elif param_value:
-                            vllm_cmd.extend([param_name, param_value])
+    def reset(self, started: Optional[float]) -> None:
+        with self._lock:
+            self.started = started
+            self.started_at = datetime.now().isoformat() if started is not None else None
+            self.done = False
+            self._reached: Dict[str, float] = {}
 
-        vllm_cmd_str = " ".join(vllm_cmd)
+    def mark(self, name: str, now: Optional[float] = None) -> bool:
+        """记录里程碑，首次到达时返回 True"""
+        with self._lock:
+            if self.started is None or self.done or name in self._reached:
+                return False
+            self._reached[name] = (now if now is not None else time.monotonic()) - self.started
+            if name == "health":
+                self.done = True
+            return True
 
-        # Build the full command
-        if env_type == "wsl":
-            wsl_path = wsl_path or "wsl"
-            source_cmd = "source /etc/profile 2>/dev/null || true && source ~/.bashrc 2>/dev/null || true"
-            if not conda_path:
-                conda_path = _find_conda_path()
-            conda_init = f"{conda_path}/etc/profile.d/conda.sh"
-            source_conda = f"source {conda_init} 2>/dev/null || true"
-            
-            # 构建export命令，在conda activate之后执行
-            export_commands = config.get("exportCommands", [])
-            all_exports = []
-            if cuda_devices:
-                all_exports.append(f"export CUDA_VISIBLE_DEVICES={cuda_devices}")
-            for ec in export_commands:
-                if ec.strip():
-                    all_exports.append(ec.strip())
-            
-            # 使用conda的完整路径激活环境，避免conda不在PATH中的问题
-            conda_exe = f"{conda_path}/bin/conda"
-            activate_script = f"{conda_path}/bin/activate"
-            # 使用source激活conda环境，避免conda activate需要初始化的限制
-            if all_exports:
-                export_str = " && ".join(all_exports)
-                activate_cmd = f"source {activate_script} {conda_env} && {export_str}"
-            else:
-                activate_cmd = f"source {activate_script} {conda_env}"
-            
-            # 使用vllm serve启动 - 模型路径作为位置参数
-            # 从vllm_cmd_str中移除--model参数，将模型路径作为vllm serve的第一个参数
-            vllm_cmd_parts = vllm_cmd_str.split()
-            serve_cmd_parts = ["vllm", "serve"]
-            
-            # 查找--model参数并提取模型路径
-            model_path_arg = ""
-            i = 0
-            while i < len(vllm_cmd_parts):
-                if vllm_cmd_parts[i] == "--model" and i + 1 < len(vllm_cmd_parts):
-                    model_path_arg = vllm_cmd_parts[i + 1]
-                    i += 2  # 跳过--model和模型路径
-                else:
-                    serve_cmd_parts.append(vllm_cmd_parts[i])
-                    i += 1
-            
-            # 如果有模型路径，作为位置参数添加
-            if model_path_arg:
-                serve_cmd_parts.insert(2, model_path_arg)  # 在"vllm" "serve"之后插入模型路径
-            
-            vllm_start_cmd = " ".join(serve_cmd_parts)
-            # 确保在conda activate之前先source conda.sh初始化conda
-            full_command = f'{wsl_path} bash -c "{source_cmd} && {source_conda} && {activate_cmd} && {vllm_start_cmd}"'
-        elif env_type == "linux":
-            # Linux环境：使用conda activate，在激活后执行export命令
-            source_cmd = "source /etc/profile 2>/dev/null || source ~/.bashrc 2>/dev/null || true"
-            if not conda_path:
-                conda_path = _find_conda_path()
-            else:
-                # 展开用户目录缩写（如 ~/miniconda3 -> /home/user/miniconda3）
-                conda_path = os.path.expanduser(conda_path)
-            conda_init = f"{conda_path}/etc/profile.d/conda.sh"
-            source_conda = f"source {conda_init} 2>/dev/null || true"
-            
-            # 构建export命令，在conda activate之后执行
-            export_commands = config.get("exportCommands", [])
-            all_exports = []
-            if cuda_devices:
-                all_exports.append(f"export CUDA_VISIBLE_DEVICES={cuda_devices}")
-            for ec in export_commands:
-                if ec.strip():
-                    all_exports.append(ec.strip())
-            
-            if all_exports:
-                export_str = " && ".join(all_exports)
-                activate_cmd = f"conda activate {conda_env} && {export_str}"
+    def feed(self, message: str, now: Optional[float] = None) -> List[str]:
+        """检查一行输出，返回这一行新到达的里程碑"""
+        if self.done or self.started is None:
+            return []
+        reached = []
+        if "activation" not in self._reached and self.mark("activation", now):
+            reached.append("activation")
+        for name, marker in STARTUP_MILESTONES:
+            if name not in self._reached and marker in message and self.mark(name, now):
+                reached.append(name)
+        return reached
+
+    @property
+    def ready(self) -> bool:
+        return "health" in self._reached
+
+    def finish(self) -> None:
+        """进程在就绪前退出时结束记录"""
+        with self._lock:
+            self.done = True
+
+    def report(self) -> dict:
+        with self._lock:
+            reached = dict(self._reached)
+            started_at = self.started_at
+        elapsed = {name: round(reached[name], 3) for name in STARTUP_PHASES if name in reached}
+        phases, previous = {}, 0.0
+        for name, offset in elapsed.items():
+            phases[name] = round(offset - previous, 3)
+            previous = offset
+        return {
+            "startedAt": started_at,
+            "ready": "health" in reached,
+            "total": round(previous, 3),
+            "elapsed": elapsed,
+            "phases": phases,
+        }
+
+
+class StartupHistory:
+    """按方案保存每次启动的阶段耗时和当时的配置，最新的在后
+
+    每条记录带 configChanges：与该方案上一条记录相比变化的配置项，用来找出让启动变慢的改动。
+    """
+
+    def __init__(self, file_path: str, limit: int = STARTUP_HISTORY_LIMIT) -> None:
+        self.file_path = file_path
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._records: Optional[Dict[str, List[dict]]] = None
+
+    def _load(self) -> Dict[str, List[dict]]:
+        if self._records is None:
+            try:
+                with open(self.file_path, "r", encoding="utf-8") as f:
+                    self._records = json.load(f)
+            except (OSError, ValueError):
+                self._records = {}
+        return self._records
+
+    def record(self, scheme: str, report: dict, config: dict, instance: str = DEFAULT_INSTANCE) -> dict:
+        with self._lock:
+            records = self._load().setdefault(scheme, [])
+            previous = records[-1]["config"] if records else None
+            entry = {**report, "instance": instance, "config": config}
+            if previous is not None:
+                entry["configChanges"] = sorted(k for k in set(previous) | set(config)
+                                                if previous.get(k) != config.get(k))
+            records.append(entry)
+            del records[:-self.limit]
+            _write_json_atomic(self.file_path, self._records)
+            return entry
+
+    def get(self, scheme: Optional[str] = None):
+        """指定方案的记录列表；不指定时返回 {方案: 记录列表}"""
+        with self._lock:
+            records = self._load()
+            if scheme is None:
+                return {name: list(items) for name, items in records.items()}
+            return list(records.get(scheme, []))
+
+
+startup_history = StartupHistory(STARTUP_HISTORY_FILE)
+
+
+# vLLM/uvicorn 输出行的级别标记，可带ANSI颜色和进程前缀，例如:
+# "\x1b[0;36m(APIServer pid=1)\x1b[0;0m WARNING 01-17 17:02:19 [x.py:1] ..." 或 "INFO:     127.0.0.1:1 - ..."
+# 使用占有量词避免可选前缀失配时的回溯
+LINE_PREFIX_PATTERN = r"(?:\x1b\[[\d;]*+m)?+(?:\([^)]*+\) ?)?+(?:\x1b\[[\d;]*+m)?+"
+LINE_PREFIX_RE = re.compile(LINE_PREFIX_PATTERN)
+LEVEL_TOKEN_RE = re.compile(LINE_PREFIX_PATTERN + r" *+(DEBUG|INFO|WARNING|ERROR|CRITICAL)\b")
+# Python warnings 模块的输出: "/path/x.py:147: UserWarning: ..."
+PY_WARNING_RE = re.compile(r"\S+:\d+: \w*Warning: ")
+LEVEL_TOKEN_MAP = {"DEBUG": "info", "INFO": "info", "WARNING": "warning", "ERROR": "error", "CRITICAL": "error"}
+TRACEBACK_MAX_LINES = 500
+
+
+class LineClassifier:
+    """vLLM子进程输出的分级器
+
+    按行首的级别标记（跳过ANSI颜色和进程前缀）判断级别，只匹配一次锚定正则。
+    没有级别标记的Python堆栈（Traceback ... 异常行，可带进程前缀）按前缀归组，合并为一条error记录。
+    每个读取线程使用独立实例。
+    """
+
+    def __init__(self) -> None:
+        self._traceback: List[str] = []
+        self._prefix = ""
+
+    @staticmethod
+    def _split_prefix(line: str) -> tuple:
+        """拆出ANSI颜色和进程前缀，返回 (前缀, 正文)；正文去掉前缀后的一个分隔空格"""
+        prefix = LINE_PREFIX_RE.match(line).group(0)
+        body = line[len(prefix):]
+        if prefix and body.startswith(" "):
+            body = body[1:]
+        return prefix.strip(), body
+
+    def feed(self, raw: str) -> List[tuple]:
+        """输入一行原始输出，返回已确定的 (级别, 消息) 记录列表"""
+        line = raw.rstrip("\r\n")
+        if self._traceback:
+            prefix, body = self._split_prefix(line)
+            if not line.strip() or prefix == self._prefix and (body[:1] in (" ", "\t") or body.startswith(
+                    ("Traceback", "During handling", "The above exception"))):
+                self._traceback.append(line)
+                if len(self._traceback) >= TRACEBACK_MAX_LINES:
+                    return self.flush()
+                return []
+            if prefix == self._prefix and not LEVEL_TOKEN_RE.match(line):
+                # 同一进程不缩进的行是最终的异常信息（如 "KeyError: 'x'"）
+                self._traceback.append(line)
+                return self.flush()
+            # 其它进程的输出或带级别标记的行插入进来，堆栈到此为止
+            return self.flush() + self.feed(line)
+
+        message = line.strip()
+        if not message:
+            return []
+        match = LEVEL_TOKEN_RE.match(line)
+        if match:
+            return [(LEVEL_TOKEN_MAP[match.group(1)], message)]
+        if "Traceback" in line:
+            prefix, body = self._split_prefix(line)
+            if body.startswith("Traceback"):
+                self._traceback.append(line)
+                self._prefix = prefix
+                return []
+        if PY_WARNING_RE.match(line):
+            return [("warning", message)]
+        return [("info", message)]
+
+    def flush(self) -> List[tuple]:
+        """输出未结束的堆栈记录（进程退出时调用）"""
+        if not self._traceback:
+            return []
+        record = "\n".join(l for l in self._traceback if l.strip())
+        self._traceback = []
+        return [("error", record)]
+
+
+OUTPUT_READ_CHUNK = 64 * 1024        # 每次从子进程管道读取的最大字节数
+OUTPUT_MAX_LINE = 1024 * 1024        # 超过该长度仍无换行时强制切分，避免内存暴涨
+OUTPUT_PROGRESS_INTERVAL = 1.0       # 进度条（\r 重绘）最新状态的最短输出间隔（秒）
+
+
+class OutputSplitter:
+    """将子进程的原始字节流切分为文本行
+
+    只在边界做增量UTF-8解码（多字节字符跨块也能正确解码）。按 \n 分行，
+    行内的 \r 重绘（tqdm/NCCL 进度条）只保留最后的状态，未结束的进度条只在内存中保留最新一帧。
+    """
+
+    def __init__(self, max_line: int = OUTPUT_MAX_LINE) -> None:
+        self.max_line = max_line
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._partial = ""
+        self._progress = ""
+
+    @staticmethod
+    def _latest(segment: str) -> str:
+        if "\r" not in segment:
+            return segment
+        for part in reversed(segment.split("\r")):
+            if part:
+                return part
+        return ""
+
+    def feed(self, data: bytes) -> List[str]:
+        """输入一块字节，返回其中已完整的行"""
+        text = self._partial + self._decoder.decode(data)
+        parts = text.split("\n")
+        partial = parts.pop()
+        lines = [self._latest(part) for part in parts]
+        if lines:
+            # 进度条已换行结束，最终状态作为普通行输出
+            self._progress = ""
+        if "\r" in partial:
+            # 进度条重绘: 丢弃旧帧，只保留最后一个完整帧和正在输出的帧
+            frames = partial.split("\r")
+            partial = frames[-1]
+            for frame in reversed(frames[:-1]):
+                if frame:
+                    self._progress = frame
+                    break
+        if len(partial) > self.max_line:
+            lines.append(partial)
+            partial = ""
+        self._partial = partial
+        return lines
+
+    def take_progress(self) -> str:
+        """取出并清除最近一帧未换行的进度条状态"""
+        progress, self._progress = self._progress, ""
+        return progress
+
+    def flush(self) -> List[str]:
+        """输出剩余的未换行内容（进程退出时调用）"""
+        tail = self._latest(self._partial + self._decoder.decode(b"", final=True))
+        self._partial = ""
+        self._progress = ""
+        return [tail] if tail else []
+
+
+GPU_INVENTORY_ENV = "VLLM_GUI_GPUS"   # 逗号分隔的GPU编号，覆盖 nvidia-smi 探测（用于模拟设备）
+GPU_BACKEND_ENV = "VLLM_GUI_GPU_BACKEND"  # nvml / nvidia-smi / fake，默认优先 NVML
+GPU_SAMPLE_INTERVAL = 2.0            # GPU状态采样间隔（秒）
+GPU_PENDING_RETRY = 0.1              # 后端还没有数据时的重试间隔（秒）
+# GPU历史的降采样层级：(每桶秒数, 保留桶数)，依次保留 1 小时、1 天、7 天
+GPU_HISTORY_TIERS = ((1, 3600), (10, 8640), (60, 10080))
+GPU_HISTORY_METRICS = ("memory_used", "utilization", "temperature", "power")
+GPU_PROCESS_INTERVAL = 2.0           # GPU进程快照的采集间隔（秒），也是 gpu_processes 事件的最高频率
+GPU_SMI_FIELDS = ("index", "name", "memory.used", "memory.total", "utilization.gpu",
+                  "temperature.gpu", "power.draw", "fan.speed")
+
+
+def _device_count(config: dict) -> int:
+    """cudaDevices 为 "auto" 时需要的GPU数：张量并行 × 流水线并行"""
+    try:
+        tp = int(config.get("tensorParallel") or 1)
+        pp = int(config.get("pipelineParallelSize") or 1)
+    except (TypeError, ValueError):
+        return 1
+    return max(1, tp * pp)
+
+
+class GPUAllocator:
+    """记录每个实例占用的GPU，防止多个实例的 CUDA_VISIBLE_DEVICES 重叠
+
+    request() 可以指定具体设备，也可以只要求任意 count 张空闲卡；容量不足时请求按先来后到
+    排队，release() 释放设备后依次启动能满足的排队请求（回调在锁外执行）。
+    devices 为 None 时从环境变量 VLLM_GUI_GPUS 或 nvidia-smi 获取设备列表。
+    """
+
+    def __init__(self, devices: Optional[List[int]] = None) -> None:
+        self._devices = sorted(devices) if devices is not None else None
+        self._held: Dict[str, List[int]] = {}
+        self._waiting: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def inventory(self) -> List[int]:
+        if self._devices is None:
+            self._devices = self._probe()
+        return self._devices
+
+    @staticmethod
+    def _probe() -> List[int]:
+        configured = os.environ.get(GPU_INVENTORY_ENV, "").strip()
+        if configured:
+            return sorted(int(d) for d in configured.split(",") if d.strip().isdigit())
+        try:
+            result = subprocess.run(["nvidia-smi", "--query-gpu=index", "--format=csv,noheader"],
+                                    capture_output=True, text=True, timeout=5)
+            if result.returncode == 0:
+                return sorted(int(line) for line in result.stdout.split() if line.isdigit())
+        except Exception:
+            pass
+        return []
+
+    def _free(self) -> List[int]:
+        used = {d for devices in self._held.values() for d in devices}
+        return [d for d in self.inventory() if d not in used]
+
+    def _pick(self, count: int, devices: Optional[List[int]]) -> Optional[List[int]]:
+        if devices:
+            # 指定设备只检查是否与其它实例重叠（未能探测到GPU时清单为空）
+            used = {d for held in self._held.values() for d in held}
+            return None if used & set(devices) else list(devices)
+        free = self._free()
+        return free[:count] if len(free) >= count else None
+
+    def check(self, count: int = 1, devices: Optional[List[int]] = None) -> Optional[str]:
+        """请求永远无法满足时返回错误信息"""
+        inventory = self.inventory()
+        if devices:
+            missing = [d for d in devices if d not in inventory]
+            if inventory and missing:
+                return f"GPU {','.join(map(str, missing))} 不存在"
+        elif count > len(inventory):
+            return f"需要 {count} 张GPU，但只检测到 {len(inventory)} 张"
+        return None
+
+    def preview(self, count: int) -> List[int]:
+        """当前会分配给 count 张卡请求的设备（不占用）"""
+        with self._lock:
+            return self._free()[:count]
+
+    def request(self, owner: str, callback, count: int = 1,
+                devices: Optional[List[int]] = None) -> Optional[List[int]]:
+        """为 owner 分配设备；有空闲时立即返回设备列表，否则排队并返回 None
+
+        排队的请求在设备释放后以 callback(devices) 的形式启动。
+        """
+        with self._lock:
+            self._held.pop(owner, None)
+            picked = None if self._waiting else self._pick(count, devices)
+            if picked is not None:
+                self._held[owner] = picked
+                return picked
+            self._waiting.append((owner, count, devices, callback))
+            return None
+
+    def cancel(self, owner: str) -> bool:
+        """取消 owner 的排队请求"""
+        with self._lock:
+            before = len(self._waiting)
+            self._waiting = [w for w in self._waiting if w[0] != owner]
+            return len(self._waiting) != before
+
+    def is_queued(self, owner: str) -> bool:
+        return any(w[0] == owner for w in self._waiting)
+
+    def release(self, owner: str) -> None:
+        ready = []
+        with self._lock:
+            if self._held.pop(owner, None) is None:
+                return
+            # 严格按先来后到：队首无法满足时后面的请求也继续等待
+            while self._waiting:
+                waiting_owner, count, devices, callback = self._waiting[0]
+                picked = self._pick(count, devices)
+                if picked is None:
+                    break
+                self._waiting.pop(0)
+                self._held[waiting_owner] = picked
+                ready.append((callback, picked))
+        for callback, picked in ready:
+            try:
+                callback(picked)
+            except Exception:
+                pass
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "devices": self.inventory(),
+                "free": self._free(),
+                "held": {owner: list(devices) for owner, devices in self._held.items()},
+                "queued": [w[0] for w in self._waiting],
+            }
+
+
+gpu_allocator = GPUAllocator()
+
+
+def _process_details(pid: int) -> tuple:
+    """本机进程的 (用户名, 命令行)，从 /proc 读取；读不到时为 (None, "")"""
+    user, command = None, ""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            command = f.read().replace(b"\0", b" ").decode("utf-8", "replace").strip()
+        import pwd  # 仅Unix
+        user = pwd.getpwuid(os.stat(f"/proc/{pid}").st_uid).pw_name
+    except (OSError, KeyError, ImportError):
+        pass
+    return user, command
+
+
+class NvmlGPUBackend:
+    """通过 NVML（nvidia-ml-py）读取GPU状态，初始化和设备句柄只做一次；未安装时抛出 ImportError"""
+
+    name = "nvml"
+
+    def __init__(self) -> None:
+        import pynvml
+        self._nvml = pynvml
+        self._handles = run_blocking(self._init)
+
+    def _init(self) -> list:
+        nvml = self._nvml
+        nvml.nvmlInit()
+        return [nvml.nvmlDeviceGetHandleByIndex(i) for i in range(nvml.nvmlDeviceGetCount())]
+
+    def _read(self, func: Callable, *args) -> Optional[object]:
+        try:
+            return func(*args)
+        except self._nvml.NVMLError:
+            return None
+
+    def sample(self) -> List[dict]:
+        return run_blocking(self._sample)
+
+    def _sample(self) -> List[dict]:
+        nvml = self._nvml
+        gpus = []
+        for handle in self._handles:
+            name = self._read(nvml.nvmlDeviceGetName, handle)
+            memory = self._read(nvml.nvmlDeviceGetMemoryInfo, handle)
+            util = self._read(nvml.nvmlDeviceGetUtilizationRates, handle)
+            temp = self._read(nvml.nvmlDeviceGetTemperature, handle, nvml.NVML_TEMPERATURE_GPU)
+            power = self._read(nvml.nvmlDeviceGetPowerUsage, handle)
+            fan = self._read(nvml.nvmlDeviceGetFanSpeed, handle)
+            # 与 nvidia-smi --format=csv,nounits 的输出保持一致：MiB、W，不支持的项为 [N/A]
+            gpus.append({
+                "name": name.decode() if isinstance(name, bytes) else str(name or ""),
+                "memory_used": str(memory.used // (1024 * 1024)) if memory else "[N/A]",
+                "memory_total": str(memory.total // (1024 * 1024)) if memory else "[N/A]",
+                "utilization": str(util.gpu) if util else "[N/A]",
+                "temperature": str(temp) if temp is not None else "[N/A]",
+                "power": f"{power / 1000:.2f}" if power is not None else "[N/A]",
+                "fan_speed": str(fan) if fan is not None else "[N/A]",
+            })
+        return gpus
+
+    def processes(self) -> Dict[str, dict]:
+        """各卡上的计算/图形进程，格式与 parse_gpu_processes 相同"""
+        return run_blocking(self._processes)
+
+    def _processes(self) -> Dict[str, dict]:
+        nvml = self._nvml
+        processes: Dict[str, dict] = {}
+        for index, handle in enumerate(self._handles):
+            for kind, func in (("C", nvml.nvmlDeviceGetComputeRunningProcesses),
+                               ("G", getattr(nvml, "nvmlDeviceGetGraphicsRunningProcesses", None))):
+                for proc in (self._read(func, handle) or []) if func else []:
+                    key = f"{index}:{proc.pid}"
+                    if key in processes:
+                        processes[key]["type"] = "C+G"  # 与 nvidia-smi 的写法一致
+                        continue
+                    user, command = _process_details(proc.pid)
+                    if not command:
+                        name = self._read(nvml.nvmlSystemGetProcessName, proc.pid)
+                        command = name.decode() if isinstance(name, bytes) else str(name or "")
+                    memory = getattr(proc, "usedGpuMemory", None)
+                    processes[key] = {"gpu": index, "pid": proc.pid, "type": kind, "user": user,
+                                      "memory": round(memory / (1024 * 1024), 1) if memory is not None else None,
+                                      "command": command}
+        return processes
+
+    def close(self) -> None:
+        try:
+            self._nvml.nvmlShutdown()
+        except Exception:
+            pass
+
+
+class SmiStreamGPUBackend:
+    """一个常驻的 nvidia-smi --loop-ms 进程，后台线程逐行解析并保留每张卡的最新一行
+
+    sample() 只读取缓存，进程刚启动、还没有解析出任何一行时返回 None；进程退出后在下一次
+    sample() 时重新启动，没有输出任何一行就退出时抛出异常。
+    """
+
+    name = "nvidia-smi"
+
+    def __init__(self, interval: float = GPU_SAMPLE_INTERVAL, command: Optional[List[str]] = None) -> None:
+        self._command = command or ["nvidia-smi", f"--query-gpu={','.join(GPU_SMI_FIELDS)}",
+                                    "--format=csv,noheader,nounits", f"--loop-ms={int(interval * 1000)}"]
+        self._latest: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+        self._process: Optional[subprocess.Popen] = None
+
+    def _ensure_process(self) -> None:
+        if self._process is not None and self._process.poll() is None:
+            return
+        self._process = subprocess.Popen(self._command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                         text=True, encoding="utf-8", errors="replace", bufsize=1)
+        threading.Thread(target=self._read, args=(self._process,), name="nvidia-smi-loop", daemon=True).start()
+
+    def _read(self, proc: subprocess.Popen) -> None:
+        for line in proc.stdout:
+            parts = [p.strip() for p in line.split(",")]
+            if len(parts) < len(GPU_SMI_FIELDS) or not parts[0].isdigit():
+                continue
+            gpu = dict(zip(("name", "memory_used", "memory_total", "utilization", "temperature", "power",
+                            "fan_speed"), parts[1:]))
+            with self._lock:
+                self._latest[int(parts[0])] = gpu
+
+    def sample(self) -> Optional[List[dict]]:
+        proc = self._process
+        if proc is not None and proc.poll() is not None and not self._latest:
+            self._process = None
+            raise RuntimeError(f"nvidia-smi 未输出GPU信息就退出了（退出码 {proc.returncode}）")
+        self._ensure_process()
+        with self._lock:
+            return [self._latest[i] for i in sorted(self._latest)] if self._latest else None
+
+    def close(self) -> None:
+        proc, self._process = self._process, None
+        if proc and proc.poll() is None:
+            proc.terminate()
+
+
+class FakeGPUBackend:
+    """不依赖GPU的后端，供测试和演示使用；gpus 为 None 时按 VLLM_GUI_GPUS 生成空闲的卡"""
+
+    name = "fake"
+
+    def __init__(self, gpus: Optional[List[dict]] = None) -> None:
+        if gpus is None:
+            gpus = [{"name": f"Fake GPU {i}", "memory_used": "0", "memory_total": "24576", "utilization": "0",
+                     "temperature": "30", "power": "20.00", "fan_speed": "0"}
+                    for i in (GPUAllocator._probe() if os.environ.get(GPU_INVENTORY_ENV) else [0])]
+        self.gpus = gpus
+
+    def sample(self) -> List[dict]:
+        return [dict(gpu) for gpu in self.gpus]
+
+    def close(self) -> None:
+        pass
+
+
+def default_gpu_backend() -> Optional[object]:
+    """按 VLLM_GUI_GPU_BACKEND 选择后端；未指定时优先 NVML，其次 nvidia-smi，都没有时返回 None"""
+    choice = os.environ.get(GPU_BACKEND_ENV, "").strip().lower()
+    if choice == "fake":
+        return FakeGPUBackend()
+    if choice in ("", "nvml"):
+        try:
+            return NvmlGPUBackend()
+        except Exception:
+            if choice:
+                return None
+    if shutil.which("nvidia-smi"):
+        return SmiStreamGPUBackend()
+    return None
+
+
+def _gpu_value(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan  # [N/A] 等不支持的项
+
+
+class GPUHistory:
+    """GPU读数的历史，按 GPU_HISTORY_TIERS 降采样为每桶的 min/max/mean
+
+    每个层级、每张卡一个 MetricsRing（array 列），原始样本只在当前桶的累加器中停留，
+    因此一天的历史占用固定内存。各层级都直接由原始样本聚合；无效读数（nan）不参与聚合。
+    """
+
+    def __init__(self, tiers: tuple = GPU_HISTORY_TIERS, metrics: tuple = GPU_HISTORY_METRICS) -> None:
+        self.tiers = tiers
+        self.metrics = metrics
+        self.fields = ("timestamp",) + tuple(f"{m}_{agg}" for m in metrics for agg in ("min", "max", "mean"))
+        self._rings: Dict[int, Dict[str, MetricsRing]] = {step: {} for step, _ in tiers}
+        # (层级, GPU) -> [桶起点, {指标: [min, max, sum, n]}]
+        self._buckets: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def record(self, timestamp: float, gpus: List[dict]) -> None:
+        with self._lock:
+            for index, gpu in enumerate(gpus):
+                values = [_gpu_value(gpu.get(m)) for m in self.metrics]
+                for step, capacity in self.tiers:
+                    self._add(step, capacity, str(index), timestamp, values)
+
+    def _add(self, step: int, capacity: int, gpu: str, timestamp: float, values: List[float]) -> None:
+        start = timestamp - timestamp % step
+        bucket = self._buckets.get((step, gpu))
+        if bucket is None or bucket[0] != start:
+            if bucket is not None:
+                ring = self._rings[step].get(gpu)
+                if ring is None:
+                    ring = self._rings[step][gpu] = MetricsRing(self.fields, capacity)
+                ring.append(self._row(bucket))
+            bucket = self._buckets[(step, gpu)] = [start, [[math.inf, -math.inf, 0.0, 0] for _ in values]]
+        for acc, value in zip(bucket[1], values):
+            if value == value:
+                acc[0] = min(acc[0], value)
+                acc[1] = max(acc[1], value)
+                acc[2] += value
+                acc[3] += 1
+
+    @staticmethod
+    def _row(bucket: list) -> tuple:
+        row = [bucket[0]]
+        for low, high, total, count in bucket[1]:
+            row += [low, high, total / count] if count else [math.nan] * 3
+        return tuple(row)
+
+    def _tier_for(self, start: float) -> int:
+        """能覆盖 start 的最细层级：最旧的桶早于 start，或者环还没写满（保留了全部历史）"""
+        for step, _ in self.tiers:
+            rings = self._rings[step].values()
+            if all(len(ring) < ring.capacity or ring.oldest() <= start for ring in rings):
+                return step
+        return self.tiers[-1][0]
+
+    def query(self, start: float = 0.0, end: Optional[float] = None, resolution: Optional[int] = None,
+              gpu: Optional[str] = None) -> dict:
+        """按列返回 [start, end] 内各卡的桶（含尚未结束的当前桶），resolution 为空时自动选择层级"""
+        with self._lock:
+            step = resolution if resolution in self._rings else self._tier_for(start)
+            result = {}
+            names = set(self._rings[step]) | {g for (s, g) in self._buckets if s == step}
+            for name in sorted(names, key=int):
+                if gpu is not None and name != gpu:
+                    continue
+                ring = self._rings[step].get(name)
+                columns = ring.window(start, until=end) if ring else {f: [] for f in self.fields}
+                bucket = self._buckets.get((step, name))
+                if bucket and bucket[0] >= start and (end is None or bucket[0] <= end):
+                    for field, value in zip(self.fields, self._row(bucket)):
+                        columns[field].append(value)
+                # nan 不是合法的 JSON
+                result[name] = {f: [None if v != v else round(v, 3) for v in col] for f, col in columns.items()}
+            return {"resolution": step, "gpus": result}
+
+
+class GPUTelemetry:
+    """后台线程按 GPU_SAMPLE_INTERVAL 采样GPU状态并发布到共享快照
+
+    /api/gpu-status 只读取快照，不再每个请求启动一次 nvidia-smi；快照变化时推送 "gpu" 事件。
+    采样线程在第一次读取时启动，读取会等待第一次采样完成。每次成功的采样同时写入 history。
+    后端 sample() 返回 None 表示还没有数据（如 nvidia-smi 刚启动），此时快照保持不变。
+    """
+
+    def __init__(self, hub: Optional[EventHub] = None,
+                 backend_factory: Callable[[], Optional[object]] = default_gpu_backend,
+                 interval: Optional[float] = None) -> None:
+        self._hub = hub
+        self._backend_factory = backend_factory
+        self._interval = interval
+        self._backend: Optional[object] = None
+        self._snapshot: dict = {"status": "pending", "gpus": []}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self.history = GPUHistory()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="gpu-telemetry", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread:
+            thread.join(timeout=5)
+
+    def snapshot(self, timeout: float = 5.0) -> dict:
+        self.start()
+        self._ready.wait(timeout)
+        return self._snapshot
+
+    def processes(self) -> Optional[Dict[str, dict]]:
+        """由采样后端直接读取GPU进程表（NVML）；后端不支持时返回 None"""
+        self.snapshot()
+        backend = self._backend
+        if backend is None or not hasattr(backend, "processes"):
+            return None
+        return backend.processes()
+
+    def sample(self) -> dict:
+        """采样一次并更新快照，返回新的快照"""
+        try:
+            if self._backend is None:
+                self._backend = self._backend_factory()
+            if self._backend is None:
+                snapshot = {"status": "error", "message": "无法获取GPU信息", "gpus": []}
             else:
-                activate_cmd = f"conda activate {conda_env}"
-            
-            # 使用vllm serve启动 - 模型路径作为位置参数
-            # 从vllm_cmd_str中移除--model参数，将模型路径作为vllm serve的第一个参数
-            vllm_cmd_parts = vllm_cmd_str.split()
-            serve_cmd_parts = ["vllm", "serve"]
-            
-            # 查找--model参数并提取模型路径
-            model_path_arg = ""
-            i = 0
-            while i < len(vllm_cmd_parts):
-                if vllm_cmd_parts[i] == "--model" and i + 1 < len(vllm_cmd_parts):
-                    model_path_arg = vllm_cmd_parts[i + 1]
-                    i += 2  # 跳过--model和模型路径
-                else:
-                    serve_cmd_parts.append(vllm_cmd_parts[i])
-                    i += 1
-            
-            # 如果有模型路径，作为位置参数添加
-            if model_path_arg:
-                serve_cmd_parts.insert(2, model_path_arg)  # 在"vllm" "serve"之后插入模型路径
-            
-            vllm_start_cmd = " ".join(serve_cmd_parts)
-            full_command = f'/bin/bash -c "{source_cmd} && {source_conda} && {activate_cmd} && {vllm_start_cmd}"'
+                gpus = self._backend.sample()
+                if gpus is None:
+                    return self._snapshot
+                snapshot = {"status": "ok", "gpus": gpus, "backend": self._backend.name}
+        except Exception as e:
+            snapshot = {"status": "error", "message": str(e), "gpus": []}
+        changed = snapshot != {k: v for k, v in self._snapshot.items() if k != "timestamp"}
+        snapshot["timestamp"] = time.time()
+        if snapshot["status"] == "ok":
+            self.history.record(snapshot["timestamp"], snapshot["gpus"])
+        self._snapshot = snapshot
+        self._ready.set()
+        if changed and self._hub is not None:
+            self._hub.emit("gpu", snapshot)
+        return snapshot
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                self.sample()
+                self._stop.wait((self._interval or GPU_SAMPLE_INTERVAL) if self._ready.is_set() else GPU_PENDING_RETRY)
+        finally:
+            backend, self._backend = self._backend, None
+            if backend is not None:
+                backend.close()
+
+
+gpu_telemetry = GPUTelemetry(event_hub)
+
+
+ANSI_ESCAPE_RE = re.compile(r"\x1b\[[\d;?]*[A-Za-z]")
+# nvitop -o 的进程行: "│   0  12345 C  alice  7840MiB  97  1  102.4  4.1  2:03:04  python3 -m vllm ... │"
+# GPU-MEM 之后是 %SM、%CPU、TIME 等列（随版本增减），其后才是命令
+NVITOP_PROCESS_RE = re.compile(
+    r"^\s*(\d+)\s+(\d+)\s+([CGX+]+)\s+(\S+)\s+(\d+(?:\.\d+)?[KMG]i?B|N/A)\s+(.*)$")
+NVITOP_COLUMN_RE = re.compile(r"^(?:N/A|[\d.]+%?|(?:\d+-)?\d+:\d+(?::\d+)?|[\d.]+[dhms]\w*)$")
+# nvidia-smi 的进程行（GI/CI 列在较新版本中才有）: "|    0   N/A  N/A     12345      C   python3     7840MiB |"
+SMI_PROCESS_RE = re.compile(r"^\s*(\d+)\s+(?:\S+\s+\S+\s+)?(\d+)\s+([CG+]+)\s+(.*?)\s+(\d+MiB|N/A)\s*$")
+_MEMORY_UNITS = {"KiB": 1 / 1024, "KB": 1 / 1024, "MiB": 1, "MB": 1, "GiB": 1024, "GB": 1024}
+
+
+def _memory_mib(text: str) -> Optional[float]:
+    match = re.match(r"^(\d+(?:\.\d+)?)([KMG]i?B)$", text)
+    return round(float(match.group(1)) * _MEMORY_UNITS[match.group(2)], 1) if match else None
+
+
+def parse_gpu_processes(text: str) -> Dict[str, dict]:
+    """从 nvitop -o 或 nvidia-smi 的表格输出中解析GPU进程，键为 "<GPU>:<PID>"
+
+    只识别两侧带表格边框（│ 或 |）的进程行，其余行（GPU表、标题、分隔线）忽略。
+    """
+    processes = {}
+    for line in ANSI_ESCAPE_RE.sub("", text).splitlines():
+        line = line.strip()
+        if len(line) < 2 or line[0] not in "│|" or line[-1] not in "│|":
+            continue
+        row = line[1:-1]
+        match = NVITOP_PROCESS_RE.match(row)
+        if match:
+            gpu, pid, kind, user, memory, rest = match.groups()
+            columns = rest.split()
+            while columns and NVITOP_COLUMN_RE.match(columns[0]):
+                columns.pop(0)
+            command = " ".join(columns)
         else:
-            if not conda_path:
-                conda_path = os.path.expanduser("~/miniconda3")
-            conda_init = f"{conda_path}/etc/profile.d/conda.sh"
-            source_conda = f"source {conda_init} 2>/dev/null || true"
-            
-            # 构建export命令，在conda activate之后执行
-            export_commands = config.get("exportCommands", [])
-            all_exports = []
-            if cuda_devices:
-                all_exports.append(f"export CUDA_VISIBLE_DEVICES={cuda_devices}")
-            for ec in export_commands:
-                if ec.strip():
-                    all_exports.append(ec.strip())
-            
-            if all_exports:
-                export_str = " && ".join(all_exports)
-                activate_cmd = f"conda activate {conda_env} && {export_str}"
+            match = SMI_PROCESS_RE.match(row)
+            if not match:
+                continue
+            gpu, pid, kind, command, memory = match.groups()
+            user = None
+        processes[f"{gpu}:{pid}"] = {
+            "gpu": int(gpu), "pid": int(pid), "type": kind, "user": user,
+            "memory": _memory_mib(memory), "command": command.strip(),
+        }
+    return processes
+
+
+def _run_monitor_command(command: List[str]) -> str:
+    """运行一次监控命令并返回输出；wsl 前缀的命令复用常驻WSL会话"""
+    if command[0] == "wsl":
+        return wsl_shell().run(shlex.join(command[1:]))[1]
+    env = {**os.environ, "PYTHONIOENCODING": "utf-8", "LANG": "en_US.UTF-8", "LC_ALL": "en_US.UTF-8"}
+    result = subprocess.run(command, capture_output=True, text=True, encoding="utf-8", errors="replace",
+                            timeout=GPU_PROCESS_INTERVAL * 5, env=env)
+    return result.stdout
+
+
+class GPUProcessMonitor:
+    """按固定间隔采集GPU上的进程，只推送变化
+
+    本机有 NVML 时从 native（共享的 GPUTelemetry 采样后端）读取进程表，不启动任何进程；
+    否则（WSL、没有 NVML）每轮运行一次 nvitop -o（或 nvidia-smi）并解析。每轮的进程表与上一轮比较后以一个
+    gpu_processes 事件推送新增/变化的进程（upsert）和已退出进程的键（removed）；没有变化时不推送。
+    事件频率不超过每 GPU_PROCESS_INTERVAL 秒一次。新连接的页面先从 snapshot() 取完整进程表。
+    """
+
+    def __init__(self, hub: Optional[EventHub] = None,
+                 runner: Callable[[List[str]], str] = _run_monitor_command,
+                 interval: Optional[float] = None,
+                 native: Optional[Callable[[], Optional[Dict[str, dict]]]] = None) -> None:
+        self._hub = hub
+        self._runner = runner
+        self._interval = interval
+        self._native = native
+        self._processes: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, command: List[str]) -> bool:
+        """开始采集，已在运行时返回 False"""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(command, self._stop),
+                                            name="gpu-processes", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> bool:
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stop.set()
+        return thread is not None
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return sorted(self._processes.values(), key=lambda p: (p["gpu"], p["pid"]))
+
+    def update(self, text: str) -> Optional[dict]:
+        """用一轮 nvitop/nvidia-smi 输出更新进程表，返回推送的变化（没有变化时为 None）"""
+        return self._apply(parse_gpu_processes(text))
+
+    def _apply(self, processes: Dict[str, dict]) -> Optional[dict]:
+        with self._lock:
+            previous, self._processes = self._processes, processes
+        diff = {
+            "upsert": [p for key, p in processes.items() if previous.get(key) != p],
+            "removed": [key for key in previous if key not in processes],
+        }
+        if not diff["upsert"] and not diff["removed"]:
+            return None
+        if self._hub is not None:
+            self._hub.emit("gpu_processes", diff)
+        return diff
+
+    def _collect(self, command: List[str]) -> Dict[str, dict]:
+        if self._native is not None and command[0] != "wsl":
+            try:
+                processes = self._native()
+            except Exception:
+                processes = None
+            if processes is not None:
+                return processes
+        return parse_gpu_processes(self._runner(command))
+
+    def _run(self, command: List[str], stop: threading.Event) -> None:
+        while not stop.is_set():
+            began = time.monotonic()
+            try:
+                processes = self._collect(command)
+            except Exception:
+                processes = None
+            if processes is not None and not stop.is_set():
+                self._apply(processes)
+            stop.wait(max(0.0, (self._interval or GPU_PROCESS_INTERVAL) - (time.monotonic() - began)))
+
+
+gpu_process_monitor = GPUProcessMonitor(event_hub, native=lambda: gpu_telemetry.processes())
+
+
+class LaunchSpec(NamedTuple):
+    """结构化的vLLM启动描述，只在需要shell命令时才渲染（render_launch_command）
+
+    exports 按顺序保存 (变量名, 值)；exportCommands 中无法解析为 export K=V 的语句
+    以 (None, 原语句) 保存，此时只能通过shell启动。
+    """
+    env_type: str
+    wsl_path: str
+    conda_path: str
+    conda_env: str
+    argv: tuple
+    exports: tuple
+
+    @property
+    def needs_shell(self) -> bool:
+        return any(name is None for name, _ in self.exports)
+
+
+LAUNCH_CACHE_SIZE = 64  # 每个实例缓存的启动描述数量
+LAUNCH_PATH_KEYS = ("modelPath", "prefixCache", "customAllReduce", "chatTemplate")  # 需要规范化的路径字段
+# 各环境渲染shell命令时的外层命令、初始化语句和conda激活方式
+_LAUNCH_SHELLS = {
+    "wsl": ("{wsl} bash -c", "source /etc/profile 2>/dev/null || true && source ~/.bashrc 2>/dev/null || true",
+            "source {conda}/bin/activate {env}"),
+    "linux": ("/bin/bash -c", "source /etc/profile 2>/dev/null || source ~/.bashrc 2>/dev/null || true",
+              "conda activate {env}"),
+    "other": ("wsl bash -c", "", "conda activate {env}"),
+}
+_EXPORT_RE = re.compile(r"^export\s+([A-Za-z_][A-Za-z0-9_]*)=(.*)$")
+# 页面和已保存方案使用的键名 -> /api/generate-command 早期使用的键名，两种写法都接受
+_CONFIG_ALIASES = {"gpuMemoryUtilization": "gpuMemoryUtil", "maxNumSequences": "maxNumSeqs"}
+
+
+def _string_config(config: dict) -> dict:
+    """validate_config 按前端的字符串表单校验，已保存方案中的数字先转为字符串"""
+    return {k: str(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else v
+            for k, v in config.items()}
+
+
+def _parse_export(line: str) -> tuple:
+    """export K=V -> (K, V)；值中含变量展开等shell语法或无法解析时返回 (None, 原语句)
+
+    从多行脚本复制来的语句末尾可能带续行符 \\，先去掉。
+    """
+    line = re.sub(r"\s*\\$", "", line)
+    match = _EXPORT_RE.match(line)
+    if match and not re.search(r"[$`;&|<>]", match.group(2)):
+        try:
+            words = shlex.split(match.group(2))
+        except ValueError:
+            return None, line
+        if len(words) <= 1:
+            return match.group(1), words[0] if words else ""
+    return None, line
+
+
+def _exported_devices(config: dict) -> str:
+    """exportCommands 中 export CUDA_VISIBLE_DEVICES=... 的值（多条时取最后一条）"""
+    devices = ""
+    for line in config.get("exportCommands", []) or []:
+        name, value = _parse_export(str(line).strip())
+        if name == "CUDA_VISIBLE_DEVICES":
+            devices = value
+    return devices
+
+
+def _split_param_name(name: str) -> List[str]:
+    """自定义参数名可能带值（如 "--kv-cache-dtype fp8"），按shell规则拆成多个参数"""
+    try:
+        return shlex.split(name)
+    except ValueError:
+        return name.split()
+
+
+def build_launch_spec(config: dict) -> LaunchSpec:
+    """由前端配置生成 LaunchSpec：vllm serve 的 argv（模型路径为位置参数）和环境变量"""
+    def value(key: str, default: str = "") -> str:
+        v = config.get(key, config.get(_CONFIG_ALIASES.get(key, ""), default))
+        return "" if v is None else str(v).strip()
+
+    def path(key: str) -> str:  # key 为 LAUNCH_PATH_KEYS 之一
+        v = value(key)
+        return _normalize_wsl_path(v) if v else ""
+
+    env_type = value("envType", "wsl")
+    conda_path = value("condaPath")
+    if env_type == "linux" and conda_path:
+        # 展开用户目录缩写（如 ~/miniconda3 -> /home/user/miniconda3）
+        conda_path = os.path.expanduser(conda_path)
+    elif env_type not in ("wsl", "linux") and not conda_path:
+        conda_path = os.path.expanduser("~/miniconda3")
+
+    # 允许空模型路径 - 命令仍将生成但可能无法运行（即使参数错误也可以生成命令）
+    argv = ["vllm", "serve"]
+    model_path = path("modelPath")
+    if model_path:
+        argv.append(model_path)
+    argv += ["--host", value("host", "0.0.0.0"), "--port", value("port", "8000"),
+             "--gpu-memory-utilization", value("gpuMemoryUtilization", "0.9"),
+             "--tensor-parallel-size", value("tensorParallel", "1")]
+    pipeline_parallel = value("pipelineParallelSize", "1")
+    if pipeline_parallel and pipeline_parallel != "1":
+        argv += ["--pipeline-parallel-size", pipeline_parallel]
+    if value("maxModelLen"):
+        argv += ["--max-model-len", value("maxModelLen")]
+    if value("dtype", "auto") not in ("", "auto"):
+        argv += ["--dtype", value("dtype")]
+    if value("quantization"):
+        argv += ["--quantization", value("quantization")]
+    if config.get("enablePrefixCaching"):
+        argv.append("--enable-prefix-caching")
+    if path("prefixCache"):
+        argv += ["--prefix-cache-dir", path("prefixCache")]
+    if config.get("enableChunked"):
+        argv.append("--enable-chunked-prefill")
+    if path("customAllReduce"):
+        argv += ["--custom-all-reduce", path("customAllReduce")]
+    argv += ["--max-num-seqs", value("maxNumSequences", "256"),
+             "--max-num-batched-tokens", value("maxNumBatchedTokens", "8192")]
+    for key, flag in (("servedModelName", "--served-model-name"), ("chatTemplate", "--chat-template"),
+                      ("toolCallParser", "--tool-call-parser"), ("reasoningParser", "--reasoning-parser")):
+        v = path(key) if key == "chatTemplate" else value(key)
+        if v:
+            argv += [flag, v]
+    for key, flag in (("trustRemoteCode", "--trust-remote-code"), ("enableExpertParallel", "--enable-expert-parallel"),
+                      ("enableAutoToolChoice", "--enable-auto-tool-choice"), ("asyncScheduling", "--async-scheduling")):
+        if config.get(key):
+            argv.append(flag)
+    custom_params = config.get("customParams", [])
+    for param in custom_params if isinstance(custom_params, list) else []:
+        if not isinstance(param, dict):
+            continue
+        param_name = str(param.get("name", "")).strip()
+        param_value = str(param.get("value", "")).strip()
+        if not param_name:
+            continue
+        if param.get("isFlag", False):
+            argv += _split_param_name(param_name)
+        elif param_value:
+            argv += _split_param_name(param_name) + [param_value]
+
+    # export 在 conda 激活之后执行。cudaDevices（由GPU分配器分配）放在最后，
+    # exportCommands 中的 CUDA_VISIBLE_DEVICES 不能覆盖分配结果
+    devices = value("cudaDevices", "0")
+    exports = []
+    for line in config.get("exportCommands", []) or []:
+        if line.strip():
+            export = _parse_export(line.strip())
+            if not (devices and export[0] == "CUDA_VISIBLE_DEVICES"):
+                exports.append(export)
+    if devices:
+        exports.append(("CUDA_VISIBLE_DEVICES", devices))
+
+    return LaunchSpec(env_type=env_type, wsl_path=value("wslPath", "wsl") or "wsl", conda_path=conda_path,
+                      conda_env=value("condaEnv", "vllm"), argv=tuple(argv), exports=tuple(exports))
+
+
+def render_launch_command(spec: LaunchSpec) -> str:
+    """把 LaunchSpec 渲染为 bash -c 形式的shell命令，每个参数单独加引号"""
+    outer, init, activate = _LAUNCH_SHELLS.get(spec.env_type, _LAUNCH_SHELLS["other"])
+    steps = [init] if init else []
+    # 确保在conda activate之前先source conda.sh初始化conda
+    steps.append(f"source {shlex.quote(spec.conda_path + '/etc/profile.d/conda.sh')} 2>/dev/null || true")
+    steps.append(activate.format(conda=shlex.quote(spec.conda_path), env=shlex.quote(spec.conda_env)))
+    steps += [v if name is None else f"export {name}={shlex.quote(v)}" for name, v in spec.exports]
+    steps.append(" ".join(shlex.quote(arg) for arg in spec.argv))
+    # 外层双引号中 \ " $ ` 仍有特殊含义，全部转义，使内层 bash -c 收到的脚本与 LaunchSpec 一致
+    script = re.sub(r'([\\"$`])', r"\\\1", " && ".join(steps))
+    return f'{outer.format(wsl=spec.wsl_path)} "{script}"'
+
+
+def _conda_env_prefix(conda_path: str, conda_env: str) -> str:
+    """conda环境的安装目录：base 为 conda 根目录，含 / 的视为环境路径"""
+    if not conda_env or conda_env == "base":
+        return conda_path
+    if "/" in conda_env:
+        return conda_env
+    return f"{conda_path}/envs/{conda_env}"
+
+
+def launch_process_args(spec: LaunchSpec, use_wsl: bool,
+                        activation: Optional[Dict[str, Optional[str]]] = None) -> tuple[List[str], Dict[str, Optional[str]]]:
+    """不经过shell直接启动所需的 argv 和环境变量（值为 None 表示删除该变量）
+
+    activation 为 CondaActivationCache 捕获的激活环境变化；没有时以环境目录的 bin 作为
+    PATH 首项并设置 CONDA_PREFIX，近似 source activate。
+    use_wsl 时通过 `wsl -e env [-u K] K=V ... vllm serve ...` 在WSL中启动。
+    """
+    if activation is not None:
+        variables = dict(activation)
+    else:
+        prefix = _conda_env_prefix(spec.conda_path, spec.conda_env)
+        variables = {"CONDA_PREFIX": prefix, "CONDA_DEFAULT_ENV": spec.conda_env}
+        variables["PATH"] = (f"{prefix}/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin" if use_wsl
+                             else os.pathsep.join([f"{prefix}/bin", os.environ.get("PATH", "")]))
+    variables.update((name, v) for name, v in spec.exports)
+    if use_wsl:
+        unset = [arg for name, v in variables.items() if v is None for arg in ("-u", name)]
+        assign = [f"{name}={v}" for name, v in variables.items() if v is not None]
+        return [spec.wsl_path, "-e", "env"] + unset + assign + list(spec.argv), {}
+    return list(spec.argv), variables
+
+
+class CondaActivationCache:
+    """conda环境激活后环境变量变化的缓存
+
+    对每个 (condaPath, condaEnv, 是否WSL) 在 bash 中执行一次 conda activate，比较激活前后的
+    `env -0` 输出，记录新增/修改/删除的变量；以环境目录下 conda-meta 的 mtime 为版本，
+    环境中安装或删除包后重新捕获。启动时把这些变化直接应用到子进程环境，不再逐次 source。
+    WSL 中通过常驻的 WSLShell 执行（输出经 base64 编码，避免 NUL 字节）。
+    """
+
+    _MARKER = b"__VLLM_GUI_ACTIVATED__"
+    # 每个shell各不相同、与激活无关的变量
+    _IGNORED = frozenset({"_", "SHLVL", "PWD", "OLDPWD"})
+
+    def __init__(self, bash: Optional[List[str]] = None, shell: Optional[Callable[[], WSLShell]] = None) -> None:
+        self._bash = bash or ["bash", "--noprofile", "--norc", "-c"]
+        self._shell = shell or wsl_shell
+        self._lock = threading.Lock()
+        self._entries: Dict[tuple, tuple] = {}  # key -> (conda-meta mtime, 变量变化)
+
+    def _script(self, conda_path: str, conda_env: str) -> str:
+        conda = shlex.quote(conda_path)
+        env = shlex.quote(conda_env)
+        return (f"env -0; printf '\\0%s\\0' {self._MARKER.decode()}; "
+                f"source {conda}/etc/profile.d/conda.sh >/dev/null 2>&1; "
+                f"{{ conda activate {env} || source {conda}/bin/activate {env}; }} >/dev/null 2>&1 || exit 3; "
+                f"env -0")
+
+    def _stamp(self, prefix: str, use_wsl: bool) -> Optional[str]:
+        meta = f"{prefix}/conda-meta"
+        if not use_wsl:
+            try:
+                return str(os.stat(meta).st_mtime_ns)
+            except OSError:
+                return None
+        try:
+            code, output = self._shell().run(f"stat -c %Y.%Z {shlex.quote(meta)}")
+        except Exception:
+            return None
+        return output.strip() if code == 0 else None
+
+    def _capture(self, conda_path: str, conda_env: str, use_wsl: bool) -> Optional[Dict[str, Optional[str]]]:
+        script = self._script(conda_path, conda_env)
+        try:
+            if use_wsl:
+                code, output = self._shell().run(f"( {script} ) | base64 -w0")
+                data = base64.b64decode(output) if code == 0 else b""
             else:
-                activate_cmd = f"conda activate {conda_env}"
-            
-            # 使用vllm serve启动 - 模型路径作为位置参数
-            # 从vllm_cmd_str中移除--model参数，将模型路径作为vllm serve的第一个参数
-            vllm_cmd_parts = vllm_cmd_str.split()
-            serve_cmd_parts = ["vllm", "serve"]
-            
-            # 查找--model参数并提取模型路径
-            model_path_arg = ""
-            i = 0
-            while i < len(vllm_cmd_parts):
-                if vllm_cmd_parts[i] == "--model" and i + 1 < len(vllm_cmd_parts):
-                    model_path_arg = vllm_cmd_parts[i + 1]
-                    i += 2  # 跳过--model和模型路径
-                else:
-                    serve_cmd_parts.append(vllm_cmd_parts[i])
-                    i += 1
-            
-            # 如果有模型路径，作为位置参数添加
-            if model_path_arg:
-                serve_cmd_parts.insert(2, model_path_arg)  # 在"vllm" "serve"之后插入模型路径
-            
-            vllm_start_cmd = " ".join(serve_cmd_parts)
-            full_command = f"wsl bash -c '{source_conda} && {activate_cmd} && {vllm_start_cmd}'"
+                result = subprocess.run(self._bash + [script], capture_output=True, timeout=CONDA_PROBE_TIMEOUT)
+                data = result.stdout if result.returncode == 0 else b""
+        except Exception:
+            return None
+        entries = data.split(b"\0")
+        if self._MARKER not in entries:
+            return None
+        split = entries.index(self._MARKER)
+
+        def parse(items) -> Dict[str, str]:
+            pairs = (item.decode("utf-8", errors="replace").partition("=") for item in items if b"=" in item)
+            return {name: v for name, _, v in pairs if name not in self._IGNORED}
+
+        before, after = parse(entries[:split]), parse(entries[split + 1:])
+        if not after:
+            return None  # 激活失败时脚本以非零状态退出，这里防御不完整的输出
+        changes: Dict[str, Optional[str]] = {name: v for name, v in after.items() if before.get(name) != v}
+        changes.update((name, None) for name in before if name not in after)
+        return changes
+
+    def get(self, conda_path: str, conda_env: str, use_wsl: bool = False) -> Optional[Dict[str, Optional[str]]]:
+        """返回激活带来的环境变量变化；环境不存在或激活失败时返回 None"""
+        if not conda_path:
+            return None
+        stamp = self._stamp(_conda_env_prefix(conda_path, conda_env), use_wsl)
+        if stamp is None:
+            return None
+        key = (conda_path, conda_env, use_wsl)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        changes = self._capture(conda_path, conda_env, use_wsl)
+        if changes is not None:
+            with self._lock:
+                self._entries[key] = (stamp, changes)
+        return changes
+
+
+conda_activation = CondaActivationCache()
+
+
+class VLLMController:
+    """单个vLLM实例：持有子进程、输出读取线程、日志流和统计指标
+
+    instance_id 为 DEFAULT_INSTANCE 时事件格式与单实例版本一致；其它实例的事件均带
+    "instance" 字段。manage_nvitop 为 False 的实例不启停全局的 nvitop 监控。
+    """
+
+    def __init__(self, hub: EventHub, instance_id: str = DEFAULT_INSTANCE,
+                 log: Optional[Logger] = None, manage_nvitop: bool = True) -> None:
+        self.instance_id = instance_id
+        self.logger = log or logger
+        self.manage_nvitop = manage_nvitop
+        self.config: dict = {}
+        self.scheme = ""
+        self.command = ""
+        self.on_exit: Optional[Callable[[bool], None]] = None   # 参数为是否非预期退出
+        self.on_ready: Optional[Callable[[], None]] = None
+        self._stopping: Optional[subprocess.Popen] = None        # stop() 正在终止的进程
+        self.process: Optional[subprocess.Popen] = None
+        self.is_running = False
+        self.command_queue: List[str] = []
+        self._lock = threading.Lock()
+        self._hub = hub
+        self.env_type = "wsl"
+        self._launch_cache: "OrderedDict[str, LaunchSpec]" = OrderedDict()
+        self.startup = StartupProfiler()
+        self.engine_metrics = EngineMetrics()
+        self.access_stats = AccessStats()
+        self._access_emit_second = 0
+
+    def _emit(self, event: str, payload: dict) -> None:
+        if self.instance_id != DEFAULT_INSTANCE:
+            payload = {**payload, "instance": self.instance_id}
+        self._hub.emit(event, payload)
+
+    def build_launch(self, config: dict) -> "LaunchSpec":
+        """由配置生成结构化的启动描述，按配置的规范化哈希缓存"""
+        config = dict(config)
+        if config.get("cudaDevices") == "auto":
+            # 由GPU分配器选择当前空闲的设备（先于缓存查找，分配变化时命中不同的键）；
+            # 空闲卡不够时保留 auto 占位，启动时排队分配，绝不生成不限制设备的命令
+            picked = gpu_allocator.preview(_device_count(config))
+            if len(picked) == _device_count(config):
+                config["cudaDevices"] = ",".join(map(str, picked))
+        if config.get("envType", "wsl") in ("wsl", "linux") and not config.get("condaPath"):
+            config["condaPath"] = _find_conda_path()
+        mounts = None
+        if any(str(config.get(k) or "").startswith("/mnt/") for k in LAUNCH_PATH_KEYS):
+            # /mnt 路径按挂载表规范化，挂载表变化后重新生成
+            mounts = (wsl_mount_resolver if IS_WINDOWS else mount_resolver).version()
+        key = hashlib.sha1(json.dumps([config, mounts], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        with self._lock:
+            spec = self._launch_cache.get(key)
+            if spec is not None:
+                self._launch_cache.move_to_end(key)
+                return spec
+
+        # 验证配置参数（仅记录警告，不阻止命令生成）
+        is_valid, error_msg = validate_config(_string_config(config))
+        if not is_valid:
+            self.logger.log("warning", f"配置验证警告（仍将生成命令）: {error_msg}")
+        spec = build_launch_spec(config)
+        with self._lock:
+            self._launch_cache[key] = spec
+            while len(self._launch_cache) > LAUNCH_CACHE_SIZE:
+                self._launch_cache.popitem(last=False)
+        return spec
 
-        return full_command
+    def generate_command(self, config: dict) -> str:
+        """生成可在终端执行的shell命令（用于预览、保存脚本和用户编辑后的启动）"""
+        return render_launch_command(self.build_launch(config))
 
     def generate_nvitop_command(self, env_type: str) -> list:
         """生成nvitop监控命令"""
@@ -724,112 +3098,37 @@ class VLLMController:
             return ["wsl", "nvitop", "-o"]
 
     def start_nvitop(self, env_type: str) -> None:
-        """启动nvitop监控进程"""
-        with self._lock:
-            if self.nvitop_process and self.nvitop_process.poll() is None:
-                return  # 进程仍在运行
-
-        try:
-            nvitop_cmd = self.generate_nvitop_command(env_type)
-            env = os.environ.copy()
-            env.update({
-                'PYTHONIOENCODING': 'utf-8',
-                'LANG': 'en_US.UTF-8',
-                'LC_ALL': 'en_US.UTF-8',
-            })
-
-            if env_type == "wsl" or (env_type == "wsl2" and IS_WINDOWS):
-                startupinfo = None
-                if IS_WINDOWS:
-                    startupinfo = subprocess.STARTUPINFO()  # type: ignore
-                    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW  # type: ignore
-                self.nvitop_process = subprocess.Popen(
-                    nvitop_cmd,
-                    shell=False,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    encoding='utf-8',
-                    errors='replace',
-                    env=env,
-                    startupinfo=startupinfo,
-                )
-            else:
-                self.nvitop_process = subprocess.Popen(
-                    nvitop_cmd,
-                    shell=False,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    encoding='utf-8',
-                    errors='replace',
-                    env=env,
-                )
-
-            logger.log("info", "nvitop监控已启动")
-
-            def read_nvitop_output():
-                proc = self.nvitop_process
-                try:
-                    if proc and proc.stdout:
-                        buffer = ""
-                        for line in proc.stdout:
-                            if line:
-                                buffer += line
-                                if "\n" in buffer:
-                                    lines = buffer.split("\n")
-                                    buffer = lines[-1] if len(lines) > 1 else ""
-                                    for l in lines[:-1]:
-                                        if l.strip():
-                                            try:
-                                                l = l.encode('utf-8').decode('utf-8', errors='replace')
-                                                socketio.emit("nvitop", {"output": l.strip()})
-                                            except Exception:
-                                                pass
-                        if buffer.strip():
-                            socketio.emit("nvitop", {"output": buffer.strip()})
-                except Exception:
-                    pass
-                finally:
-                    with self._lock:
-                        # 检查是否还是同一个进程，避免竞态条件
-                        if self.nvitop_process == proc:
-                            self.nvitop_process = None
-
-            threading.Thread(target=read_nvitop_output, daemon=True).start()
-
-        except subprocess.SubprocessError as e:
-            logger.log("error", f"nvitop启动失败: {str(e)}")
-        except Exception as e:
-            logger.log("error", f"nvitop启动异常: {str(e)}")
+        """启动GPU进程监控：定期运行 nvitop -o（未安装时用 nvidia-smi），推送结构化的进程变化"""
+        if gpu_process_monitor.running:
+            return
+        nvitop_cmd = self.generate_nvitop_command(env_type)
+        if not _nvitop_available(nvitop_cmd):
+            self.logger.log("warning", "未找到nvitop，改用nvidia-smi采集GPU进程")
+            nvitop_cmd = nvitop_cmd[:-2] + ["nvidia-smi"]
+        if gpu_process_monitor.start(nvitop_cmd):
+            self.logger.log("info", "nvitop监控已启动")
 
     def stop_nvitop(self) -> bool:
-        """停止nvitop监控进程"""
-        with self._lock:
-            if not self.nvitop_process:
-                return False
-            proc = self.nvitop_process
-
-        try:
-            if IS_WINDOWS:
-                subprocess.run(["taskkill", "/F", "/PID", str(proc.pid)], shell=False, capture_output=True)
-            else:
-                proc.terminate()
-            self.nvitop_process = None
-            logger.log("info", "nvitop监控已停止")
-            return True
-        except Exception as e:
-            logger.log("error", f"停止nvitop失败: {str(e)}")
+        """停止GPU进程监控"""
+        if not gpu_process_monitor.stop():
             return False
+        self.logger.log("info", "nvitop监控已停止")
+        return True
+
+    def run_command(self, command: str, env_type: str, launch: Optional[LaunchSpec] = None) -> None:
+        """启动vLLM进程
 
-    def run_command(self, command: str, env_type: str) -> None:
+        给出 launch 时直接以其 argv 启动（shell=False），不经过 bash -c，也不再 source
+        /etc/profile 和 ~/.bashrc；command 只用于日志。否则（如用户编辑过的命令）通过shell执行 command。
+        """
         self.env_type = env_type
 
         with self._lock:
             if self.process:
                 return
+        self.command = command
 
-        logger.log("info", f"启动命令: {command[:100]}...")
+        self.logger.log("info", f"启动命令: {command[:100]}...")
 
         env = os.environ.copy()
         env.update({
@@ -847,79 +3146,203 @@ class VLLMController:
             if env_type == "wsl" or env_type == "wsl2":
                 if not _wsl_command_exists():
                     # wsl命令不存在，尝试去除wsl前缀直接执行
-                    logger.log("warning", "wsl命令不存在，将在当前环境直接执行命令")
+                    self.logger.log("warning", "wsl命令不存在，将在当前环境直接执行命令")
                     if command.startswith("wsl "):
                         actual_command = command[4:]  # 去除 "wsl " 前缀
                     actual_env_type = "linux"  # 切换到linux模式执行
 
-            if actual_env_type == "linux":
+            startupinfo = None
+            if IS_WINDOWS:
+                startupinfo = subprocess.STARTUPINFO()  # type: ignore
+                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW  # type: ignore
+
+            self.startup.reset(time.monotonic())
+            if launch is not None and not launch.needs_shell:
+                use_wsl = actual_env_type != "linux"
+                activation = conda_activation.get(launch.conda_path, launch.conda_env, use_wsl)
+                argv, variables = launch_process_args(launch, use_wsl, activation)
+                for name, value in variables.items():
+                    if value is None:
+                        env.pop(name, None)
+                    else:
+                        env[name] = value
+                # 以二进制模式读取，解码在OutputSplitter中进行
+                self.process = subprocess.Popen(
+                    argv,
+                    shell=False,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    env=env,
+                    startupinfo=startupinfo,
+                )
+            elif actual_env_type == "linux":
                 self.process = subprocess.Popen(
                     actual_command,
                     shell=True,
                     executable='/bin/bash',  # 明确使用bash，source命令需要bash
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
-                    text=True,
-                    encoding='utf-8',
-                    errors='replace',
                     env=env,
                 )
             else:
                 # Windows或WSL环境
-                startupinfo = None
-                if IS_WINDOWS:
-                    startupinfo = subprocess.STARTUPINFO()  # type: ignore
-                    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW  # type: ignore
                 self.process = subprocess.Popen(
                     actual_command,
                     shell=True,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
-                    text=True,
-                    encoding='utf-8',
-                    errors='replace',
                     env=env,
                     startupinfo=startupinfo,
                 )
 
             self.is_running = True
-            self._socketio.emit("status", {"running": True, "pid": self.process.pid})
+            self._emit("status", {"running": True, "pid": self.process.pid})
+            threading.Thread(target=self._poll_health, args=(self.process, self._health_port(command)),
+                             name=f"health-{self.instance_id}", daemon=True).start()
 
-            self.start_nvitop(env_type)
+            if self.manage_nvitop:
+                self.start_nvitop(env_type)
 
-        except subprocess.SubprocessError as e:
-            logger.log("error", f"子进程执行失败: {str(e)}")
-            self._socketio.emit("status", {"running": False, "error": str(e)})
+        except (subprocess.SubprocessError, OSError) as e:
+            # shell=False 时找不到可执行文件会抛出 OSError
+            self.logger.log("error", f"子进程执行失败: {str(e)}")
+            self._emit("status", {"running": False, "error": str(e)})
             return
 
         def read_output():
+            splitter = OutputSplitter()
+            classifier = LineClassifier()
+            last_progress = 0.0
+            proc = self.process
             try:
-                proc = self.process
                 if proc and proc.stdout:
-                    for line in proc.stdout:
-                        if line:
-                            try:
-                                line = line.encode('utf-8').decode('utf-8', errors='replace')
-                                if "WARNING" in line:
-                                    logger.log("warning", line.strip())
-                                elif "ERROR" in line or "Traceback" in line:
-                                    logger.log("error", line.strip())
-                                else:
-                                    logger.log("info", line.strip())
-                            except Exception:
-                                logger.log("info", line.strip())
+                    # eventlet 模式下 stdout 是非阻塞的 GreenFileIO，没有 read1，read 同样返回已到达的数据
+                    read = getattr(proc.stdout, "read1", proc.stdout.read)
+                    while True:
+                        data = read(OUTPUT_READ_CHUNK)
+                        if not data:
+                            break
+                        for line in splitter.feed(data):
+                            for level, message in classifier.feed(line):
+                                self._handle_output(level, message)
+                        progress = splitter.take_progress()
+                        if progress and time.monotonic() - last_progress >= OUTPUT_PROGRESS_INTERVAL:
+                            last_progress = time.monotonic()
+                            for level, message in classifier.feed(progress):
+                                self._handle_output(level, message)
                     proc.wait()
             except Exception:
                 pass
             finally:
-                self.stop_nvitop()
+                for line in splitter.flush():
+                    for level, message in classifier.feed(line):
+                        self._handle_output(level, message)
+                for level, message in classifier.flush():
+                    self._handle_output(level, message)
+                if not self.startup.done:
+                    self.startup.finish()
+                    self._record_startup()
+                if self.manage_nvitop:
+                    self.stop_nvitop()
                 with self._lock:
-                    self.is_running = False
-                    self.process = None
-                self._socketio.emit("status", {"running": False})
+                    # stop() 之后可能已经重新启动了新进程，此时不能覆盖新进程的状态
+                    current = self.process is proc or self.process is None
+                    if current:
+                        self.is_running = False
+                        self.process = None
+                if current:
+                    self._emit("status", {"running": False})
+                    if self.on_exit:
+                        self.on_exit(self._stopping is not proc)
 
         threading.Thread(target=read_output, daemon=True).start()
 
+    def probe(self, timeout: Optional[float] = None) -> bool:
+        """探测 OpenAI 兼容服务的 /health 和 /v1/models，都返回200时为健康"""
+        timeout = timeout or HEALTH_PROBE_TIMEOUT
+        base = f"http://127.0.0.1:{self._health_port(self.command)}"
+        for path in ("/health", "/v1/models"):
+            try:
+                with urllib.request.urlopen(base + path, timeout=timeout) as response:
+                    if response.status != 200:
+                        return False
+            except Exception:
+                return False
+        return True
+
+    def _health_port(self, command: str) -> str:
+        port = str(self.config.get("port", "")).strip()
+        if port:
+            return port
+        match = re.search(r"--port[= ]+['\"]?(\d+)", command)
+        return match.group(1) if match else "8000"
+
+    def _poll_health(self, proc: subprocess.Popen, port: str) -> None:
+        """轮询本机 /health 直到返回200、进程退出或被新进程替换"""
+        url = f"http://127.0.0.1:{port}/health"
+        while self.process is proc and proc.poll() is None and not self.startup.done:
+            try:
+                with urllib.request.urlopen(url, timeout=STARTUP_HEALTH_INTERVAL * 2) as response:
+                    if response.status == 200:
+                        if self.startup.mark("health"):
+                            self._on_milestone("health")
+                        return
+            except Exception:
+                pass
+            time.sleep(STARTUP_HEALTH_INTERVAL)
+
+    def _on_milestone(self, name: str) -> None:
+        elapsed = self.startup.report()["elapsed"].get(name)
+        self._emit("startup", {"phase": name, "elapsed": elapsed})
+        if name == "health":
+            report = self._record_startup()
+            summary = ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in report["phases"].items())
+            self.logger.log("success", f"vLLM已就绪，启动耗时 {report['total']:.1f}s（{summary}）")
+            if self.on_ready:
+                self.on_ready()
+
+    def _record_startup(self) -> dict:
+        """保存本次启动的阶段耗时（就绪或就绪前退出时调用）"""
+        report = self.startup.report()
+        try:
+            startup_history.record(self.scheme or "", report, self.config, self.instance_id)
+        except Exception as e:
+            self.logger.log("warning", f"保存启动耗时失败: {str(e)}")
+        self._emit("startup", {"phase": "done", **report})
+        return report
+
+    def _handle_output(self, level: str, message: str) -> None:
+        """处理一条已分级的子进程输出：提取统计指标和启动里程碑并写入日志"""
+        try:
+            if not self.startup.done:
+                for milestone in self.startup.feed(message):
+                    self._on_milestone(milestone)
+            if level == "info":
+                sample = parse_engine_metrics(message)
+                if sample:
+                    self.engine_metrics.record(sample)
+                    # 只推送新增样本，前端自行追加到图表
+                    self._emit("metrics", sample._asdict())
+                elif self.access_stats.record(message):
+                    self._emit_access_stats()
+        except Exception:
+            pass
+        self.logger.log(level, message)
+
+    def _emit_access_stats(self) -> None:
+        """每秒最多推送一次最近10秒的访问统计"""
+        second = int(time.time())
+        if second == self._access_emit_second:
+            return
+        self._access_emit_second = second
+        stats = self.access_stats.rates(10)
+        self._emit("access_stats", {
+            "rps": round(stats["rps"], 2),
+            "error_rate": round(stats["error_rate"], 4),
+            "endpoints": {k: round(v, 2) for k, v in stats["endpoints"].items()},
+            "status": {k: round(v, 2) for k, v in stats["status"].items()},
+        })
+
     def stop(self, keep_nvitop: bool = True) -> bool:
         """停止vLLM进程，支持Windows和Linux/WSL环境
         
@@ -933,12 +3356,14 @@ class VLLMController:
                     return True
                 return False
             proc = self.process
+            self._stopping = proc
 
         try:
             # 保存env_type用于后续重启nvitop
             env_type = getattr(self, 'env_type', 'wsl')
             
             # 先停止nvitop（如果需要保持运行，稍后会重启）
+            keep_nvitop = keep_nvitop and self.manage_nvitop
             if keep_nvitop:
                 self.stop_nvitop()
             
@@ -972,8 +3397,8 @@ class VLLMController:
             
             self.process = None
             self.is_running = False
-            logger.log("info", "服务已停止")
-            self._socketio.emit("status", {"running": False})
+            self.logger.log("info", "服务已停止")
+            self._emit("status", {"running": False})
             
             # 如果需要保持nvitop运行，则重启它
             if keep_nvitop:
@@ -981,11 +3406,11 @@ class VLLMController:
             
             return True
         except Exception as e:
-            logger.log("error", f"停止服务失败: {str(e)}")
+            self.logger.log("error", f"停止服务失败: {str(e)}")
             # 即使出错，也重置状态
             self.process = None
             self.is_running = False
-            self._socketio.emit("status", {"running": False})
+            self._emit("status", {"running": False})
             return False
 
     def send_command(self, cmd: str) -> None:
@@ -993,11 +3418,345 @@ class VLLMController:
             return
 
         self.command_queue.append(cmd)
-        logger.log("command", f"执行命令: {cmd}")
-        self._socketio.emit("command_sent", {"command": cmd})
+        self.logger.log("command", f"执行命令: {cmd}")
+        self._emit("command_sent", {"command": cmd})
+
+
+class RestartState:
+    """单个实例的自动重启状态：最近的故障时间、退避、等待中的重启和每次故障的恢复耗时"""
+
+    def __init__(self) -> None:
+        self.timer: Optional[threading.Timer] = None
+        self.reset()
+
+    def reset(self) -> None:
+        """取消等待中的重启并清空全部状态（重新启动实例时调用）"""
+        self.cancel()
+        self.enabled = False
+        self.launch: Optional[tuple] = None      # (command, env_type, config, scheme)
+        self.crashes: List[float] = []           # 窗口内的故障时刻
+        self.restarts = 0
+        self.crash_loop = False
+        self.failed_at: Optional[float] = None   # 当前故障开始的时刻，恢复后清空
+        self.recoveries: List[float] = []        # 每次故障到重新就绪的秒数
+        self.probe_failures = 0
+        self.was_ready = False                   # 本次启动后是否就绪过
+
+    def record_failure(self, now: float) -> Optional[float]:
+        """记录一次故障，返回重启前应等待的秒数；崩溃循环时返回 None"""
+        self.crashes = [t for t in self.crashes if now - t < RESTART_CRASH_WINDOW] + [now]
+        if self.failed_at is None:
+            self.failed_at = now
+        if len(self.crashes) > RESTART_MAX_CRASHES:
+            self.crash_loop = True
+            return None
+        return min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * 2 ** (len(self.crashes) - 1))
+
+    def record_recovery(self, now: float) -> Optional[float]:
+        """重新就绪时调用，返回本次故障的恢复耗时"""
+        if self.failed_at is None:
+            return None
+        duration, self.failed_at = now - self.failed_at, None
+        self.recoveries.append(duration)
+        return duration
+
+    @property
+    def mttr(self) -> Optional[float]:
+        return sum(self.recoveries) / len(self.recoveries) if self.recoveries else None
+
+    def cancel(self) -> None:
+        timer, self.timer = self.timer, None
+        if timer:
+            timer.cancel()
+
+    def summary(self) -> dict:
+        return {
+            "autoRestart": self.enabled,
+            "restarts": self.restarts,
+            "crashLoop": self.crash_loop,
+            "recoveries": len(self.recoveries),
+            "mttr": round(self.mttr, 3) if self.mttr is not None else None,
+        }
+
+
+class VLLMSupervisor:
+    """按实例id管理多个vLLM实例
+
+    每个实例是一个独立的 VLLMController：自己的子进程和读取线程、自己的 Logger
+    （独立的写入线程和日志文件 "logs-<id>.txt"）以及自己的引擎/访问统计，
+    因此输出很多的实例不会拖慢其它实例的日志。默认实例沿用全局 logger 和 nvitop 监控。
+
+    以 auto_restart 启动并至少就绪过一次的实例：进程非预期退出、就绪后 /health 或 /v1/models 连续
+    HEALTH_PROBE_FAILURES 次探测失败、或超过 STARTUP_TIMEOUT 仍未就绪时，按指数退避自动重启；
+    RESTART_CRASH_WINDOW 秒内故障超过 RESTART_MAX_CRASHES 次视为崩溃循环，不再重启。
+    每次故障到重新就绪的耗时计入 MTTR。
+    """
+
+    def __init__(self, hub: EventHub, default: VLLMController,
+                 allocator: Optional[GPUAllocator] = None) -> None:
+        self._hub = hub
+        self._instances: Dict[str, VLLMController] = {}
+        self._restart: Dict[str, RestartState] = {}
+        self._monitor: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.allocator = allocator or gpu_allocator
+        self._add(default)
+
+    def _add(self, controller: VLLMController) -> None:
+        self._instances[controller.instance_id] = controller
+        self._restart[controller.instance_id] = RestartState()
+        controller.on_exit = lambda crashed: self._on_exit(controller, crashed)
+        controller.on_ready = lambda: self._on_ready(controller)
+
+    def get(self, instance_id: Optional[str] = None) -> Optional[VLLMController]:
+        return self._instances.get(instance_id or DEFAULT_INSTANCE)
+
+    def get_or_create(self, instance_id: Optional[str] = None) -> VLLMController:
+        instance_id = instance_id or DEFAULT_INSTANCE
+        if not INSTANCE_ID_RE.match(instance_id):
+            raise ValueError("实例id只能包含字母、数字、下划线、点和连字符（最多32个字符）")
+        with self._lock:
+            controller = self._instances.get(instance_id)
+            if controller is None:
+                root, ext = os.path.splitext(LOGS_FILE)
+                log = Logger(f"{root}-{instance_id}{ext}", instance=instance_id)
+                controller = VLLMController(self._hub, instance_id, log, manage_nvitop=False)
+                self._add(controller)
+            return controller
+
+    def remove(self, instance_id: str) -> bool:
+        """移除已停止的实例（默认实例不可移除）"""
+        with self._lock:
+            controller = self._instances.get(instance_id)
+            if (instance_id == DEFAULT_INSTANCE or controller is None or controller.process
+                    or self.allocator.is_queued(instance_id)):
+                return False
+            del self._instances[instance_id]
+            # 退避等待中的重启随实例一起取消，否则会启动一个无法再通过API停止的进程
+            state = self._restart.pop(instance_id, None)
+        if state is not None:
+            state.enabled = False
+            state.cancel()
+        controller.logger.close()
+        return True
+
+    def run(self, instance_id: Optional[str], command: str, env_type: str,
+            config: Optional[dict] = None, scheme: str = "", auto_restart: bool = False) -> Optional[str]:
+        """在指定实例中启动命令，成功（含排队）返回 None，否则返回错误信息
+
+        auto_restart 为 True 时由监控线程做健康检查，故障后自动重启（见类说明）。
+        """
+        controller = self.get_or_create(instance_id)
+        if controller.process or self.allocator.is_queued(controller.instance_id):
+            return f"实例 {controller.instance_id} 已在运行"
+        state = self._restart[controller.instance_id]
+        state.reset()
+        state.enabled = auto_restart
+        state.launch = (command, env_type, config, scheme)
+        error = self._start(controller, command, env_type, config, scheme)
+        if error is None and auto_restart:
+            self._ensure_monitor()
+        return error
+
+    def _start(self, controller: VLLMController, command: str, env_type: str,
+               config: Optional[dict] = None, scheme: str = "") -> Optional[str]:
+        """启动实例进程（run 和自动重启共用）
+
+        command 为空时在启动时由 config 生成命令。config 中的 cudaDevices 会向GPU分配器申请：
+        "auto" 表示任意 张量并行×流水线并行 张卡，命令中的 CUDA_VISIBLE_DEVICES=auto
+        替换为分配到的设备；指定的设备列表只做占用检查。设备不足时请求排队，status 事件
+        带 queued=True，待其它实例退出释放设备后自动启动。
+        """
+        instance_id = controller.instance_id
+        config = config or {}
+        port = str(config.get("port", "")).strip()
+        with self._lock:
+            if controller.process or self.allocator.is_queued(instance_id):
+                return f"实例 {instance_id} 已在运行"
+            if port:
+                for other in self._instances.values():
+                    if other is not controller and other.process and str(other.config.get("port", "")) == port:
+                        return f"端口 {port} 已被实例 {other.instance_id} 使用"
+            controller.config = config
+            controller.scheme = scheme
+
+        # 没有填写 cudaDevices 时，快速参数中的 export CUDA_VISIBLE_DEVICES 同样向分配器申请
+        cuda_devices = str(config.get("cudaDevices", "")).strip() or (
+            "" if command else _exported_devices(config))
+        if not cuda_devices:
+            self._launch(controller, command, env_type, config)
+            return None
+
+        auto = cuda_devices == "auto"
+        count = _device_count(config)
+        devices = None if auto else [int(d) for d in cuda_devices.split(",") if d.strip().isdigit()]
+        error = self.allocator.check(count, devices)
+        if error:
+            return error
+
+        def launch(picked: List[int]) -> None:
+            assigned = ",".join(map(str, picked))
+            launch_config = {**config, "cudaDevices": assigned}
+            controller.config = launch_config
+            launch_command = command.replace("CUDA_VISIBLE_DEVICES=auto", f"CUDA_VISIBLE_DEVICES={assigned}")
+            self._launch(controller, launch_command, env_type, launch_config)
+            if controller.process is None:
+                self.allocator.release(instance_id)
+
+        picked = self.allocator.request(instance_id, launch, count, devices)
+        if picked is None:
+            controller.logger.log("warning", f"GPU不足，实例 {instance_id} 已排队等待空闲设备")
+            controller._emit("status", {"running": False, "queued": True})
+        else:
+            launch(picked)
+        return None
+
+    @staticmethod
+    def _launch(controller: VLLMController, command: str, env_type: str, config: dict) -> None:
+        """启动实例：用户给出的命令经shell执行，否则由配置生成结构化启动描述直接启动"""
+        if command:
+            controller.run_command(command, env_type)
+        else:
+            launch = controller.build_launch({**config, "envType": env_type})
+            controller.run_command(render_launch_command(launch), env_type, launch)
+
+    def _on_exit(self, controller: VLLMController, crashed: bool) -> None:
+        # 进程退出后归还GPU，并由分配器启动排队中的实例
+        self.allocator.release(controller.instance_id)
+        state = self._restart.get(controller.instance_id)
+        if crashed and state is not None and state.enabled:
+            self._schedule_restart(controller, state, "vLLM进程异常退出")
+
+    def _on_ready(self, controller: VLLMController) -> None:
+        state = self._restart.get(controller.instance_id)
+        if state is None:
+            return
+        state.probe_failures = 0
+        state.was_ready = True
+        duration = state.record_recovery(time.monotonic())
+        if duration is not None:
+            controller.logger.log("success", f"实例 {controller.instance_id} 已恢复，本次故障恢复耗时 "
+                                             f"{duration:.1f}s（MTTR {state.mttr:.1f}s）")
+
+    def _schedule_restart(self, controller: VLLMController, state: RestartState, reason: str) -> None:
+        if not state.was_ready:
+            # 从未就绪（配置错误、启动时显存不足等）时重启只会重复同样的失败
+            state.enabled = False
+            controller.logger.log("error", f"{reason}：实例启动后从未就绪，不自动重启")
+            return
+        delay = state.record_failure(time.monotonic())
+        if delay is None:
+            state.enabled = False
+            controller.logger.log("error", f"{reason}：{RESTART_CRASH_WINDOW:.0f}秒内已故障{len(state.crashes)}次，"
+                                           f"判定为崩溃循环，停止自动重启")
+            controller._emit("status", {"running": False, "crashLoop": True})
+            return
+        controller.logger.log("warning", f"{reason}，{delay:.1f}秒后自动重启（第{state.restarts + 1}次）")
+        controller._emit("status", {"running": False, "restarting": True, "retryIn": delay})
+        state.timer = threading.Timer(delay, self._restart_instance, args=(controller, state))
+        state.timer.daemon = True
+        state.timer.start()
+
+    def _restart_instance(self, controller: VLLMController, state: RestartState) -> None:
+        if self._restart.get(controller.instance_id) is not state or not state.enabled or state.timer is None:
+            return  # 等待期间被停止或重新启动
+        state.timer = None
+        state.restarts += 1
+        state.probe_failures = 0
+        command, env_type, config, scheme = state.launch
+        error = self._start(controller, command, env_type, config, scheme)
+        if error:
+            self._schedule_restart(controller, state, f"自动重启失败: {error}")
+
+    def _ensure_monitor(self) -> None:
+        with self._lock:
+            if self._monitor is None:
+                self._monitor = threading.Thread(target=self._monitor_loop, name="vllm-supervisor", daemon=True)
+                self._monitor.start()
+
+    def _monitor_loop(self) -> None:
+        """对开启自动重启的实例做健康检查；没有这样的实例时退出
+
+        各实例的探测同时进行，一个卡住的实例最多让这一轮等待 HEALTH_PROBE_TIMEOUT。
+        """
+        while True:
+            time.sleep(HEALTH_PROBE_INTERVAL)
+            with self._lock:
+                watched = [(c, self._restart[c.instance_id]) for c in self._instances.values()
+                           if self._restart[c.instance_id].enabled]
+                if not watched:
+                    self._monitor = None
+                    return
+            checks = [threading.Thread(target=self._check_safely, args=item, daemon=True) for item in watched]
+            for check in checks:
+                check.start()
+            for check in checks:
+                check.join()
+
+    def _check_safely(self, controller: VLLMController, state: RestartState) -> None:
+        try:
+            self._check(controller, state)
+        except Exception as e:
+            controller.logger.log("warning", f"健康检查出错: {str(e)}")
+
+    def _check(self, controller: VLLMController, state: RestartState) -> None:
+        if not controller.process or state.timer is not None:
+            return
+        startup = controller.startup
+        if startup.ready:
+            if controller.probe():
+                state.probe_failures = 0
+                return
+            state.probe_failures += 1
+            if state.probe_failures < HEALTH_PROBE_FAILURES:
+                return
+            reason = f"健康检查连续失败{state.probe_failures}次"
+        elif not startup.done and startup.started is not None and time.monotonic() - startup.started > STARTUP_TIMEOUT:
+            reason = f"超过{STARTUP_TIMEOUT:.0f}秒仍未就绪"
+        else:
+            return
+        state.probe_failures = 0
+        # stop() 结束的进程不会再触发 on_exit 中的重启，这里自行安排
+        controller.stop()
+        self._schedule_restart(controller, state, f"实例 {controller.instance_id} {reason}")
+
+    def stop(self, instance_id: Optional[str] = None) -> bool:
+        """停止实例；排队中的实例直接取消排队"""
+        controller = self.get(instance_id)
+        if controller is None:
+            return False
+        state = self._restart.get(controller.instance_id)
+        if state is not None:
+            state.enabled = False
+            state.cancel()
+        if self.allocator.cancel(controller.instance_id):
+            controller._emit("status", {"running": False})
+            return True
+        return controller.stop()
+
+    def stop_all(self) -> None:
+        """停止所有实例并写完各实例的日志"""
+        for controller in list(self._instances.values()):
+            self.stop(controller.instance_id)
+            controller.logger.flush()
 
+    def instances(self) -> List[dict]:
+        return [{
+            "id": controller.instance_id,
+            "running": controller.is_running,
+            "queued": self.allocator.is_queued(controller.instance_id),
+            "pid": controller.process.pid if controller.process else None,
+            "scheme": controller.scheme,
+            "port": controller.config.get("port", ""),
+            "cudaDevices": controller.config.get("cudaDevices", ""),
+            "logFile": controller.logger.active_path,
+            **self._restart[controller.instance_id].summary(),
+        } for controller in list(self._instances.values())]
 
-vllm_controller = VLLMController(socketio)
+
+scheme_repository = SchemeRepository(SCHEMES_FILE)
+vllm_controller = VLLMController(event_hub)
+supervisor = VLLMSupervisor(event_hub, vllm_controller)
 
 
 @app.route("/")
@@ -1015,6 +3774,44 @@ def health_check():
     return jsonify({"status": "ok", "running": vllm_controller.is_running})
 
 
+def _instance_or_404():
+    """按查询参数或JSON中的 instance 查找实例，不存在时返回 (None, 404响应)"""
+    data = request.get_json(silent=True) if request.method != "GET" else None
+    instance_id = request.args.get("instance") or (data or {}).get("instance") or DEFAULT_INSTANCE
+    controller = supervisor.get(instance_id)
+    if controller is None:
+        return None, (jsonify({"success": False, "error": f"实例不存在: {instance_id}"}), 404)
+    return controller, None
+
+
+@app.route("/api/instances", methods=["GET"])
+def api_list_instances():
+    return jsonify({"success": True, "instances": supervisor.instances()})
+
+
+@app.route("/api/instances", methods=["POST"])
+def api_create_instance():
+    data = request.get_json(force=True, silent=True) or {}
+    try:
+        controller = supervisor.get_or_create(data.get("id", ""))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({"success": True, "id": controller.instance_id})
+
+
+@app.route("/api/gpu-allocation", methods=["GET"])
+def api_gpu_allocation():
+    """GPU分配情况：设备清单、空闲设备、各实例占用的设备和排队中的实例"""
+    return jsonify({"success": True, **supervisor.allocator.status()})
+
+
+@app.route("/api/instances/<instance_id>", methods=["DELETE"])
+def api_remove_instance(instance_id):
+    if supervisor.remove(instance_id):
+        return jsonify({"success": True})
+    return jsonify({"success": False, "error": "实例不存在、正在运行或为默认实例"}), 400
+
+
 @app.route("/api/detect-environment", methods=["GET"])
 def detect_environment():
     """Detect the current environment type: native Linux, WSL, or Windows"""
@@ -1080,7 +3877,19 @@ def detect_conda():
     """Detect conda installation path and available environments"""
     conda_path = _find_conda_path()
     envs = []
-    
+
+    if IS_WINDOWS:
+        # conda 安装在WSL中，通过WSL会话一次列出
+        try:
+            code, output = wsl_shell().run(
+                f"cd {shlex.quote(conda_path)} && {{ [ -e bin/python ] && echo base; "
+                f"for d in envs/*/; do [ -e \"$d/bin/python\" ] && basename \"$d\"; done; true; }}")
+            if code == 0:
+                envs = output.split()
+        except Exception:
+            pass
+        return jsonify({"conda_path": conda_path, "environments": envs})
+
     # List available environments
     envs_dir = os.path.join(conda_path, "envs")
     if os.path.exists(envs_dir):
@@ -1129,13 +3938,8 @@ def validate_conda_path():
         # 验证用户提供的路径
         if use_wsl:
             # 只有真正在WSL环境中才使用wsl命令检查路径
-            result = subprocess.run(
-                ["wsl", "test", "-f", f"{user_conda_path}/bin/activate"],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            if result.returncode == 0:
+            code, _ = wsl_shell().run(f"test -f {shlex.quote(user_conda_path + '/bin/activate')}")
+            if code == 0:
                 return jsonify({
                     "valid": True,
                     "path": user_conda_path,
@@ -1189,13 +3993,31 @@ def api_generate_command():
 
 @app.route("/api/run", methods=["POST"])
 def api_run():
+    """在实例中启动服务
+
+    JSON参数: instance（默认 default，不存在时自动创建）、command 或 config（由其生成命令）、
+    schemeId（使用已保存方案的配置和环境类型）、scheme（方案名，用于记录启动耗时）、envType
+    """
     try:
         data = request.get_json(force=True, silent=True) or {}
+        instance_id = data.get("instance") or DEFAULT_INSTANCE
         command = data.get("command", "")
         env_type = data.get("envType", "wsl")
-        if command:
-            vllm_controller.run_command(command, env_type)
-            return jsonify({"success": True, "status": "started"})
+        config = data.get("config") or {}
+        scheme_name = str(data.get("scheme") or "")
+        if data.get("schemeId") is not None:
+            scheme = scheme_repository.get(data["schemeId"])
+            if not scheme:
+                return jsonify({"success": False, "error": "方案不存在"}), 404
+            config = scheme.get("config", {})
+            env_type = scheme.get("envType", env_type)
+            scheme_name = scheme.get("name", "")
+        if command or config:
+            error = supervisor.run(instance_id, command, env_type, config, scheme_name,
+                                   auto_restart=bool(data.get("autoRestart")))
+            if error:
+                return jsonify({"success": False, "error": error}), 409
+            return jsonify({"success": True, "status": "started", "instance": instance_id})
         return jsonify({"success": False, "error": "No command provided"}), 400
     except Exception as e:
         logger.log("error", f"Failed to run command: {str(e)}")
@@ -1204,7 +4026,10 @@ def api_run():
 
 @app.route("/api/stop", methods=["POST"])
 def api_stop():
-    success = vllm_controller.stop()
+    controller, error = _instance_or_404()
+    if error:
+        return error
+    success = supervisor.stop(controller.instance_id)
     return jsonify({"success": success})
 
 
@@ -1243,54 +4068,113 @@ def api_save_script():
 
 @app.route("/api/logs", methods=["GET"])
 def api_logs():
-    if os.path.exists(LOGS_FILE):
-        with open(LOGS_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            last_lines = lines[-500:] if len(lines) > 500 else lines
-            return jsonify({"logs": "".join(last_lines)})
-    return jsonify({"logs": ""})
+    """返回活动日志段的最后N行
+
+    查询参数: lines（默认500，最多5000）、since_offset（上次返回的offset，只取新增部分）、
+    level（逗号分隔的日志级别过滤，如 warning,error）、instance（实例id，默认 default）
+    """
+    controller, error = _instance_or_404()
+    if error:
+        return error
+    log_path = controller.logger.active_path
+    lines = max(1, min(request.args.get("lines", 500, type=int), 5000))
+    since_offset = request.args.get("since_offset", 0, type=int)
+    level = request.args.get("level", "").strip()
+    levels = [lv.strip() for lv in level.split(",") if lv.strip()] or None
+    if os.path.exists(log_path):
+        tail, offset = _tail_log(log_path, lines, since_offset, levels)
+        return jsonify({"logs": "\n".join(tail) + "\n" if tail else "", "offset": offset})
+    return jsonify({"logs": "", "offset": 0})
+
+
+@app.route("/api/metrics/engine", methods=["GET"])
+def api_engine_metrics():
+    """vLLM引擎统计时间序列，window为最近N秒（默认全部），engine为引擎编号（默认全部）"""
+    controller, error = _instance_or_404()
+    if error:
+        return error
+    window = request.args.get("window", type=float)
+    engine = request.args.get("engine")
+    return jsonify({
+        "status": "ok",
+        "engines": controller.engine_metrics.window(window, engine),
+    })
+
+
+@app.route("/api/startup", methods=["GET"])
+def api_startup():
+    """实例最近一次启动的里程碑时间和阶段耗时（秒）"""
+    controller, error = _instance_or_404()
+    if error:
+        return error
+    return jsonify({"status": "ok", "startup": controller.startup.report()})
+
+
+@app.route("/api/startup/history", methods=["GET"])
+def api_startup_history():
+    """按方案保存的启动耗时记录，scheme 为方案名（不指定时返回全部方案）"""
+    return jsonify({"status": "ok", "history": startup_history.get(request.args.get("scheme"))})
+
+
+@app.route("/api/metrics/access", methods=["GET"])
+def api_access_metrics():
+    """vLLM访问日志统计，window为滑动窗口秒数（1-60，默认60）"""
+    controller, error = _instance_or_404()
+    if error:
+        return error
+    window = request.args.get("window", ACCESS_STATS_WINDOW, type=int)
+    return jsonify({"status": "ok", **controller.access_stats.rates(window)})
 
 
 @app.route("/api/clear-logs", methods=["POST"])
 def api_clear_logs():
+    controller, error = _instance_or_404()
+    if error:
+        return error
     with logs_lock:
-        with open(LOGS_FILE, "w", encoding="utf-8") as f:
-            f.write("")
+        controller.logger.clear()
     return jsonify({"status": "cleared"})
 
 
 @app.route("/api/gpu-status", methods=["GET"])
 def api_gpu_status():
-    try:
-        result = subprocess.run(
-            ["nvidia-smi", "--query-gpu=name,memory.used,memory.total,utilization.gpu,temperature.gpu,power.draw,fan.speed",
-             "--format=csv,noheader,nounits"],
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-            timeout=5
-        )
-        if result.returncode == 0:
-            gpus = []
-            for line in result.stdout.strip().split("\n"):
-                if line:
-                    parts = [p.strip() for p in line.split(",")]
-                    if len(parts) >= 7:
-                        gpus.append({
-                            "name": parts[0],
-                            "memory_used": parts[1],
-                            "memory_total": parts[2],
-                            "utilization": parts[3],
-                            "temperature": parts[4],
-                            "power": parts[5],
-                            "fan_speed": parts[6]
-                        })
-            return jsonify({"status": "ok", "gpus": gpus})
-        else:
-            return jsonify({"status": "error", "message": "无法获取GPU信息"})
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)})
+    """返回后台采样的GPU状态快照"""
+    return jsonify(gpu_telemetry.snapshot())
+
+
+@app.route("/api/gpu-history", methods=["GET"])
+def api_gpu_history():
+    """GPU读数的历史（每桶 min/max/mean）
+
+    start/end 为 Unix 秒，或用 window 表示最近N秒；resolution 为 1/10/60 秒（默认按时间范围选择），
+    gpu 为GPU序号。launches 列出时间范围内的启动记录及其配置，便于对照显存峰值。
+    """
+    end = request.args.get("end", type=float)
+    window = request.args.get("window", type=float)
+    start = request.args.get("start", type=float)
+    if start is None:
+        start = (end or time.time()) - window if window else 0.0
+    history = gpu_telemetry.history.query(start, end, request.args.get("resolution", type=int),
+                                          request.args.get("gpu"))
+    launches = []
+    for scheme, records in startup_history.get().items():
+        for record in records:
+            try:
+                started = datetime.fromisoformat(record.get("startedAt") or "").timestamp()
+            except ValueError:
+                continue
+            if started >= start and (end is None or started <= end):
+                launches.append({"scheme": scheme, "startedAt": started, "instance": record.get("instance"),
+                                 "config": record.get("config", {})})
+    launches.sort(key=lambda item: item["startedAt"])
+    return jsonify({"status": "ok", **history, "launches": launches})
+
+
+@app.route("/api/gpu-processes", methods=["GET"])
+def api_gpu_processes():
+    """GPU进程监控的完整进程表，之后的变化通过 gpu_processes 事件推送"""
+    return jsonify({"status": "ok", "running": gpu_process_monitor.running,
+                    "processes": gpu_process_monitor.snapshot()})
 
 
 @app.route("/api/nvitop", methods=["POST"])
@@ -1316,8 +4200,9 @@ def api_send_input():
     try:
         data = request.json
         command = data.get("command", "")
-        if command and vllm_controller.process:
-            vllm_controller.send_command(command)
+        controller = supervisor.get(data.get("instance"))
+        if command and controller and controller.process:
+            controller.send_command(command)
             return jsonify({"success": True})
         return jsonify({"success": False, "error": "No process running"}), 400
     except Exception as e:
@@ -1388,7 +4273,25 @@ def api_execute():
 
 @socketio.on("connect")
 def handle_connect():
-    socketio.emit("status", {"running": vllm_controller.is_running})
+    event_hub.connect(request.sid)
+    event_hub.emit("status", {"running": vllm_controller.is_running}, to=request.sid)
+    gpu_telemetry.start()
+
+
+@socketio.on("disconnect")
+def handle_disconnect(*args):
+    event_hub.disconnect(request.sid)
+
+
+@socketio.on("subscribe")
+def handle_subscribe(data):
+    """页面选择接收的房间（logs、metrics、gpu、status）和实例"""
+    data = data or {}
+    instance = data.get("instance")
+    if instance is not None and not INSTANCE_ID_RE.match(str(instance)):
+        return {"success": False, "error": "无效的实例id"}
+    event_hub.subscribe(request.sid, data.get("rooms"), instance)
+    return {"success": True}
 
 
 @socketio.on("run_command")
@@ -1396,37 +4299,116 @@ def handle_run_command(data):
     command = data.get("command", "")
     env_type = data.get("envType", "wsl")
     if command:
-        vllm_controller.run_command(command, env_type)
+        try:
+            error = supervisor.run(data.get("instance"), command, env_type)
+        except ValueError as e:
+            error = str(e)
+        if error:
+            logger.log("warning", error)
 
 
 @socketio.on("stop_command")
 def handle_stop_command(data):
-    vllm_controller.stop()
+    supervisor.stop((data or {}).get("instance"))
 
 
 @socketio.on("send_input")
 def handle_send_input(data):
     cmd = data.get("command", "")
-    if cmd and vllm_controller.process:
-        vllm_controller.send_command(cmd)
+    controller = supervisor.get(data.get("instance"))
+    if cmd and controller and controller.process:
+        controller.send_command(cmd)
+
+
+def _conditional_json(payload_factory, tag: str):
+    """带强 ETag 的 JSON 响应；客户端 If-None-Match 命中时直接返回 304，不再序列化"""
+    if request.if_none_match.contains(tag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(payload_factory())
+    response.set_etag(tag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 
 @app.route("/api/schemes", methods=["GET"])
 def api_get_schemes():
-    """Get all saved schemes from file"""
+    """Get saved schemes
+
+    查询参数（均可选，不带参数时返回全部完整方案）：
+    - fields: 逗号分隔的字段，如 id,name,modelPath；非顶层字段从 config 中取
+    - limit: 每页数量；cursor: 上一页返回的 nextCursor
+    """
     try:
-        with schemes_lock:
-            if os.path.exists(SCHEMES_FILE):
-                with open(SCHEMES_FILE, "r", encoding="utf-8") as f:
-                    schemes = json.load(f)
-                return jsonify({"success": True, "schemes": schemes})
-            else:
-                return jsonify({"success": True, "schemes": []})
+        fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()]
+        cursor = request.args.get("cursor") or None
+        limit = request.args.get("limit")
+        if limit is not None and (not limit.isdigit() or not (1 <= int(limit) <= SCHEME_PAGE_MAX)):
+            return jsonify({"success": False, "message": f"limit必须在1-{SCHEME_PAGE_MAX}之间"}), 400
+        limit = int(limit) if limit is not None else None
+        try:
+            schemes, next_cursor, version = scheme_repository.page(cursor, limit)
+        except KeyError:
+            return jsonify({"success": False, "message": "无效的分页游标"}), 400
+        
+        def payload():
+            body = {"success": True,
+                    "schemes": [_project_scheme(s, fields) for s in schemes] if fields else schemes}
+            if limit is not None:
+                body["nextCursor"] = next_cursor
+            return body
+        
+        key = f"{version}|{','.join(fields)}|{cursor}|{limit}"
+        return _conditional_json(payload, hashlib.sha1(key.encode("utf-8")).hexdigest())
     except Exception as e:
         logger.log("error", f"Failed to get schemes: {str(e)}")
         return jsonify({"success": False, "message": str(e)})
 
 
+@app.route("/api/schemes/search", methods=["GET"])
+def api_search_schemes():
+    """Search saved schemes
+
+    查询参数：q 为全文查询词；tp、pp、quant、dtype、env、kv 为分面过滤；
+    limit 为返回条数（默认全部）；fields 与 /api/schemes 相同。
+    """
+    try:
+        query = request.args.get("q", "")
+        facets = {name: request.args[name] for name in SCHEME_FACETS if request.args.get(name)}
+        fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()]
+        limit = request.args.get("limit")
+        if limit is not None and (not limit.isdigit() or not (1 <= int(limit) <= SCHEME_PAGE_MAX)):
+            return jsonify({"success": False, "message": f"limit必须在1-{SCHEME_PAGE_MAX}之间"}), 400
+        limit = int(limit) if limit is not None else None
+        hits, total = scheme_repository.search(query, facets, limit)
+        return jsonify({
+            "success": True,
+            "total": total,
+            "results": [{"score": round(score, 4), "scheme": _project_scheme(scheme, fields) if fields else scheme}
+                        for scheme, score in hits]
+        })
+    except Exception as e:
+        logger.log("error", f"Failed to search schemes: {str(e)}")
+        return jsonify({"success": False, "message": str(e)})
+
+
+@app.route("/api/schemes/<int:scheme_id>", methods=["GET"])
+def api_get_scheme(scheme_id):
+    """Get one scheme with its full config"""
+    try:
+        # 先取版本再取内容：中间若有写入，只会让下次请求多返回一次 200
+        version = scheme_repository.version()
+        scheme = scheme_repository.get(scheme_id)
+        if not scheme:
+            return jsonify({"success": False, "message": "方案不存在"}), 404
+        key = f"{version}|{scheme_id}"
+        return _conditional_json(lambda: {"success": True, "scheme": scheme},
+                                 hashlib.sha1(key.encode("utf-8")).hexdigest())
+    except Exception as e:
+        logger.log("error", f"Failed to get scheme: {str(e)}")
+        return jsonify({"success": False, "message": str(e)})
+
+
 @app.route("/api/schemes", methods=["POST"])
 def api_save_scheme():
     """Save a new scheme or update existing one"""
@@ -1440,35 +4422,7 @@ def api_save_scheme():
         if not name:
             return jsonify({"success": False, "message": "方案名称不能为空"}), 400
         
-        with schemes_lock:
-            schemes = []
-            if os.path.exists(SCHEMES_FILE):
-                with open(SCHEMES_FILE, "r", encoding="utf-8") as f:
-                    schemes = json.load(f)
-            
-            existing_index = -1
-            for i, s in enumerate(schemes):
-                if s.get("name") == name:
-                    existing_index = i
-                    break
-            
-            scheme_entry = {
-                "id": int(datetime.now().timestamp() * 1000) if existing_index == -1 else schemes[existing_index]["id"],
-                "name": name,
-                "config": config,
-                "envType": env_type,
-                "createdAt": datetime.now().isoformat()
-            }
-            
-            if existing_index >= 0:
-                schemes[existing_index] = scheme_entry
-            else:
-                schemes.append(scheme_entry)
-            
-            # Save to file
-            with open(SCHEMES_FILE, "w", encoding="utf-8") as f:
-                json.dump(schemes, f, ensure_ascii=False, indent=2)
-        
+        scheme_entry = scheme_repository.save(name, config, env_type)
         logger.log("success", f"方案已保存: {name}")
         return jsonify({"success": True, "scheme": scheme_entry})
     except Exception as e:
@@ -1480,21 +4434,9 @@ def api_save_scheme():
 def api_delete_scheme(scheme_id):
     """Delete a scheme by ID"""
     try:
-        with schemes_lock:
-            if not os.path.exists(SCHEMES_FILE):
-                return jsonify({"success": False, "message": "方案不存在"})
-            
-            with open(SCHEMES_FILE, "r", encoding="utf-8") as f:
-                schemes = json.load(f)
-            
-            scheme = next((s for s in schemes if s.get("id") == scheme_id), None)
-            if not scheme:
-                return jsonify({"success": False, "message": "方案不存在"})
-            
-            schemes = [s for s in schemes if s.get("id") != scheme_id]
-            
-            with open(SCHEMES_FILE, "w", encoding="utf-8") as f:
-                json.dump(schemes, f, ensure_ascii=False, indent=2)
+        scheme = scheme_repository.delete(scheme_id)
+        if not scheme:
+            return jsonify({"success": False, "message": "方案不存在"})
         
         logger.log("success", f"方案已删除: {scheme['name']}")
         return jsonify({"success": True})
@@ -1507,9 +4449,10 @@ def api_delete_scheme(scheme_id):
 def api_shutdown():
     """Shutdown the Flask server"""
     try:
-        # Stop vLLM server if running
-        vllm_controller.stop()
+        # Stop all vLLM instances
+        supervisor.stop_all()
         logger.log("success", "正在关闭服务器...")
+        logger.flush()
         
         # Shutdown the Flask server
         func = request.environ.get('werkzeug.server.shutdown')
@@ -1526,24 +4469,304 @@ def api_shutdown():
         return jsonify({"success": False, "message": str(e)})
 
 
+# ---------------------------------------------------------------------------
+# 离线日志分析: python vllm_server.py analyze logs.txt [logs.txt.*.gz ...]
+# ---------------------------------------------------------------------------
+
+ANALYZE_KV_PRESSURE = 90.0              # KV缓存使用率达到该值视为高压
+ANALYZE_ERROR_BURST = 5                 # 每分钟ERROR行数达到该值视为错误突发
+ANALYZE_MIN_CHUNK = 16 * 1024 * 1024    # 多进程模式下每个任务的最小字节范围
+ANALYZE_SAMPLE_GAP = 60                 # 相邻引擎样本间隔超过该秒数时视为两个时段
+
+
+def _open_log_binary(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _analyze_range(path: str, start: int = 0, end: int = -1) -> dict:
+    """单遍扫描日志中起始位置落在 [start, end) 的行（end < 0 表示到文件末尾）
+
+    返回按分钟聚合的 {分钟: [首行偏移, {级别: 行数}]} 以及引擎统计样本。
+    .gz 文件不能随机定位，只能整体处理，偏移为解压后的偏移。
+    """
+    minutes: Dict[bytes, list] = {}
+    engine: List[tuple] = []
+    with _open_log_binary(path) as f:
+        if start > 0:
+            # 跳过跨越起点的半行，它属于上一个范围
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        current_minute = None
+        counts: Dict[bytes, int] = {}
+        for line in f:
+            if 0 <= end <= pos:
+                break
+            line_start = pos
+            pos += len(line)
+            # "[YYYY-mm-dd HH:MM:SS] [LEVEL] message"，其它行（如多行堆栈）不计入
+            if line[20:23] != b"] [" or line[:1] != b"[":
+                continue
+            minute = line[1:17]
+            if minute != current_minute:
+                current_minute = minute
+                entry = minutes.get(minute)
+                if entry is None:
+                    entry = minutes[minute] = [line_start, {}]
+                counts = entry[1]
+            close = line.find(b"]", 23)
+            level = line[23:close]
+            counts[level] = counts.get(level, 0) + 1
+            if b"throughput:" in line:
+                sample = parse_engine_metrics(line.decode("utf-8", errors="replace"), 0.0)
+                if sample:
+                    engine.append((line[1:20].decode("ascii", errors="replace"), sample.prompt_throughput,
+                                   sample.generation_throughput, sample.running, sample.waiting,
+                                   sample.kv_cache_usage, sample.prefix_cache_hit_rate))
+    return {"path": path, "minutes": minutes, "engine": engine}
+
+
+def _plan_analyze_tasks(paths: List[str], workers: int) -> List[tuple]:
+    """按字节范围切分普通日志文件；.gz 文件整体作为一个任务"""
+    tasks = []
+    for path in paths:
+        if workers <= 1 or path.endswith(".gz"):
+            tasks.append((path, 0, -1))
+            continue
+        size = os.path.getsize(path)
+        chunk = max(ANALYZE_MIN_CHUNK, -(-size // workers))
+        for start in range(0, max(size, 1), chunk):
+            tasks.append((path, start, min(start + chunk, size)))
+    return tasks
+
+
+def _percentiles(values: List[float]) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    result = {f"p{p}": ordered[round(p / 100 * last)] for p in (50, 90, 99)}
+    result["max"] = ordered[-1]
+    result["mean"] = sum(ordered) / len(ordered)
+    return result
+
+
+def _parse_log_time(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+
+def _write_log_index(path: str, minutes: Dict[str, list]) -> str:
+    """写入 <日志>.idx.json：按分钟记录首行偏移和各级别行数"""
+    stat = os.stat(path)
+    index_path = path + ".idx.json"
+    index = {
+        "source": os.path.basename(path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "compressed": path.endswith(".gz"),
+        "minutes": [[minute, offset, counts] for minute, (offset, counts) in sorted(minutes.items())],
+    }
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def analyze_logs(paths: List[str], workers: int = 1, write_index: bool = True,
+                 kv_threshold: float = ANALYZE_KV_PRESSURE, error_burst: int = ANALYZE_ERROR_BURST) -> dict:
+    """分析历史日志，返回吞吐分位数、KV缓存高压时段、前缀缓存命中率趋势和错误突发"""
+    tasks = _plan_analyze_tasks(paths, workers)
+    if workers > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(_analyze_range, *zip(*tasks)))
+    else:
+        partials = [_analyze_range(*task) for task in tasks]
+
+    # 合并各范围的结果：同一分钟取最小偏移、行数相加
+    per_file: Dict[str, Dict[str, list]] = {path: {} for path in paths}
+    all_minutes: Dict[str, Dict[str, int]] = {}
+    engine: List[tuple] = []
+    for part in partials:
+        file_minutes = per_file[part["path"]]
+        for raw_minute, (offset, raw_counts) in part["minutes"].items():
+            minute = raw_minute.decode("ascii", errors="replace")
+            counts = {level.decode("ascii", errors="replace"): n for level, n in raw_counts.items()}
+            entry = file_minutes.get(minute)
+            if entry is None:
+                file_minutes[minute] = [offset, dict(counts)]
+            else:
+                entry[0] = min(entry[0], offset)
+                for level, n in counts.items():
+                    entry[1][level] = entry[1].get(level, 0) + n
+            merged = all_minutes.setdefault(minute, {})
+            for level, n in counts.items():
+                merged[level] = merged.get(level, 0) + n
+        engine.extend(part["engine"])
+    engine.sort(key=lambda s: s[0])
+
+    indexes = [_write_log_index(path, minutes) for path, minutes in per_file.items()] if write_index else []
+
+    levels: Dict[str, int] = {}
+    for counts in all_minutes.values():
+        for level, n in counts.items():
+            levels[level] = levels.get(level, 0) + n
+    ordered_minutes = sorted(all_minutes)
+
+    # 只统计有负载的样本，空闲时的0吞吐会拉低分位数
+    active = [s for s in engine if s[1] > 0 or s[2] > 0 or s[3] > 0]
+
+    kv_periods = []
+    period = None
+    previous = None
+    for sample in engine:
+        ts = _parse_log_time(sample[0])
+        gap = previous is not None and (ts - previous).total_seconds() > ANALYZE_SAMPLE_GAP
+        previous = ts
+        if sample[5] >= kv_threshold and not gap and period:
+            period["end"] = sample[0]
+            period["peak"] = max(period["peak"], sample[5])
+        elif sample[5] >= kv_threshold:
+            period = {"start": sample[0], "end": sample[0], "peak": sample[5]}
+            kv_periods.append(period)
+        else:
+            period = None
+    for period in kv_periods:
+        period["duration_s"] = (_parse_log_time(period["end"]) - _parse_log_time(period["start"])).total_seconds()
+
+    hourly: Dict[str, List[float]] = {}
+    for sample in engine:
+        if sample[6] >= 0:
+            hourly.setdefault(sample[0][:13] + ":00", []).append(sample[6])
+    prefix_trend = [{"hour": hour, "mean": sum(v) / len(v), "samples": len(v)} for hour, v in sorted(hourly.items())]
+
+    bursts = []
+    burst = None
+    for minute in ordered_minutes:
+        errors = all_minutes[minute].get("ERROR", 0)
+        if errors < error_burst:
+            burst = None
+            continue
+        if burst and (datetime.strptime(minute, "%Y-%m-%d %H:%M")
+                      - datetime.strptime(burst["end"], "%Y-%m-%d %H:%M")).total_seconds() <= 60:
+            burst["end"] = minute
+            burst["errors"] += errors
+        else:
+            burst = {"start": minute, "end": minute, "errors": errors}
+            bursts.append(burst)
+
+    return {
+        "files": paths,
+        "indexes": indexes,
+        "lines": sum(levels.values()),
+        "levels": levels,
+        "first": ordered_minutes[0] if ordered_minutes else None,
+        "last": ordered_minutes[-1] if ordered_minutes else None,
+        "engine_samples": len(engine),
+        "prompt_throughput": _percentiles([s[1] for s in active]),
+        "generation_throughput": _percentiles([s[2] for s in active]),
+        "waiting": _percentiles([float(s[4]) for s in active]),
+        "kv_cache_usage": _percentiles([s[5] for s in engine]),
+        "kv_pressure_periods": kv_periods,
+        "prefix_cache_trend": prefix_trend,
+        "error_bursts": bursts,
+    }
+
+
+def _print_analysis(report: dict) -> None:
+    def fmt(stats: dict) -> str:
+        if not stats:
+            return "无数据"
+        return "  ".join(f"{k}={v:.1f}" for k, v in stats.items())
+
+    print(f"日志文件: {', '.join(report['files'])}")
+    print(f"时间范围: {report['first']} ~ {report['last']}  共 {report['lines']} 行")
+    print("级别分布: " + ", ".join(f"{k}={v}" for k, v in sorted(report["levels"].items())))
+    print(f"引擎样本: {report['engine_samples']}")
+    print(f"Prompt 吞吐 (tokens/s):     {fmt(report['prompt_throughput'])}")
+    print(f"Generation 吞吐 (tokens/s): {fmt(report['generation_throughput'])}")
+    print(f"等待队列 (reqs):            {fmt(report['waiting'])}")
+    print(f"KV 缓存使用率 (%):          {fmt(report['kv_cache_usage'])}")
+    print(f"KV 缓存高压时段: {len(report['kv_pressure_periods'])}")
+    for p in report["kv_pressure_periods"]:
+        print(f"  {p['start']} ~ {p['end']}  {p['duration_s']:.0f}s  峰值 {p['peak']:.1f}%")
+    print("前缀缓存命中率趋势:")
+    for t in report["prefix_cache_trend"]:
+        print(f"  {t['hour']}  {t['mean']:.1f}%  ({t['samples']} 样本)")
+    print(f"错误突发: {len(report['error_bursts'])}")
+    for b in report["error_bursts"]:
+        print(f"  {b['start']} ~ {b['end']}  {b['errors']} 条ERROR")
+    for index_path in report["indexes"]:
+        print(f"索引已写入: {index_path}")
+
+
+def _shutdown():
+    supervisor.stop_all()
+    gpu_telemetry.stop()
+    logger.flush()
+
+
 def signal_handler(signum, frame):
-    vllm_controller.stop()
+    if ASYNC_MODE == "eventlet":
+        # 处理函数运行在 eventlet 主循环里，不能阻塞；清理交给 _eventlet_shutdown 协程
+        return
+    _shutdown()
     socketio.stop()
 
 
-if __name__ == "__main__":
-    import argparse
+def _eventlet_shutdown(wakeup_fd: int, main) -> None:
+    """等 set_wakeup_fd 管道里出现 SIGINT/SIGTERM，清理后让主协程退出 wsgi 服务。"""
+    while os.read(wakeup_fd, 1)[0] not in (signal.SIGINT, signal.SIGTERM):
+        pass
+    _shutdown()
+    eventlet.hubs.get_hub().schedule_call_global(0, main.throw, SystemExit)
+
 
-    parser = argparse.ArgumentParser(description="VLLM GUI Server")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VLLM GUI Server", parents=[ASYNC_MODE_PARSER])
     parser.add_argument("--port", type=int, default=5000, help="Server port (default: 5000)")
+    subparsers = parser.add_subparsers(dest="command")
+    analyze_parser = subparsers.add_parser("analyze", help="Analyze historical GUI logs (plain or .gz)")
+    analyze_parser.add_argument("logs", nargs="+", help="log files, e.g. logs.txt logs.txt.*.gz")
+    analyze_parser.add_argument("-j", "--workers", type=int, default=1,
+                                help="worker processes; large plain files are split by byte range (default: 1)")
+    analyze_parser.add_argument("--no-index", action="store_true", help="do not write <log>.idx.json")
+    analyze_parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    analyze_parser.add_argument("--kv-threshold", type=float, default=ANALYZE_KV_PRESSURE,
+                                help=f"KV cache usage %% treated as pressure (default: {ANALYZE_KV_PRESSURE})")
+    analyze_parser.add_argument("--error-burst", type=int, default=ANALYZE_ERROR_BURST,
+                                help=f"ERROR lines per minute treated as a burst (default: {ANALYZE_ERROR_BURST})")
     args = parser.parse_args()
 
-    if not os.path.exists(LOGS_FILE):
-        with open(LOGS_FILE, "w", encoding="utf-8") as f:
+    if args.command == "analyze":
+        report = analyze_logs(args.logs, workers=args.workers, write_index=not args.no_index,
+                              kv_threshold=args.kv_threshold, error_burst=args.error_burst)
+        if args.json:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            _print_analysis(report)
+        raise SystemExit(0)
+
+    if not os.path.exists(logger.active_path):
+        with open(logger.active_path, "w", encoding="utf-8") as f:
             f.write("")
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
-    logger.log("info", f"VLLM GUI 服务器启动，端口: {args.port}")
-    socketio.run(app, host="0.0.0.0", port=args.port, debug=False)
+    logger.log("info", f"VLLM GUI 服务器启动，端口: {args.port}，模式: {ASYNC_MODE}")
+    # 在后台预先探测conda路径，首次打开页面和生成命令时直接使用缓存
+    conda_discovery.start()
+    if IS_WINDOWS:
+        wsl_conda_discovery.start()
+    if ASYNC_MODE == "eventlet":
+        wakeup_fd, notify_fd = os.pipe()
+        os.set_blocking(notify_fd, False)
+        signal.set_wakeup_fd(notify_fd)
+        eventlet.spawn(_eventlet_shutdown, wakeup_fd, eventlet.greenthread.getcurrent())
+    # threading 模式用 Werkzeug 开发服务器；不在终端中运行（服务脚本、基准测试）时 Flask-SocketIO 默认拒绝启动
+    socketio.run(app, host="0.0.0.0", port=args.port, debug=False,
+                 allow_unsafe_werkzeug=ASYNC_MODE == "threading")